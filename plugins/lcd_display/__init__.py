@@ -108,8 +108,14 @@ class DummyLCD(object):
             self._lines = self._lines[:19] + text + self._lines[19 + len(text):]
         #log.debug('LCD', self._lines)
 
+    def lcd_update(self, lines):
+        self.lcd_clear()
+        for line, text in enumerate(lines):
+            self.lcd_puts(text, line + 1)
+
 
 dummy_lcd = DummyLCD()
+lcd = None  # display is initialized once and kept, see get_lcd()
 
 ################################################################################
 # Helper functions:                                                            #
@@ -121,11 +127,12 @@ def start():
 
 
 def stop():
-    global lcd_sender
+    global lcd_sender, lcd
     if lcd_sender is not None:
         lcd_sender.stop()
         lcd_sender.join()
         lcd_sender = None
+    lcd = None
 
 
 def get_report(index):
@@ -195,10 +202,10 @@ def find_lcd_address():
     search_range = {addr: 'PCF8574' for addr in range(32, 39)}
     search_range.update({addr: 'PCF8574A' for addr in range(56, 63)})
 
-    try:
-        import smbus
+    from . import pylcd2  # Library for LCD 16x2 PCF8574
 
-        bus = smbus.SMBus(0 if helpers.get_rpi_revision() == 1 else 1)
+    try:
+        bus = pylcd2.get_bus(0 if helpers.get_rpi_revision() == 1 else 1)
         # DF - alter RPi version test fallback to value that works on BBB
     except ImportError:
         log.warning(NAME, 'Could not import smbus.')
@@ -217,29 +224,35 @@ def find_lcd_address():
             log.warning(NAME, 'Could not find any PCF8574 controller.')
 
 
-def update_lcd(line1, line2=None):
-    """Print messages to LCD 16x2"""
-
+def get_lcd():
+    """Return LCD, it is initialized only once (and again if the address is changed or after error)."""
+    global lcd
     if lcd_options['address'] == 0:
         find_lcd_address()
 
-    if lcd_options['address'] != 0:
+    if lcd_options['address'] == 0:
+        return dummy_lcd
+    if lcd is None or lcd.lcd_device.addr != lcd_options['address']:
         from . import pylcd2  # Library for LCD 16x2 PCF8574
 
         lcd = pylcd2.lcd(lcd_options['address'], 0 if helpers.get_rpi_revision() == 1 else 1)
         # DF - alter RPi version test fallback to value that works on BBB
-    else:
-        lcd = dummy_lcd
+    return lcd
 
-    lcd.lcd_clear()
+
+def update_lcd(line1, line2=None):
+    """Print messages to LCD 16x2, only changed characters are written"""
+    global lcd
+    display = get_lcd()
     sleep_time = 1
     while True:
-        lcd.lcd_puts(line1[:16], 1)
-
-        if line2 is not None:
-            lcd.lcd_puts(line2[:16], 2)
+        try:
+            display.lcd_update([line1[:16], (line2 or '')[:16]])
+        except Exception:
+            lcd = None  # display is initialized again at next update (for example after reconnect)
+            raise
 
-        if max(len(line1), len(line2)) <= 16:
+        if max(len(line1), len(line2 or '')) <= 16:
             break
 
         if len(line1) > 16:
@@ -276,3 +289,12 @@ class settings_json(ProtectedPage):
         web.header('Content-Type', 'application/json')
         return json.dumps(lcd_options)
 
+
+class i2c_json(ProtectedPage):
+    """Returns latency and error counters of all I2C devices in JSON format."""
+
+    def GET(self):
+        web.header('Access-Control-Allow-Origin', '*')
+        web.header('Content-Type', 'application/json')
+        from . import pylcd2
+        return json.dumps(pylcd2.i2c_bus.statistics() if pylcd2.i2c_bus is not None else {})
@@ -1,12 +1,68 @@
-import smbus
+import threading
 from time import sleep
 
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
+try:
+    from plugins.shared import i2c_bus  # shared I2C bus manager
+except ImportError:  # plugins/shared is not installed, the plug-in uses its own bus
+    i2c_bus = None
+
+LINE_ADDRESS = (0x80, 0xC0, 0x94, 0xD4)  # set DDRAM address command of first character on lines 1-4
+ENABLE = {0: 0x10, 1: 0x04, 2: 0x01}      # EN bit of expander for reverse codes
+REFRESH_INTERVAL = 60                     # seconds, display is initialized and written whole again (after power loss)
+
+
+def changed_runs(old, new):
+    """Return list of [start, end) runs of characters in new which differ from old (None = unknown).
+    Runs separated by one same character are joined, setting of cursor costs as much as writing of one character."""
+    if old is None:
+        return [[0, len(new)]] if new else []
+    runs = []
+    for index, char in enumerate(new):
+        if index >= len(old) or old[index] != char:
+            if runs and index - runs[-1][1] <= 1:
+                runs[-1][1] = index + 1
+            else:
+                runs.append([index, index + 1])
+    return runs
+
+
+class OwnBus(object):
+    """SMBus of this plug-in without plugins/shared, transactions are locked only against this plug-in."""
+
+    def __init__(self, port):
+        import smbus
+        self._bus = smbus.SMBus(port)
+        self._lock = threading.RLock()
+
+    def transaction(self):
+        return self._lock
+
+    def __getattr__(self, name):
+        return getattr(self._bus, name)
+
+
+_own_buses = {}
+
+
+def get_bus(port):
+    """Return shared I2C bus or own bus if plugins/shared is not installed, raises ImportError without smbus."""
+    if i2c_bus is not None:
+        return i2c_bus.get_bus(port)
+    if port not in _own_buses:
+        _own_buses[port] = OwnBus(port)
+    return _own_buses[port]
+
 
 # General i2c device class so that other devices can be added easily
 class i2c_device:
     def __init__(self, addr, port):
         self.addr = addr
-        self.bus = smbus.SMBus(port)
+        self.bus = get_bus(port)
 
     def write(self, byte):
         self.bus.write_byte(self.addr, byte)
@@ -17,6 +73,9 @@ class i2c_device:
     def read_nbytes_data(self, data, n):  # For sequential reads > 1 byte
         return self.bus.read_i2c_block_data(self.addr, data, n)
 
+    def transaction(self):  # hold the bus for several reads/writes
+        return self.bus.transaction()
+
 
 class lcd:
     #initializes objects and lcd
@@ -25,31 +84,43 @@ class lcd:
     0: lower 4 bits of expander are commands bits
     1: top 4 bits of expander are commands bits AND P0-4 P1-5 P2-6
     2: top 4 bits of expander are commands bits AND P0-6 P1-5 P2-4
+
+    Output of expander is kept in memory (no read before strobe) and content of display is kept
+    in frame (lines of text), lcd_update() writes only changed characters. Once per refresh_interval the display
+    is initialized again and written whole, so a display which was power cycled or shows garbage recovers.
     """
 
-    def __init__(self, addr, port, reverse=0):
+    def __init__(self, addr, port, reverse=0, columns=16, refresh_interval=REFRESH_INTERVAL):
         self.reverse = reverse
+        self.columns = columns
+        self.refresh_interval = refresh_interval  # seconds, 0 = never
         self.lcd_device = i2c_device(addr, port)
+        self._output = 0
+        self._frame = [None] * len(LINE_ADDRESS)  # text on lines, None = unknown
+        with self.lcd_device.transaction():
+            self._init()
+
+    def _init(self):
         if self.reverse:
-            self.lcd_device.write(0x30)
+            self._write(0x30)
             self.lcd_strobe()
             sleep(0.0005)
             self.lcd_strobe()
             sleep(0.0005)
             self.lcd_strobe()
             sleep(0.0005)
-            self.lcd_device.write(0x20)
+            self._write(0x20)
             self.lcd_strobe()
             sleep(0.0005)
         else:
-            self.lcd_device.write(0x03)
+            self._write(0x03)
             self.lcd_strobe()
             sleep(0.0005)
             self.lcd_strobe()
             sleep(0.0005)
             self.lcd_strobe()
             sleep(0.0005)
-            self.lcd_device.write(0x02)
+            self._write(0x02)
             self.lcd_strobe()
             sleep(0.0005)
 
@@ -59,77 +130,97 @@ class lcd:
         self.lcd_write(0x06)
         self.lcd_write(0x0C)
         #self.lcd_write(0x0F) # disable blink cursor
+        self._write(0x0)
+        self._frame = [' ' * self.columns] * len(LINE_ADDRESS)  # display is cleared by init
+        self._refreshed = monotonic()
+
+    # write byte to expander and remember it
+    def _write(self, byte):
+        self._output = byte
+        self.lcd_device.write(byte)
 
     # clocks EN to latch command
     def lcd_strobe(self):
-        if self.reverse == 1:
-            self.lcd_device.write((self.lcd_device.read() | 0x04))
-            self.lcd_device.write((self.lcd_device.read() & 0xFB))
-        if self.reverse == 2:
-            self.lcd_device.write((self.lcd_device.read() | 0x01))
-            self.lcd_device.write((self.lcd_device.read() & 0xFE))
-        else:
-            self.lcd_device.write((self.lcd_device.read() | 0x10))
-            self.lcd_device.write((self.lcd_device.read() & 0xEF))
+        with self.lcd_device.transaction():  # EN high and low from cached output, no other write between them
+            self._lcd_strobe()
+
+    def _lcd_strobe(self):
+        enable = ENABLE[self.reverse]
+        self._write(self._output | enable)
+        self._write(self._output & ~enable & 0xFF)
 
     # write a command to lcd
     def lcd_write(self, cmd):
         if self.reverse:
-            self.lcd_device.write((cmd >> 4) << 4)
+            self._write((cmd >> 4) << 4)
             self.lcd_strobe()
-            self.lcd_device.write((cmd & 0x0F) << 4)
+            self._write((cmd & 0x0F) << 4)
             self.lcd_strobe()
-            self.lcd_device.write(0x0)
         else:
-            self.lcd_device.write((cmd >> 4))
+            self._write((cmd >> 4))
             self.lcd_strobe()
-            self.lcd_device.write((cmd & 0x0F))
+            self._write((cmd & 0x0F))
             self.lcd_strobe()
-            self.lcd_device.write(0x0)
 
     # write a character to lcd (or character rom)
     def lcd_write_char(self, charvalue):
         if self.reverse == 1:
-            self.lcd_device.write((0x01 | (charvalue >> 4) << 4))
+            self._write((0x01 | (charvalue >> 4) << 4))
             self.lcd_strobe()
-            self.lcd_device.write((0x01 | (charvalue & 0x0F) << 4))
+            self._write((0x01 | (charvalue & 0x0F) << 4))
             self.lcd_strobe()
-            self.lcd_device.write(0x0)
-        if self.reverse == 2:
-            self.lcd_device.write((0x04 | (charvalue >> 4) << 4))
+        elif self.reverse == 2:
+            self._write((0x04 | (charvalue >> 4) << 4))
             self.lcd_strobe()
-            self.lcd_device.write((0x04 | (charvalue & 0x0F) << 4))
+            self._write((0x04 | (charvalue & 0x0F) << 4))
             self.lcd_strobe()
-            self.lcd_device.write(0x0)
         else:
-            self.lcd_device.write((0x40 | (charvalue >> 4)))
+            self._write((0x40 | (charvalue >> 4)))
             self.lcd_strobe()
-            self.lcd_device.write((0x40 | (charvalue & 0x0F)))
+            self._write((0x40 | (charvalue & 0x0F)))
             self.lcd_strobe()
-            self.lcd_device.write(0x0)
 
     # put char function
     def lcd_putc(self, char):
         self.lcd_write_char(ord(char))
 
-    # put string function
+    # put string function (one locked bus transaction, other devices can not interleave)
     def lcd_puts(self, string, line):
-        if line == 1:
-            self.lcd_write(0x80)
-        if line == 2:
-            self.lcd_write(0xC0)
-        if line == 3:
-            self.lcd_write(0x94)
-        if line == 4:
-            self.lcd_write(0xD4)
-
-        for char in string:
-            self.lcd_putc(char)
+        with self.lcd_device.transaction():
+            self._frame[line - 1] = None  # written without frame
+            self.lcd_write(LINE_ADDRESS[line - 1])
+            for char in string:
+                self.lcd_putc(char)
+            self._write(0x0)
 
     # clear lcd and set to home
     def lcd_clear(self):
-        self.lcd_write(0x1)
-        self.lcd_write(0x2)
+        with self.lcd_device.transaction():
+            self._frame = [None] * len(LINE_ADDRESS)
+            self.lcd_write(0x1)
+            self.lcd_write(0x2)
+            self._write(0x0)
+            self._frame = [' ' * self.columns] * len(LINE_ADDRESS)
+
+    # show lines of text, only characters changed from the last update are written (cursor is set before every run)
+    def lcd_update(self, lines):
+        if self.refresh_interval and monotonic() - self._refreshed >= self.refresh_interval:
+            with self.lcd_device.transaction():
+                self._frame = [None] * len(LINE_ADDRESS)  # unknown if the init fails
+                self._init()
+        for row, text in enumerate(lines):
+            text = text[:self.columns].ljust(self.columns)
+            runs = changed_runs(self._frame[row], text)
+            if not runs:
+                continue
+            with self.lcd_device.transaction():  # one line at once, other devices can use the bus between lines
+                self._frame[row] = None  # unknown if the write fails
+                for start, end in runs:
+                    self.lcd_write(LINE_ADDRESS[row] + start)
+                    for char in text[start:end]:
+                        self.lcd_putc(char)
+                self._write(0x0)
+                self._frame[row] = text
 
     # add custom characters (0 - 7)
     def lcd_load_custon_chars(self, fontdata):
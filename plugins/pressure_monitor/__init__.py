@@ -8,6 +8,11 @@ import traceback
 
 from threading import Thread, Event
 
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
 import web
 from ospy.stations import stations
 from ospy.options import options
@@ -15,6 +20,11 @@ from ospy.log import log
 from plugins import PluginOptions, plugin_url
 from ospy.webpages import ProtectedPage
 from ospy.helpers import datetime_string
+from ospy.helpers import get_rpi_revision
+from plugins.shared.station_state import active_stations  # shared index of active stations
+from plugins.shared import gpio_input  # edge driven input with debounce
+from . import pressure_state  # state machine
+from plugins.shared import slope  # slope of analog pressure
 
 NAME = 'Pressure Monitor'
 LINK = 'settings_page'
@@ -25,6 +35,13 @@ pressure_options = PluginOptions(
         "time": 10,
         "use_press_monitor": False,
         "normally": False,
+        "debounce": 50,          # ms, pressure sensor must be stable for this time
+        "sensor": "switch",      # switch (GPIO) or analog (transducer on PCF8591 input of volt_temp_da)
+        "analog_input": 0,       # PCF8591 input 0-3, calibrated in kPa in volt_temp_da
+        "analog_rate": 20.0,     # samples per second when master is on
+        "pressure_min": 100.0,   # kPa, pipe is pressurized from this pressure
+        "burst_slope": 50.0,     # kPa/s, faster drop of pressure stops stations at once (0 = off)
+        "burst_window": 0.5,     # seconds of samples for slope
         "sendeml": True
     }
 )
@@ -33,126 +50,215 @@ pressure_options = PluginOptions(
 # GPIO input pullup:                                                           #
 ################################################################################
 
-import RPi.GPIO as GPIO  # RPi hardware
+try:
+    import RPi.GPIO as GPIO  # RPi hardware
+except ImportError:
+    GPIO = None  # pressure switch can not be monitored (analog sensor can), error is logged by PressureSender
 
 pin_pressure = 12
-
-try:
+MASTER_CHECK_INTERVAL = 1.0  # seconds, master station has no event
+ANALOG_RETRY = 10.0          # seconds, analog sensor is set up again after error
+EMAIL_RETRY = 60.0           # seconds, email is sent again after error
+
+STATE_TEXTS = {
+    pressure_state.DISABLED: 'Pressure monitor plug-in is disabled.',
+    pressure_state.NO_MASTER: 'Not used master station.',
+    pressure_state.MASTER_OFF: 'Master station is OFF.',
+    pressure_state.PRESSURIZED: 'Master station is ON. Pressure sensor is activated.',
+}
+
+if GPIO is not None:
     GPIO.setup(pin_pressure, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-except NameError:
-    pass
 
 
 ################################################################################
 # Main function loop:                                                          #
 ################################################################################
 
+class AnalogSensor(object):
+    """Pressure transducer on PCF8591 input read by volt_temp_da plug-in, value in units of input calibration."""
+
+    def __init__(self):
+        from plugins import volt_temp_da                  # raises ImportError if the plug-in is not installed
+        from plugins.volt_temp_da import sampler
+        from plugins.shared import i2c_bus
+        self._sampler = sampler
+        self.bus = i2c_bus.get_bus(1 if get_rpi_revision() >= 2 else 0)
+        self.channel = pressure_options['analog_input']
+        self.table = volt_temp_da.compile_input(self.channel)  # own copy, tables of volt_temp_da are not changed
+        self.interval = 1.0 / max(1.0, pressure_options['analog_rate'])
+        self.window = slope.SlopeWindow(round(pressure_options['burst_window'] / self.interval))
+        self.value = None
+
+    def read(self, now):
+        """Read pressure and add it to slope window."""
+        raw = self._sampler.read_channels(self.bus)[self.channel]
+        self.value = self.table[raw]
+        self.window.add(now, self.value)
+        return self.value
+
+    def burst(self):
+        """Return True if pressure falls faster than burst slope."""
+        return pressure_options['burst_slope'] > 0 and self.window.full() and \
+            self.window.slope() <= -pressure_options['burst_slope']
+
+
 class PressureSender(Thread):
     def __init__(self):
         Thread.__init__(self)
         self.daemon = True
         self._stop_event = Event()
+        self._wake_event = Event()  # set by edge of pressure sensor, settings and stop
 
-        self._sleep_time = 0
+        self.input = None
+        self.analog = None
+        self._reconfigure = True
+        self._analog_retry = None   # monotonic time of next setup of analog sensor after error
+        self.machine = pressure_state.PressureMachine()
         self.start()
 
     def stop(self):
         self._stop_event.set()
+        self._wake_event.set()
 
     def update(self):
-        self._sleep_time = 0
+        self._reconfigure = True
+        self._wake_event.set()
+
+    def _setup_analog(self, now):
+        """Create analog sensor if it is selected in settings, after error it is tried again in ANALOG_RETRY."""
+        self._reconfigure = False
+        self._analog_retry = None
+        self.analog = None
+        if pressure_options['sensor'] != 'analog':
+            return
+        try:
+            self.analog = AnalogSensor()
+        except ImportError:
+            log.error(NAME, 'Analog pressure sensor needs Voltage and Temperature Monitor plug-in and smbus.')
+        except Exception:
+            log.error(NAME, 'Pressure monitor plug-in: analog pressure sensor is not available:\n' +
+                      traceback.format_exc())
+        if self.analog is None:
+            self._analog_retry = now + ANALOG_RETRY
+
+    def _read_pressure(self, now):
+        """Return (pressure, burst) from analog sensor or pressure switch.
+        Analog sensor which is not available has no pressure (stations are stopped after max time)."""
+        if pressure_options['sensor'] != 'analog':
+            return not get_check_pressure(self.input.level), False
+        if self.analog is None:
+            return False, False
+        try:
+            value = self.analog.read(now)
+        except Exception:
+            log.error(NAME, 'Pressure monitor plug-in: analog pressure sensor is not available:\n' +
+                      traceback.format_exc())
+            self.analog = None
+            self._analog_retry = now + ANALOG_RETRY
+            return False, False
+        burst = self.analog.burst()
+        if burst:
+            active_stations.invalidate()  # drop can be caused by switching off master, check it now
+        return value >= pressure_options['pressure_min'], burst
 
     def _sleep(self, secs):
-        self._sleep_time = secs
-        while self._sleep_time > 0 and not self._stop_event.is_set():
-            time.sleep(1)
-            self._sleep_time -= 1
+        """Sleep until edge on input, update, stop or timeout (None = no timeout)."""
+        self._wake_event.wait(secs)
+
+    def _transition(self, transition):
+        """Log transition and stop stations on trip."""
+        state = transition['to']
+        log.clear(NAME)
+        if state == pressure_state.TRIPPED:
+            log.finish_run(None)                               # save log
+            stations.clear()                                   # set all station to off
+            active_stations.invalidate()
+            if transition.get('reason') == 'burst':
+                log.info(NAME, 'Pressure drops faster than %s kPa/s -> stops all stations and send email.' %
+                         pressure_options['burst_slope'])
+            else:
+                log.info(NAME, 'Pressure sensor is not activated in time -> stops all stations and send email.')
+            if pressure_options['sendeml']:                    # if enabled send email
+                self._send = True
+        elif state == pressure_state.WAITING:
+            log.info(NAME, 'Master station is ON. Time to test pressure sensor: %d sec' % int(pressure_options['time']))
+        elif state == pressure_state.DISABLED and pressure_options['use_press_monitor']:
+            log.error(NAME, 'Pressure monitor plug-in: pressure switch on GPIO is not available, pressure is not '
+                            'monitored (analog sensor can be used)!')
+        else:
+            log.info(NAME, STATE_TEXTS[state])
 
     def run(self):
-        send = False
+        self._send = False
+        next_email = 0  # monotonic time of next attempt to send email
 
-        once_text = True
-        two_text = True
-        three_text = True
-        four_text = True
-        five_text = True
-
-        last_time = int(time.time())
-        actual_time = int(time.time())
+        if GPIO is not None:  # without GPIO only analog sensor can be used, error is logged by _transition
+            try:
+                self.input = gpio_input.DebouncedInput(GPIO, pin_pressure, pressure_options['debounce'] / 1000.0,
+                                                       self._wake_event.set)
+            except Exception:
+                log.error(NAME, 'Pressure monitor plug-in:\n' + traceback.format_exc())
 
         while not self._stop_event.is_set():
+            self._wake_event.clear()  # events from now wake up the next sleep
             try:
-                if pressure_options['use_press_monitor']:                           # if pressure plugin is enabled
-                    four_text = True
-                    if get_master_is_on():                                           # if master station is on
-                        three_text = True
-                        if once_text:                               # text on the web if master is on
-                            log.clear(NAME)
-                            log.info(NAME, 'Master station is ON.')
-                            once_text = False
-                        if get_check_pressure():                                     # if pressure sensor is on
-                            actual_time = int(time.time())
-                            count_val = int(pressure_options['time'])
-                            log.clear(NAME)
-                            log.info(NAME, 'Time to test pressure sensor: ' + str(
-                                count_val - (actual_time - last_time)) + ' sec')
-                            if actual_time - last_time > int(
-                                    pressure_options['time']): # wait for activated pressure sensor (time delay)
-                                last_time = actual_time
-                                if get_check_pressure():                              # if pressure sensor is actual on
-                                #  options.scheduler_enabled = False                  # set scheduler to off
-                                    log.finish_run(None)                               # save log
-                                    stations.clear()                                   # set all station to off
-                                    log.clear(NAME)
-                                    log.info(NAME,
-                                             'Pressure sensor is not activated in time -> stops all stations and send email.')
-                                    if pressure_options['sendeml']:                    # if enabled send email
-                                        send = True
-
-                        if not get_check_pressure():
-                            last_time = int(time.time())
-                            if five_text:
-                                once_text = True
-                                five_text = False
-
-                    if not get_master_is_on():                                    # text on the web if master is off
-                        if stations.master is not None:
-                            if two_text:
-                                log.clear(NAME)
-                                log.info(NAME, 'Master station is OFF.')
-                                two_text = False
-                                five_text = True
-                            last_time = int(time.time())
-
-                else:
-                    once_text = True
-                    two_text = True
-                    if four_text:                                                # text on the web if plugin is disabled
-                        log.clear(NAME)
-                        log.info(NAME, 'Pressure monitor plug-in is disabled.')
-                        four_text = False
-
-                if stations.master is None:                                      # text on the web if master station is none
-                    if three_text:
-                        log.clear(NAME)
-                        log.info(NAME, 'Not used master station.')
-                        three_text = False
-
-                if send:
+                now = monotonic()
+                if self.input is not None:
+                    self.input.debounce = pressure_options['debounce'] / 1000.0
+                    self.input.update(now)
+
+                if self._reconfigure or (self._analog_retry is not None and now >= self._analog_retry):
+                    self._setup_analog(now)
+
+                enabled = pressure_options['use_press_monitor'] and \
+                    (self.input is not None or pressure_options['sensor'] == 'analog')  # switch needs GPIO
+                has_master = stations.master is not None
+                pressure, burst = self._read_pressure(now) if enabled else (False, False)
+                transition = self.machine.step(enabled, has_master, enabled and has_master and get_master_is_on(),
+                                               pressure, now, time.time(), int(pressure_options['time']), burst)
+                if transition is not None:
+                    self._transition(transition)
+                    if self.analog is not None:
+                        self.analog.window.clear()  # slope only from samples of one state
+
+                if self._send and now >= next_email:
                     TEXT = (datetime_string() + ': System detected error: pressure sensor.')
                     try:
                         from plugins.email_notifications import email
                         email(TEXT)                                     # send email without attachments
                         log.info(NAME, 'Email was sent: ' + TEXT)
-                        send = False
+                        self._send = False
                     except Exception as err:
                         log.error(NAME, 'Email was not sent! ' + str(err))
+                        next_email = now + EMAIL_RETRY                  # do not repeat email every loop
 
-                self._sleep(1)
+                if self.machine.state == pressure_state.DISABLED:
+                    timeout = None                                      # sleep until settings are changed
+                else:
+                    timeout = MASTER_CHECK_INTERVAL                     # master station has no event
+                    if self.machine.deadline is not None:
+                        timeout = min(timeout, self.machine.timeout(now))
+                    if self.analog is not None and self.machine.state in (pressure_state.WAITING,
+                                                                          pressure_state.PRESSURIZED):
+                        timeout = min(timeout, self.analog.interval)  # high rate sampling when master is on
+                    if self._analog_retry is not None:
+                        timeout = max(0, min(timeout, self._analog_retry - now))
+                if self._send:
+                    timeout = max(0, next_email - now) if timeout is None else \
+                        max(0, min(timeout, next_email - now))
+                debounce_deadline = self.input.deadline() if self.input is not None else None
+                if debounce_deadline is not None:
+                    timeout = max(0, debounce_deadline - now) if timeout is None else \
+                        max(0, min(timeout, debounce_deadline - now))
+                self._sleep(timeout)
 
             except Exception:
                 log.error(NAME, 'Pressure monitor plug-in:\n' + traceback.format_exc())
-                self._sleep(60)
+                self._stop_event.wait(60)
+
+        if self.input is not None:
+            self.input.close()
 
 
 pressure_sender = None
@@ -174,15 +280,18 @@ def stop():
         pressure_sender = None
 
 
-def get_check_pressure():
+def get_check_pressure(level=None):
+    """Return 1 if pressure sensor is not activated (no pressure), level is read from GPIO if not given."""
     try:
+        if level is None:
+            level = GPIO.input(pin_pressure)
         if pressure_options['normally']:
-            if GPIO.input(pin_pressure):  # pressure detected
+            if level:  # pressure detected
                 press = 1
             else:
                 press = 0
-        elif pressure_options['normally'] != 'on':
-            if not GPIO.input(pin_pressure):
+        else:
+            if not level:
                 press = 1
             else:
                 press = 0
@@ -193,12 +302,8 @@ def get_check_pressure():
 
 def get_master_is_on():
     if stations.master is not None and not options.manual_mode:              # if is use master station and not manual control
-        for station in stations.get():
-            if station.is_master:                                              # if station is master
-                if station.active:                                              # if master is active
-                    return True
-                else:
-                    return False
+        return active_stations.master_on()                                  # if master is active
+    return False
 
 ################################################################################
 # Web pages:                                                                   #
@@ -227,3 +332,19 @@ class settings_json(ProtectedPage):
         web.header('Content-Type', 'application/json')
         return json.dumps(pressure_options)
 
+
+class state_json(ProtectedPage):
+    """Returns state of pressure monitor with history of transitions in JSON format."""
+
+    def GET(self):
+        web.header('Access-Control-Allow-Origin', '*')
+        web.header('Content-Type', 'application/json')
+        result = {'state': None}
+        if pressure_sender is not None:
+            result = pressure_sender.machine.as_dict(monotonic())
+            if pressure_sender.analog is not None:
+                result['pressure'] = pressure_sender.analog.value
+                result['slope'] = round(pressure_sender.analog.window.slope(), 2)
+            elif pressure_sender.input is not None:
+                result['pressure'] = not get_check_pressure(pressure_sender.input.level)
+        return json.dumps(result)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# State machine of pressure monitor. Inputs are read once per tick by the caller, step() changes the state
+# and returns the transition, so the plug-in logs (and acts) only on transitions. Transitions are timestamped.
+
+from collections import deque
+
+DISABLED = 'disabled'
+NO_MASTER = 'no-master'
+MASTER_OFF = 'master-off'
+WAITING = 'waiting-for-pressure'
+PRESSURIZED = 'pressurized'
+TRIPPED = 'tripped'
+
+STATES = (DISABLED, NO_MASTER, MASTER_OFF, WAITING, PRESSURIZED, TRIPPED)
+HISTORY = 100  # transitions kept for JSON
+
+
+class PressureMachine(object):
+    """States of pressure monitor, monotonic time is used for deadline, wall time for history."""
+
+    def __init__(self):
+        self.state = None
+        self.since = None       # wall time of last transition
+        self.deadline = None    # monotonic time of trip in waiting state (or of next trip in tripped state)
+        self.trips = 0
+        self.history = deque(maxlen=HISTORY)
+
+    def _target(self, enabled, has_master, master_on, pressure, monotonic_now, burst):
+        if not enabled:
+            return DISABLED
+        if not has_master:
+            return NO_MASTER
+        if not master_on:
+            return MASTER_OFF
+        if burst and self.state in (PRESSURIZED, WAITING):
+            return TRIPPED  # sudden drop of pressure, no time delay
+        if pressure:
+            return PRESSURIZED
+        if self.state in (WAITING, TRIPPED) and monotonic_now >= self.deadline:
+            return TRIPPED  # pressure sensor is not activated in time (again, if master is still on after trip)
+        if self.state == TRIPPED:
+            return TRIPPED
+        return WAITING
+
+    def step(self, enabled, has_master, master_on, pressure, monotonic_now, timestamp, time_limit, burst=False):
+        """Update state from inputs of one tick. Returns transition dictionary or None if nothing was changed."""
+        target = self._target(enabled, has_master, master_on, pressure, monotonic_now, burst)
+        trip_again = self.state == TRIPPED and target == TRIPPED and monotonic_now >= self.deadline
+        if target == self.state and not trip_again:
+            return None
+        if target == WAITING:
+            self.deadline = monotonic_now + time_limit
+        elif target == TRIPPED:
+            self.deadline = monotonic_now + time_limit
+            self.trips += 1
+        else:
+            self.deadline = None
+        transition = {'time': timestamp, 'from': self.state, 'to': target}
+        if target == TRIPPED:
+            transition['reason'] = 'burst' if burst and self.state != TRIPPED else 'timeout'
+        self.state = target
+        self.since = timestamp
+        self.history.append(transition)
+        return transition
+
+    def timeout(self, monotonic_now):
+        """Return seconds to deadline or None."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - monotonic_now)
+
+    def as_dict(self, monotonic_now):
+        return {'state': self.state,
+                'since': self.since,
+                'deadline': self.timeout(monotonic_now),
+                'trips': self.trips,
+                'history': list(self.history)}
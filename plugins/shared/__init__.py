@@ -0,0 +1,4 @@
+#!/usr/bin/env python
+# Library modules shared by plug-ins (this package is not a plug-in, it has no NAME).
+# Modules do not access hardware and do not import other plug-ins when they are imported,
+# so a plug-in can use them without running code of another plug-in.
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# Edge driven GPIO input with software debounce. The GPIO library calls back on every edge, the level is confirmed
+# when it is stable for debounce time, so the waiting thread sleeps until an edge or a deadline (no polling).
+
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
+POLL_INTERVAL = 0.1  # seconds, used only if edge detection is not available
+
+
+class DebouncedInput(object):
+    """Stable level of input pin. on_edge() is called from GPIO thread on every edge (to wake up waiting thread)."""
+
+    def __init__(self, gpio, pin, debounce, on_edge=None):
+        self.gpio = gpio
+        self.pin = pin
+        self.debounce = debounce      # seconds
+        self.on_edge = on_edge
+        self.level = gpio.input(pin)  # stable level
+        self.changed = monotonic()    # time of last change of stable level
+        self.edges = 0                # all edges including glitches
+        self._last_edge = None
+        self.polling = False
+        try:
+            gpio.add_event_detect(pin, gpio.BOTH, callback=self._edge)
+        except (RuntimeError, AttributeError):
+            self.polling = True  # edge detection is not supported, level is read every POLL_INTERVAL
+
+    def close(self):
+        if not self.polling:
+            self.gpio.remove_event_detect(self.pin)
+
+    def _edge(self, channel):
+        self.edges += 1
+        self._last_edge = monotonic()
+        if self.on_edge is not None:
+            self.on_edge()
+
+    def deadline(self):
+        """Return monotonic time when update() has to be called to confirm level, or None."""
+        if self.polling:
+            return monotonic() + POLL_INTERVAL
+        if self._last_edge is not None:
+            return self._last_edge + self.debounce
+        return None
+
+    def update(self, now=None):
+        """Confirm level after debounce time, returns True if stable level was changed."""
+        now = monotonic() if now is None else now
+        if not self.polling:
+            last_edge = self._last_edge
+            if last_edge is None or now < last_edge + self.debounce:
+                return False
+            if self._last_edge == last_edge:
+                self._last_edge = None  # otherwise new edge came meanwhile and will be confirmed later
+        level = self.gpio.input(self.pin)
+        if level == self.level:
+            return False  # glitch shorter than debounce time
+        self.level = level
+        self.changed = now
+        return True
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# Process wide I2C bus manager. All plug-ins on the same bus (water_meter, wind_monitor, volt_temp_da, lcd_display)
+# get the same handle, every transaction is serialized by the per bus lock and timing/errors are counted per device.
+
+import threading
+
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
+
+class DeviceStats(object):
+    """Transaction counters of one I2C address."""
+
+    def __init__(self):
+        self.transactions = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_error = ''
+
+    def as_dict(self):
+        return {
+            'transactions': self.transactions,
+            'errors': self.errors,
+            'avg_ms': round(self.total_time / self.transactions * 1000.0, 3) if self.transactions else 0.0,
+            'max_ms': round(self.max_time * 1000.0, 3),
+            'last_error': self.last_error,
+        }
+
+
+class ManagedBus(object):
+    """smbus.SMBus compatible handle, every call is one locked transaction."""
+
+    def __init__(self, number, backend):
+        self.number = number
+        self.lock = threading.RLock()
+        self._backend = backend
+        self._stats = {}
+
+    def _call(self, method, addr, *args):
+        with self.lock:
+            stats = self._stats.get(addr)
+            if stats is None:
+                stats = self._stats[addr] = DeviceStats()
+            start = monotonic()
+            try:
+                return getattr(self._backend, method)(addr, *args)
+            except Exception as err:
+                stats.errors += 1
+                stats.last_error = str(err)
+                raise
+            finally:
+                duration = monotonic() - start
+                stats.transactions += 1
+                stats.total_time += duration
+                stats.max_time = max(stats.max_time, duration)
+
+    def write_quick(self, addr):
+        return self._call('write_quick', addr)
+
+    def read_byte(self, addr):
+        return self._call('read_byte', addr)
+
+    def write_byte(self, addr, value):
+        return self._call('write_byte', addr, value)
+
+    def read_byte_data(self, addr, register):
+        return self._call('read_byte_data', addr, register)
+
+    def write_byte_data(self, addr, register, value):
+        return self._call('write_byte_data', addr, register, value)
+
+    def read_i2c_block_data(self, addr, register, length=32):
+        return self._call('read_i2c_block_data', addr, register, length)
+
+    def write_i2c_block_data(self, addr, register, data):
+        return self._call('write_i2c_block_data', addr, register, data)
+
+    def transaction(self):
+        """Hold the bus for several calls: with bus.transaction(): ..."""
+        return self.lock
+
+    def batch(self, operations):
+        """Run [(method, addr, args...), ...] as one locked transaction and return list of results."""
+        with self.lock:
+            return [self._call(operation[0], *operation[1:]) for operation in operations]
+
+    def statistics(self):
+        """Return {'0x48': {...}, ...} with counters of every used device."""
+        with self.lock:
+            return dict(('0x%02x' % addr, stats.as_dict()) for addr, stats in self._stats.items())
+
+    def reset_statistics(self):
+        with self.lock:
+            self._stats = {}
+
+
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+def get_bus(number, backend=None):
+    """Return shared handle of I2C bus number. Raises ImportError if smbus is not available."""
+    with _buses_lock:
+        bus = _buses.get(number)
+        if bus is None:
+            if backend is None:
+                import smbus
+                backend = smbus.SMBus(number)
+            bus = _buses[number] = ManagedBus(number, backend)
+        return bus
+
+
+def set_backend(number, backend):
+    """Use backend (for example fake bus for tests) for I2C bus number."""
+    with _buses_lock:
+        _buses[number] = ManagedBus(number, backend)
+        return _buses[number]
+
+
+def statistics():
+    """Return statistics of all opened buses."""
+    with _buses_lock:
+        buses = list(_buses.values())
+    return dict(('i2c-%d' % bus.number, bus.statistics()) for bus in buses)
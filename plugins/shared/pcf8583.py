@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# Driver for I2C event counter PCF8583 (address 0x50 or 0x51) shared by water_meter and wind_monitor plug-ins.
+# The counter runs free (it is reset only in setup) and rates are computed from difference of two samples.
+# Any object with smbus interface can be used as bus (tests use fake bus without I2C).
+
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
+
+COUNTER_MODULO = 1000000  # 6 BCD digits, after 999999 follows 0
+
+REG_CONTROL = 0x00        # control/status register
+REG_COUNT = 0x01          # LSB, midle Byte and MSB of event counter
+MODE_EVENT_COUNTER = 0x20
+
+# translate one BCD byte (two digits) to number 0-99 with one index instead of masks and shifts per digit
+BCD_TABLE = tuple(((byte >> 4) & 0x0F) * 10 + (byte & 0x0F) for byte in range(256))
+
+
+def bcd_decode(lsb, mid, msb):
+    """Return number 0-999999 from three BCD bytes of counter."""
+    return BCD_TABLE[lsb] + BCD_TABLE[mid] * 100 + BCD_TABLE[msb] * 10000
+
+
+def bcd_encode(value):
+    """Return three BCD bytes (LSB first) for number 0-999999."""
+    result = []
+    for i in range(3):
+        digits = value % 100
+        result.append(((digits // 10) << 4) | (digits % 10))
+        value //= 100
+    return result
+
+
+class PCF8583(object):
+    """PCF8583 in event counter mode."""
+
+    def __init__(self, bus, address=0x50, clock=monotonic):
+        self.bus = bus
+        self.address = address
+        self._clock = clock
+        self._last_count = None
+        self._last_time = None
+
+    def setup(self):
+        """Set event counter mode and reset counter to 0."""
+        self.bus.write_byte_data(self.address, REG_CONTROL, MODE_EVENT_COUNTER)
+        self.bus.write_i2c_block_data(self.address, REG_COUNT, [0x00, 0x00, 0x00])
+        self.restart()
+
+    def restart(self):
+        """Forget last sample, next sample() starts new measuring."""
+        self._last_count = None
+        self._last_time = None
+
+    def read(self):
+        """Return actual number of pulses in counter (one block read)."""
+        data = self.bus.read_i2c_block_data(self.address, REG_CONTROL, 4)
+        return bcd_decode(data[1], data[2], data[3])
+
+    def sample(self):
+        """Return (pulses, seconds) from previous sample to now. First sample returns (0, 0.0)."""
+        count = self.read()
+        now = self._clock()
+        if self._last_count is None:
+            pulses, elapsed = 0, 0.0
+        else:
+            pulses = (count - self._last_count) % COUNTER_MODULO
+            elapsed = now - self._last_time
+        self._last_count = count
+        self._last_time = now
+        return pulses, elapsed
+
+    def rate(self):
+        """Return pulses per second from previous sample to now."""
+        pulses, elapsed = self.sample()
+        return pulses / elapsed if elapsed > 0 else 0.0
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# Hooks of plug-ins called before the system is shut down by UPS plug-in (flush of files, stop of stations).
+# Registry is independent of the UPS plug-in, plug-ins register hooks also if it is not installed.
+# Hooks are run by priority groups (lower priority first), hooks of one group run in parallel threads.
+# Every hook has its own timeout and all hooks together have global deadline, hook which does not finish
+# in time is left running (thread is daemon) and shutdown continues. Time of every hook is reported.
+#
+# Use in plug-in:
+#     from plugins.shared import shutdown_hooks
+#     shutdown_hooks.register(NAME, flush_function, priority=50, timeout=5)  # in start()
+#     shutdown_hooks.unregister(NAME)                                        # in stop()
+
+import threading
+import traceback
+
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
+OK = 'ok'
+ERROR = 'error'
+TIMEOUT = 'timeout'
+SKIPPED = 'skipped'  # global deadline was reached before the hook was started
+
+_hooks = {}
+_lock = threading.Lock()
+
+
+class Hook(object):
+    """Callback of one plug-in with priority (lower runs earlier) and timeout in seconds."""
+
+    def __init__(self, name, callback, priority, timeout):
+        self.name = name
+        self.callback = callback
+        self.priority = priority
+        self.timeout = timeout
+        self.error = None
+        self._done = threading.Event()
+        self._started = None
+        self._finished = None
+
+    def _run(self):
+        try:
+            self.callback()
+        except Exception:
+            self.error = traceback.format_exc()
+        self._finished = monotonic()
+        self._done.set()
+
+    def start(self):
+        self.error = None
+        self._done.clear()
+        self._started = monotonic()
+        self._finished = None
+        thread = threading.Thread(target=self._run, name='shutdown hook ' + self.name)
+        thread.daemon = True
+        thread.start()
+
+    def wait(self, deadline):
+        """Wait for the hook until its timeout or global deadline (monotonic time)."""
+        end = min(self._started + self.timeout, deadline)
+        self._done.wait(max(0.0, end - monotonic()))
+
+    def report(self, now):
+        if self._started is None:
+            result, seconds = SKIPPED, 0.0
+        elif self._done.is_set():
+            result, seconds = ERROR if self.error else OK, self._finished - self._started
+        else:
+            result, seconds = TIMEOUT, now - self._started
+        return {'name': self.name, 'priority': self.priority, 'timeout': self.timeout,
+                'result': result, 'seconds': round(seconds, 3), 'error': self.error}
+
+
+def register(name, callback, priority=50, timeout=5.0):
+    """Register callback (without arguments) called before shutdown, name replaces hook of the same name."""
+    with _lock:
+        _hooks[name] = Hook(name, callback, priority, float(timeout))
+
+
+def unregister(name):
+    with _lock:
+        _hooks.pop(name, None)
+
+
+def names():
+    """Return names of registered hooks in order of priority."""
+    with _lock:
+        return [hook.name for hook in sorted(_hooks.values(), key=lambda hook: (hook.priority, hook.name))]
+
+
+def run(total_timeout):
+    """Run all hooks within total_timeout seconds. Returns list of reports (name, priority, result, seconds)."""
+    deadline = monotonic() + total_timeout
+    with _lock:
+        hooks = [Hook(hook.name, hook.callback, hook.priority, hook.timeout) for hook in _hooks.values()]
+    groups = {}
+    for hook in hooks:
+        groups.setdefault(hook.priority, []).append(hook)
+
+    for priority in sorted(groups):
+        if monotonic() >= deadline:
+            break
+        group = sorted(groups[priority], key=lambda hook: hook.name)
+        for hook in group:
+            hook.start()
+        for hook in group:
+            hook.wait(deadline)
+
+    now = monotonic()
+    return [hook.report(now) for hook in sorted(hooks, key=lambda hook: (hook.priority, hook.name))]
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# Ring buffer of last samples with slope of least squares line updated in O(1) per sample
+# (running sums of t, y, t*t and t*y). Times are relative to the oldest sample of a round,
+# sums are computed again once per round to remove accumulated rounding errors.
+
+
+class SlopeWindow(object):
+    """Last size samples (time in seconds, value) and their slope (value per second)."""
+
+    def __init__(self, size):
+        self.size = max(2, int(size))
+        self._times = [0.0] * self.size
+        self._values = [0.0] * self.size
+        self._index = 0
+        self.count = 0
+        self._base = None
+        self._clear_sums()
+
+    def _clear_sums(self):
+        self._sum_t = self._sum_y = self._sum_tt = self._sum_ty = 0.0
+
+    def _add_sums(self, t, y, sign):
+        self._sum_t += sign * t
+        self._sum_y += sign * y
+        self._sum_tt += sign * t * t
+        self._sum_ty += sign * t * y
+
+    def add(self, time, value):
+        if self._base is None:
+            self._base = time
+        t = time - self._base
+        if self.count == self.size:
+            self._add_sums(self._times[self._index], self._values[self._index], -1)
+        else:
+            self.count += 1
+        self._times[self._index] = t
+        self._values[self._index] = value
+        self._add_sums(t, value, 1)
+        self._index = (self._index + 1) % self.size
+        if self._index == 0:
+            self._rebase()
+
+    def _rebase(self):
+        """Move time base to oldest sample and compute sums again."""
+        shift = self._times[self._index] if self.count == self.size else self._times[0]
+        self._base += shift
+        self._clear_sums()
+        for index in range(self.count):
+            self._times[index] -= shift
+            self._add_sums(self._times[index], self._values[index], 1)
+
+    def full(self):
+        return self.count == self.size
+
+    def last(self):
+        return self._values[self._index - 1] if self.count else None
+
+    def slope(self):
+        """Return slope of least squares line, 0 for less than 2 samples."""
+        n = self.count
+        denominator = n * self._sum_tt - self._sum_t * self._sum_t
+        if n < 2 or denominator <= 0:
+            return 0.0
+        return (n * self._sum_ty - self._sum_t * self._sum_y) / denominator
+
+    def fitted(self):
+        """Return value of least squares line at time of the newest sample, None without samples."""
+        n = self.count
+        if not n:
+            return None
+        return self._sum_y / n + self.slope() * (self._times[self._index - 1] - self._sum_t / n)
+
+    def clear(self):
+        self._index = 0
+        self.count = 0
+        self._base = None
+        self._clear_sums()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# Shared index of active stations for plug-ins which check stations every second
+# (water_meter, wind_monitor, pressure_monitor). The station list is scanned at most once per tick for all plug-ins,
+# the questions "any station on?", "is master on?" and "which stations are on?" are answered from the cached sets.
+# OSPy stations are imported at the first scan, not when this module is imported.
+
+import threading
+
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
+
+class ActiveStations(object):
+    """Cached sets of active stations, refreshed by one scan when older than max_age seconds."""
+
+    def __init__(self, max_age=1.0):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._time = None
+        self._active = frozenset()
+        self._active_names = ()
+        self._master_on = False
+
+    def invalidate(self):
+        """Station state was changed, next question scans stations again."""
+        self._time = None
+
+    def _refresh(self):
+        now = monotonic()
+        if self._time is not None and now - self._time < self.max_age:
+            return
+        with self._lock:
+            if self._time is not None and now - self._time < self.max_age:
+                return  # other plug-in has scanned meanwhile
+            from ospy.stations import stations
+            active = []
+            names = []
+            master_on = False
+            for station in stations.get():
+                if station.active:
+                    active.append(station.index)
+                    if station.is_master:
+                        master_on = True
+                    else:
+                        names.append(station.name)
+            self._active = frozenset(active)
+            self._active_names = tuple(names)
+            self._master_on = master_on
+            self._time = monotonic()
+
+    def any_on(self):
+        """Return True if any station is active."""
+        self._refresh()
+        return bool(self._active)
+
+    def master_on(self):
+        """Return True if master station is active."""
+        self._refresh()
+        return self._master_on
+
+    def is_on(self, index):
+        self._refresh()
+        return index in self._active
+
+    def names(self):
+        """Return names of active stations (without master)."""
+        self._refresh()
+        return self._active_names
+
+
+active_stations = ActiveStations()
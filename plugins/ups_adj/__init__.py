@@ -2,18 +2,30 @@
 # this plugins check power line and shutdown ospi system (count down to reconect power line) and shutdown UPS after time.
 
 import json
+import os
 import time
 import sys
 import traceback
 
 from threading import Thread, Event
 
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
 import web
 from ospy.helpers import poweroff
 from ospy.log import log
-from plugins import PluginOptions, plugin_url
+from ospy.stations import stations
+from plugins import PluginOptions, plugin_url, plugin_data_dir
 from ospy.webpages import ProtectedPage
 from ospy.helpers import datetime_string
+from ospy.helpers import get_rpi_revision
+from plugins.shared import gpio_input  # edge driven input with debounce
+from . import battery  # prediction of battery runtime
+from . import outage_journal  # history of outages
+from plugins.shared import shutdown_hooks  # hooks of plug-ins run before shutdown
 
 NAME = 'UPS Monitor'
 LINK = 'settings_page'
@@ -23,6 +35,14 @@ ups_options = PluginOptions(
     {
         "time": 60, # in minutes
         "ups": False,
+        "debounce": 100,  # ms, shorter changes of power line are ignored (glitch)
+        "hooks_timeout": 20,  # seconds for all shutdown hooks of plug-ins before UPS is switched off
+        "battery": False,     # shutdown by predicted runtime of battery (time is maximum)
+        "battery_input": 0,   # PCF8591 input 0-3 of volt_temp_da, calibrated in volts
+        "battery_empty": 11.0,  # V, voltage of discharged battery
+        "battery_margin": 120,  # seconds of runtime left for shutdown of system (shutdown hooks are added)
+        "battery_window": 300,  # seconds of samples for discharge slope
+        "battery_interval": 5,  # seconds between samples of battery voltage
         "sendeml": False,
     }
 )
@@ -31,124 +51,259 @@ ups_options = PluginOptions(
 # GPIO input pullup and output:                                                #
 ################################################################################
 
-import RPi.GPIO as GPIO  # RPi hardware
+try:
+    import RPi.GPIO as GPIO  # RPi hardware
+except ImportError:
+    GPIO = None  # power line can not be monitored, error is logged by UPSSender
 
 pin_power_ok = 16 # GPIO23
 pin_ups_down = 18 # GPIO24
 
-try:
+if GPIO is not None:
     GPIO.setup(pin_power_ok, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-except NameError:
-    pass
 
-try:
+if GPIO is not None:
     GPIO.setmode(GPIO.BOARD) ## Use board pin numbering
     GPIO.setup(pin_ups_down, GPIO.OUT)
     GPIO.output(pin_ups_down, GPIO.LOW)
-except NameError:
-    pass
 
 
 ################################################################################
 # Main function loop:                                                          #
 ################################################################################
 
+class BatterySensor(object):
+    """Battery voltage on PCF8591 input read by volt_temp_da plug-in and runtime predicted from discharge slope."""
+
+    def __init__(self):
+        from plugins import volt_temp_da                  # raises ImportError if the plug-in is not installed
+        from plugins.volt_temp_da import sampler
+        from plugins.shared import i2c_bus
+        self._sampler = sampler
+        self.bus = i2c_bus.get_bus(1 if get_rpi_revision() >= 2 else 0)
+        self.channel = ups_options['battery_input']
+        self.table = volt_temp_da.compile_input(self.channel)  # own copy, tables of volt_temp_da are not changed
+        self.interval = max(1.0, float(ups_options['battery_interval']))
+        self.discharge = battery.Discharge(round(ups_options['battery_window'] / self.interval))
+        self.next_sample = None  # monotonic time of next sample
+
+    def read(self, now):
+        """Read battery voltage and add it to regression window."""
+        raw = self._sampler.read_channels(self.bus)[self.channel]
+        self.discharge.add(now, self.table[raw])
+        self.next_sample = now + self.interval
+
+    def voltage(self):
+        return self.discharge.voltage()
+
+    def time_to_empty(self):
+        return self.discharge.time_to_empty(ups_options['battery_empty'])
+
+    def runtime(self):
+        """Return seconds to shutdown (time to empty minus margin and time of shutdown hooks) or None."""
+        time_to_empty = self.time_to_empty()
+        if time_to_empty is None:
+            return None
+        return max(0.0, time_to_empty - ups_options['battery_margin'] - ups_options['hooks_timeout'])
+
+    def as_dict(self):
+        voltage = self.voltage()
+        time_to_empty = self.time_to_empty()
+        return {'voltage': round(voltage, 2) if voltage is not None else None,
+                'slope': round(self.discharge.window.slope() * 60, 4),  # V/min
+                'time_to_empty': int(time_to_empty) if time_to_empty is not None else None}
+
+
 class UPSSender(Thread):
     def __init__(self):
         Thread.__init__(self)
         self.daemon = True
         self._stop_event = Event()
+        self._wake_event = Event()  # set by edge on power line input, settings and stop
 
-        self.status = {}
-        self.status['power%d'] = 0
+        self.input = None
+        self.fault_since = None     # monotonic time of power line fault
+        self.deadline = None        # monotonic time of shutdown
+        self.battery = None         # battery sensor during fault in battery mode
+        self.status = {'power': '', 'fault_since': None, 'battery': None}
+        self.journal = None         # history of outages, opened by run
 
-        self._sleep_time = 0
         self.start()
 
     def stop(self):
         self._stop_event.set()
+        self._wake_event.set()
 
     def update(self):
-        self._sleep_time = 0
+        self._wake_event.set()
 
     def _sleep(self, secs):
-        self._sleep_time = secs
-        while self._sleep_time > 0 and not self._stop_event.is_set():
-            time.sleep(1)
-            self._sleep_time -= 1
+        """Sleep until edge on input, update, stop or timeout (None = no timeout)."""
+        self._wake_event.wait(secs)
+
+    def countdown(self):
+        """Return seconds to shutdown or None."""
+        if self.deadline is None:
+            return None
+        return max(0, int(round(self.deadline - monotonic())))
+
+    def _journal(self, method, *args):
+        """Write to outage journal, error of disk is only logged (countdown and shutdown must continue)."""
+        if self.journal is None:
+            return
+        try:
+            getattr(self.journal, method)(*args)
+        except Exception:
+            log.error(NAME, 'UPS plug-in: outage journal:\n' + traceback.format_exc())
+
+    def _fault(self, now):
+        self.fault_since = now
+        self.status['fault_since'] = int(time.time())
+        self._journal('start', self.status['fault_since'], int(ups_options['time']) * 60)
+        msg = 'UPS plugin detected fault on power line.'      # send email with info power line fault
+        log.clear(NAME)
+        log.info(NAME, msg)
+        log.info(NAME, 'Time to shutdown: %d sec' % (int(ups_options['time']) * 60))
+        if ups_options['sendeml']:                              # if enabled send email
+            send_email(msg)
+        self.battery = None
+        if ups_options['battery']:
+            try:
+                self.battery = BatterySensor()
+            except ImportError:
+                log.error(NAME, 'Battery mode needs Voltage and Temperature Monitor plug-in and smbus.')
+            except Exception:
+                log.error(NAME, 'UPS plug-in: battery voltage is not available, fixed time is used.\n' +
+                          traceback.format_exc())
+
+    def _read_battery(self, now):
+        """Read battery voltage if it is time, on error the countdown continues without battery."""
+        if self.battery.next_sample is not None and now < self.battery.next_sample:
+            return
+        try:
+            self.battery.read(now)
+            self.status['battery'] = self.battery.as_dict()
+        except Exception:
+            log.error(NAME, 'UPS plug-in: battery voltage is not available, fixed time is used.\n' +
+                      traceback.format_exc())
+            self.battery = None
+
+    def _restored(self):
+        self.fault_since = None
+        self.battery = None
+        self.status['fault_since'] = None
+        self.status['battery'] = None
+        self._journal('end', time.time())
+        msg = 'UPS plugin - power line has restored - OK.'
+        log.clear(NAME)
+        log.info(NAME, msg)
+        if ups_options['sendeml']:                              # if enabled send email
+            send_email(msg)
 
-    def run(self):
-        reboot_time = False
-        once = True
-        once_two = True
-        once_three = True
+    def _shutdown(self):
+        log.clear(NAME)
+        log.info(NAME, 'Power line is not restore in time -> sends email and shutdown system.')
+        if self.battery is not None and self.status['battery'] is not None:
+            log.info(NAME, 'Battery: %(voltage)s V, %(slope)s V/min, time to empty: %(time_to_empty)s sec' %
+                     self.status['battery'])
+        if ups_options['sendeml']:                              # if enabled send email
+            msg = 'UPS plugin - power line is not restore in time -> shutdown system!' # send email with info shutdown system
+            send_email(msg)
+
+        self._journal('shutdown')
+        self._run_hooks()
+        GPIO.output(pin_ups_down, GPIO.HIGH)                    # switch on GPIO fo countdown UPS battery power off
+        time.sleep(4)
+        GPIO.output(pin_ups_down, GPIO.LOW)
+        poweroff(1, True)                                       # shutdown system
+
+    def _run_hooks(self):
+        """Run shutdown hooks of plug-ins (stop stations, flush files) and log time of every hook."""
+        report = shutdown_hooks.run(ups_options['hooks_timeout'])
+        for hook in report:
+            log.info(NAME, 'Shutdown hook %s: %s (%.3f sec)' % (hook['name'], hook['result'], hook['seconds']))
+            if hook['error']:
+                log.error(NAME, 'UPS plug-in: shutdown hook %s:\n%s' % (hook['name'], hook['error']))
+        self.status['hooks'] = report
+        try:
+            with open(os.path.join(plugin_data_dir(), 'shutdown_hooks.json'), 'w') as report_file:
+                json.dump({'time': int(time.time()), 'hooks': report}, report_file)
+                report_file.flush()
+                os.fsync(report_file.fileno())
+        except Exception:
+            log.error(NAME, 'UPS plug-in: \n' + traceback.format_exc())
 
-        last_time = int(time.time())
+    def run(self):
+        try:
+            self.journal = outage_journal.OutageJournal(plugin_data_dir(), time.time())
+        except Exception:
+            log.error(NAME, 'UPS plug-in:\n' + 'Could not open outage journal - ' + traceback.format_exc())
+
+        if GPIO is None:
+            self.status['power'] = 'ERROR'
+            log.error(NAME, 'UPS plug-in: RPi.GPIO is not available, power line is not monitored!')
+            return
+
+        try:
+            self.input = gpio_input.DebouncedInput(GPIO, pin_power_ok, ups_options['debounce'] / 1000.0,
+                                                   self._wake_event.set)
+        except Exception:
+            log.error(NAME, 'UPS plug-in: \n' + traceback.format_exc())
+            return
 
         while not self._stop_event.is_set():
+            self._wake_event.clear()  # events from now wake up the next sleep
             try:
-                if ups_options['ups']:                                     # if ups plugin is enabled
-                    test = get_check_power()
-
-                    if not test:
-                        text = 'OK'
+                now = monotonic()
+                self.input.debounce = ups_options['debounce'] / 1000.0
+                self.input.update(now)
+                timeout = None                                          # nothing to do until edge or settings
+
+                if ups_options['ups']:                                  # if ups plugin is enabled
+                    fault = get_check_power(self.input.level)
+                    self.status['power'] = 'FAULT' if fault else 'OK'
+
+                    if fault and self.fault_since is None:              # power line is not active, start countdown
+                        self._fault(now)
+                    elif not fault and self.fault_since is not None:
+                        self._restored()
+
+                    if self.fault_since is not None:
+                        self.deadline = self.fault_since + int(ups_options['time']) * 60
+                        if self.battery is not None:
+                            self._read_battery(now)
+                        if self.battery is not None:
+                            runtime = self.battery.runtime()
+                            if runtime is not None:                     # shutdown before battery is empty
+                                self.deadline = min(self.deadline, now + runtime)
+                        if now >= self.deadline:                        # if countdown is 0
+                            self.deadline = None
+                            self._shutdown()
+                            self.fault_since = now                      # shutdown again after time if still running
+                            self.battery = None
+                        else:
+                            timeout = self.deadline - now
+                            if self.battery is not None:
+                                timeout = min(timeout, max(0, self.battery.next_sample - now))
                     else:
-                        text = 'FAULT'
-                    self.status['power%d'] = text
-
-                    if not test:
-                        last_time = int(time.time())
-
-                    if test:                                               # if power line is not active
-                        reboot_time = True                                  # start countdown timer
-                        if once:
-                            msg = 'UPS plugin detected fault on power line.' # send email with info power line fault
-                            log.info(NAME, msg)
-                            if ups_options['sendeml']:                       # if enabled send email
-                                send_email(msg)
-                                once_three = True
-                            once = False
-
-                    if reboot_time and test:
-                        count_val = int(ups_options['time']) * 60             # value for countdown
-                        actual_time = int(time.time())
-                        log.clear(NAME)
-                        log.info(NAME, 'Time to shutdown: ' + str(count_val - (actual_time - last_time)) + ' sec')
-                        if ((actual_time - last_time) >= count_val):        # if countdown is 0
-                            last_time = actual_time
-                            test = get_check_power()
-                            if test:                                         # if power line is current not active
-                                log.clear(NAME)
-                                log.info(NAME, 'Power line is not restore in time -> sends email and shutdown system.')
-                                reboot_time = False
-                                if ups_options['sendeml']:                    # if enabled send email
-                                    if once_two:
-                                        msg = 'UPS plugin - power line is not restore in time -> shutdown system!' # send email with info shutdown system
-                                        send_email(msg)
-                                        once_two = False
-
-                                GPIO.output(pin_ups_down,
-                                            GPIO.HIGH)          # switch on GPIO fo countdown UPS battery power off
-                                self._sleep(4)
-                                GPIO.output(pin_ups_down, GPIO.LOW)
-                                poweroff(1, True)                             # shutdown system
-
-                    if not test:
-                        if once_three:
-                            if ups_options['sendeml']:                     # if enabled send email
-                                msg = 'UPS plugin - power line has restored - OK.'
-                                log.clear(NAME)
-                                log.info(NAME, msg)
-                                send_email(msg)
-                                once = True
-                                once_two = True
-                                once_three = False
-
-                self._sleep(1)
+                        self.deadline = None
+                else:
+                    self.status['power'] = ''
+                    if self.fault_since is not None:
+                        self._journal('end', time.time())               # monitoring of outage is stopped
+                    self.fault_since = self.deadline = None
+
+                debounce_deadline = self.input.deadline()
+                if debounce_deadline is not None:
+                    timeout = max(0, debounce_deadline - now) if timeout is None else \
+                        max(0, min(timeout, debounce_deadline - now))
+                self._sleep(timeout)
 
             except Exception:
                 log.error(NAME, 'UPS plug-in: \n' + traceback.format_exc())
-                self._sleep(60)
+                self._stop_event.wait(60)
+
+        self.input.close()
 
 
 ups_sender = None
@@ -159,9 +314,10 @@ ups_sender = None
 def start():
     global ups_sender
     if ups_sender is None:
-        ups_sender = UPSSender()
+        shutdown_hooks.register(NAME, stop_stations, priority=10, timeout=5)
         log.clear(NAME)
         log.info(NAME, 'UPS plugin is started.')
+        ups_sender = UPSSender()
 
 
 def stop():
@@ -170,6 +326,13 @@ def stop():
         ups_sender.stop()
         ups_sender.join()
         ups_sender = None
+    shutdown_hooks.unregister(NAME)
+
+
+def stop_stations():
+    """Shutdown hook: save log of running program and switch off all stations."""
+    log.finish_run(None)
+    stations.clear()
 
 
 def send_email(msg):
@@ -184,6 +347,8 @@ def send_email(msg):
 
 
 def get_check_power_str():
+    if GPIO is None:
+        return 'RPi.GPIO is not available.'
     if GPIO.input(pin_power_ok) == 0:
         pwr = 'GPIO Pin = 0 Power line is OK.'
     else:
@@ -191,17 +356,34 @@ def get_check_power_str():
     return str(pwr)
 
 
-def get_check_power():
+def get_check_power(level=None):
+    """Return 1 if power line is in fault, level is read from GPIO if not given."""
     try:
-        if GPIO.input(pin_power_ok):  # power line detected
+        if level is None:
+            level = GPIO.input(pin_power_ok)
+        if level:  # power line detected
             pwr = 1
         else:
             pwr = 0
         return pwr
-    except NameError:
+    except (NameError, AttributeError):  # GPIO is not available
         pass
 
 
+def query_limit(qdict, default=20, maximum=10000):
+    """Return number of outages from web query ?limit=number, raises ValueError if it is wrong."""
+    value = qdict.get('limit')
+    if not value:
+        return default
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError('Parameter limit must be an integer.')
+    if not 0 <= limit <= maximum:
+        raise ValueError('Parameter limit must be in range 0 - %d.' % maximum)
+    return limit
+
+
 ################################################################################
 # Web pages:                                                                   #
 ################################################################################
@@ -211,7 +393,8 @@ class settings_page(ProtectedPage):
     """Load an html page for entering USP adjustments."""
 
     def GET(self):
-        return self.plugin_render.ups_adj(ups_options, ups_sender.status, log.events(NAME))
+        return self.plugin_render.ups_adj(ups_options, ups_sender.status, log.events(NAME), ups_sender.countdown(),
+                                          shutdown_hooks.names())
 
     def POST(self):
         ups_options.web_update(web.input())
@@ -229,3 +412,48 @@ class settings_json(ProtectedPage):
         web.header('Content-Type', 'application/json')
         return json.dumps(ups_options)
 
+
+class status_json(ProtectedPage):
+    """Returns power line state and shutdown countdown in JSON format."""
+
+    def GET(self):
+        web.header('Access-Control-Allow-Origin', '*')
+        web.header('Content-Type', 'application/json')
+        result = {}
+        if ups_sender is not None:
+            result = dict(ups_sender.status)
+            result['countdown'] = ups_sender.countdown()
+        return json.dumps(result)
+
+
+class outages_json(ProtectedPage):
+    """Returns outage statistics and last outages in JSON format: ?limit=number (default 20)"""
+
+    def GET(self):
+        web.header('Access-Control-Allow-Origin', '*')
+        web.header('Content-Type', 'application/json')
+        try:
+            limit = query_limit(web.input())
+        except ValueError as error:
+            web.ctx.status = '400 Bad Request'
+            return json.dumps({'error': str(error)})
+        result = {}
+        if ups_sender is not None and ups_sender.journal is not None:
+            result = ups_sender.journal.summary()
+            result['outages'] = ups_sender.journal.recent(limit)
+        return json.dumps(result)
+
+
+class shutdown_hooks_json(ProtectedPage):
+    """Returns registered shutdown hooks and report of last shutdown (time of every hook) in JSON format."""
+
+    def GET(self):
+        web.header('Access-Control-Allow-Origin', '*')
+        web.header('Content-Type', 'application/json')
+        result = {'hooks': shutdown_hooks.names(), 'last': None}
+        try:
+            with open(os.path.join(plugin_data_dir(), 'shutdown_hooks.json')) as report_file:
+                result['last'] = json.load(report_file)
+        except (IOError, ValueError):
+            pass
+        return json.dumps(result)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# Prediction of battery runtime from samples of battery voltage during power line fault.
+# Discharge slope is the least squares line of the last samples (plugins/shared/slope.py), time to empty is
+# (voltage - empty voltage) / discharge slope. Nothing is predicted before MIN_SAMPLES samples, so one noisy
+# or sagging first reading can not shut down the system.
+
+from plugins.shared import slope
+
+MIN_SAMPLES = 6  # samples of battery voltage before runtime is predicted
+
+
+class Discharge(object):
+    """Battery voltage samples in regression window of size samples."""
+
+    def __init__(self, size):
+        self.window = slope.SlopeWindow(size)
+
+    def add(self, now, voltage):
+        self.window.add(now, voltage)
+
+    def ready(self):
+        """Return True if there are enough samples for prediction."""
+        return self.window.count >= min(MIN_SAMPLES, self.window.size)
+
+    def voltage(self):
+        """Return battery voltage from regression line (less noise than one sample)."""
+        return self.window.fitted()
+
+    def time_to_empty(self, empty):
+        """Return predicted seconds to empty battery or None (not enough samples or battery is not discharged)."""
+        if not self.ready():
+            return None
+        voltage = self.voltage()
+        if voltage <= empty:
+            return 0.0
+        discharge = -self.window.slope()
+        if discharge <= 0:
+            return None
+        return (voltage - empty) / discharge
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# Journal of power line outages: fixed size records appended to one file (start, end, shutdown limit, flags).
+# Outage in progress is kept in a small file, if the system was shut down (or crashed) during the outage,
+# the outage is closed with estimated end when the journal is opened again.
+# Statistics (count, MTBF, duration histogram with p50/p95) are updated with every outage, JSON never scans the file.
+
+import bisect
+import json
+import os
+import struct
+import threading
+
+RECORD = struct.Struct('<IIIB')  # start, end (timestamps), shutdown limit (seconds), flags
+SHUTDOWN = 1                     # system was shut down during outage
+ESTIMATED = 2                    # end of outage is time when the journal was opened again
+
+# upper edges of duration histogram bins in seconds, last bin is unlimited
+BINS = (1, 2, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400, 28800, 43200, 86400)
+
+
+class OutageStats(object):
+    """Aggregates of outages updated in O(1) per outage."""
+
+    def __init__(self):
+        self.count = 0
+        self.shutdowns = 0
+        self.total_duration = 0
+        self.max_duration = 0
+        self.closest = 0.0          # maximum of duration / shutdown limit of outages without shutdown
+        self.first_start = None
+        self.last_start = None
+        self.last_end = None
+        self._uptime = 0            # sum of time between end of outage and start of next one
+        self.histogram = [0] * (len(BINS) + 1)
+
+    def add(self, start, end, limit, flags):
+        duration = max(0, end - start)
+        self.count += 1
+        self.total_duration += duration
+        self.max_duration = max(self.max_duration, duration)
+        if flags & SHUTDOWN:
+            self.shutdowns += 1
+        elif limit > 0:
+            self.closest = max(self.closest, min(1.0, float(duration) / limit))
+        if self.last_end is not None:
+            self._uptime += max(0, start - self.last_end)
+        if self.first_start is None:
+            self.first_start = start
+        self.last_start = start
+        self.last_end = end
+        self.histogram[bisect.bisect_left(BINS, duration)] += 1
+
+    def percentile(self, fraction):
+        """Return duration of percentile (0.0-1.0) interpolated in histogram bin."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.histogram):
+            if count and seen + count >= rank:
+                low = BINS[index - 1] if index > 0 else 0
+                high = min(BINS[index], self.max_duration) if index < len(BINS) else max(self.max_duration, low)
+                return round(low + (high - low) * (rank - seen) / count, 1)
+            seen += count
+        return self.max_duration
+
+    def mtbf(self):
+        """Return mean time between outages (from end of outage to start of next one) in seconds."""
+        if self.count < 2:
+            return None
+        return int(self._uptime / (self.count - 1))
+
+    def as_dict(self):
+        return {'count': self.count,
+                'shutdowns': self.shutdowns,
+                'total_duration': self.total_duration,
+                'mean_duration': round(float(self.total_duration) / self.count, 1) if self.count else None,
+                'max_duration': self.max_duration,
+                'p50_duration': self.percentile(0.5),
+                'p95_duration': self.percentile(0.95),
+                'mtbf': self.mtbf(),
+                'closest_to_shutdown': round(self.closest * 100, 1),  # percent of shutdown limit
+                'first_start': self.first_start,
+                'last_start': self.last_start,
+                'histogram': [{'to': edge, 'count': count} for edge, count in zip(BINS + (None,), self.histogram)]}
+
+
+class OutageJournal(object):
+    """Append only file of outages in directory path."""
+
+    def __init__(self, path, now):
+        self.file_name = os.path.join(path, 'outages.bin')
+        self.current_name = os.path.join(path, 'outage.json')
+        self._lock = threading.Lock()
+        self.stats = OutageStats()
+        self.current = None  # {'start': timestamp, 'limit': seconds, 'flags': flags}
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._load(now)
+
+    def _load(self, now):
+        if os.path.exists(self.file_name):
+            size = os.path.getsize(self.file_name)
+            if size % RECORD.size:  # incomplete last record after power loss
+                with open(self.file_name, 'r+b') as journal:
+                    journal.truncate(size - size % RECORD.size)
+            with open(self.file_name, 'rb') as journal:
+                while True:
+                    data = journal.read(RECORD.size * 1024)
+                    if not data:
+                        break
+                    for offset in range(0, len(data), RECORD.size):
+                        self.stats.add(*RECORD.unpack_from(data, offset))
+        try:
+            with open(self.current_name) as current_file:
+                current = json.load(current_file)
+            self._append(current['start'], now, current['limit'], current['flags'] | ESTIMATED)
+        except (IOError, ValueError, KeyError):
+            pass
+        self._remove_current()
+
+    def _append(self, start, end, limit, flags):
+        with open(self.file_name, 'ab') as journal:
+            journal.write(RECORD.pack(int(start), int(end), int(limit), flags))
+            journal.flush()
+            os.fsync(journal.fileno())
+        self.stats.add(int(start), int(end), int(limit), flags)
+
+    def _save_current(self):
+        temp_name = self.current_name + '.tmp'
+        with open(temp_name, 'w') as current_file:
+            json.dump(self.current, current_file)
+            current_file.flush()
+            os.fsync(current_file.fileno())
+        os.rename(temp_name, self.current_name)
+
+    def _remove_current(self):
+        if os.path.exists(self.current_name):
+            os.remove(self.current_name)
+
+    def start(self, timestamp, limit):
+        """Outage started, limit is time to shutdown in seconds."""
+        with self._lock:
+            self.current = {'start': int(timestamp), 'limit': int(limit), 'flags': 0}
+            self._save_current()
+
+    def shutdown(self):
+        """System is shut down during current outage."""
+        with self._lock:
+            if self.current is not None:
+                self.current['flags'] |= SHUTDOWN
+                self._save_current()
+
+    def end(self, timestamp):
+        """Outage ended (power line restored)."""
+        with self._lock:
+            if self.current is not None:
+                self._append(self.current['start'], timestamp, self.current['limit'], self.current['flags'])
+                self.current = None
+                self._remove_current()
+
+    def recent(self, count):
+        """Return list of last count outages (newest first), only these records are read from file."""
+        with self._lock:
+            if count <= 0 or not os.path.exists(self.file_name):
+                return []
+            size = os.path.getsize(self.file_name)
+            with open(self.file_name, 'rb') as journal:
+                journal.seek(max(0, size - count * RECORD.size))
+                data = journal.read()
+        result = []
+        for offset in range(len(data) - RECORD.size, -1, -RECORD.size):
+            start, end, limit, flags = RECORD.unpack_from(data, offset)
+            result.append({'start': start, 'end': end, 'duration': end - start, 'limit': limit,
+                           'shutdown': bool(flags & SHUTDOWN), 'estimated': bool(flags & ESTIMATED)})
+        return result
+
+    def summary(self):
+        with self._lock:
+            result = self.stats.as_dict()
+            result['current'] = dict(self.current) if self.current is not None else None
+        return result
@@ -2,10 +2,16 @@
 # This plugin read data (temp or voltage) from I2C PCF8591 on adress 0x48. For temperature probe use LM35D (LM35DZ). 
 
 import json
+import struct
 import time
 import traceback
 import os
-from threading import Thread, Event
+from threading import Thread, Event, Lock
+
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
 
 import web
 
@@ -14,6 +20,15 @@ from plugins import PluginOptions, plugin_url, plugin_data_dir
 from ospy.webpages import ProtectedPage
 from ospy.helpers import get_rpi_revision
 from ospy.helpers import datetime_string
+from ospy.stations import stations
+from plugins.shared.station_state import active_stations
+from plugins.shared import shutdown_hooks  # flush before shutdown by UPS plug-in
+from plugins.shared import i2c_bus  # shared I2C bus manager
+from . import log_store  # append only log
+from . import sampler  # block read and aggregation of samples
+from . import calibration  # conversion of samples by lookup tables
+from . import alerts  # alert rules of inputs
+from . import control  # closed loop control of D/A output
 
 
 NAME = 'Voltage and Temperature Monitor'
@@ -24,20 +39,50 @@ pcf_options = PluginOptions(
     {'enabled': False,
      'enable_log': False,
      'log_interval': 1,
+     'sample_rate': 10,    # samples per second aggregated over log interval (0 = max 100 per second)
      'log_records': 0,
      'voltage': 5.0,
 
-     'ad0_temp': False,
+     'ad0_temp': False,    # only for settings of older versions, replaced by profile
      'ad1_temp': False,
      'ad2_temp': False,
      'ad3_temp': False,
 
+     'ad0_profile': '',    # calibration profile (calibration.PROFILES)
+     'ad1_profile': '',
+     'ad2_profile': '',
+     'ad3_profile': '',
+
+     'ad0_params': '',     # comma separated parameters of profile
+     'ad1_params': '',
+     'ad2_params': '',
+     'ad3_params': '',
+
+     'ad0_unit': '',       # unit of linear and polynomial profile
+     'ad1_unit': '',
+     'ad2_unit': '',
+     'ad3_unit': '',
+
      'ad0_label': 'AD 1',
      'ad1_label': 'AD 2',
      'ad2_label': 'AD 3',
      'ad3_label': 'AD 4',
 
-     'da_value': 0
+     'da_value': 0,
+
+     'alert_rules': '',    # one rule per line (alerts.py)
+
+     'control_mode': 'off',      # D/A output: off (da_value), pid or bangbang
+     'control_input': 0,         # controlled A/D input 0-3
+     'control_setpoint': 0.0,    # in units of input
+     'control_rate': 10.0,       # control loop iterations per second
+     'control_kp': 10.0,
+     'control_ki': 0.0,
+     'control_kd': 0.0,
+     'control_hysteresis': 0.0,  # bang-bang
+     'control_min': 0,           # D/A output limits 0-255
+     'control_max': 255,
+     'control_reverse': False    # output rises when input is over setpoint (cooling)
     }
 )
 
@@ -46,6 +91,9 @@ pcf_options = PluginOptions(
 # Main function loop:                                                          #
 ################################################################################
 
+EMAIL_RETRY = 60  # seconds between attempts to send email of notify action after error
+MIN_SAMPLE_PERIOD = 0.01  # seconds, sample rate 0 (as fast as possible) is limited to 100 samples per second
+
 
 class PCFSender(Thread):
     def __init__(self):
@@ -54,147 +102,498 @@ class PCFSender(Thread):
         self._stop_event = Event()
 
         self.adc = None
-        self.status = {}
+        self.aggregates = [sampler.Aggregate() for _ in range(4)]
+        self.status = {'samples': 0}
         for i in range(4):
             self.status['ad%d_raw' % i] = 0
             self.status['ad%d' % i] = 0
+            self.status['ad%d_min' % i] = 0
+            self.status['ad%d_max' % i] = 0
+            self.status['ad%d_stddev' % i] = 0
+
+        self.alerts = alerts.AlertEngine([], self._alert)
+        self._da_override = None  # D/A value set by active alert
+        self._emails = []         # messages of notify actions which were not sent
+        self._next_email = 0      # monotonic time of next attempt to send them
 
-        self._sleep_time = 0
+        self._restart = True
         self.start()
 
     def stop(self):
         self._stop_event.set()
 
     def update(self):
-        self._sleep_time = 0
+        self._restart = True
 
     def _sleep(self, secs):
-        self._sleep_time = secs
-        while self._sleep_time > 0 and not self._stop_event.is_set():
-            time.sleep(1)
-            self._sleep_time -= 1
+        self._stop_event.wait(secs)
 
-    def run(self):
+    def da_override(self):
+        """Return D/A value set by active alert or None (read by control loop)."""
+        return self._da_override
+
+    def _write_da(self):
+        if self._da_override is None and pcf_options['control_mode'] != 'off':
+            return  # D/A output is driven by control loop
+        try:
+            write_DA(self.adc, pcf_options['da_value'] if self._da_override is None else self._da_override)
+        except Exception:
+            log.error(NAME, 'Voltage and Temperature Monitor plug-in: D/A output was not written:\n' +
+                      traceback.format_exc())
+
+    def _update_alerts(self):
+        """Build alert engine from rules in settings."""
         try:
-            import smbus  # for PCF 8591
+            rules = alerts.parse_rules(pcf_options['alert_rules'])
+        except ValueError as error:
+            log.error(NAME, str(error))
+            rules = []
+        self._da_override = None
+        self.alerts = alerts.AlertEngine(rules, self._alert)
+
+    def _alert(self, rule, active):
+        """Do actions of fired alert rule, or undo D/A output of cleared rule."""
+        label = pcf_options['ad%d_label' % rule.channel]
+        if active:
+            message = 'Alert %s: %s' % (label, rule.text)
+            log.warning(NAME, message)
+            if 'stop' in rule.actions:
+                self._stop_stations()
+            if rule.da_value() is not None:
+                self._da_override = rule.da_value()
+                self._write_da()
+            if 'notify' in rule.actions:
+                self._emails.append(message)
+                self._send_emails()
+        else:
+            log.info(NAME, 'Alert %s cleared: %s' % (label, rule.text))
+            if rule.da_value() is not None:
+                self._da_override = None
+                self._write_da()
+
+    def _send_emails(self):
+        """Send messages of notify actions, after error they are sent again in EMAIL_RETRY seconds."""
+        if not self._emails or monotonic() < self._next_email:
+            return
+        while self._emails and send_email(self._emails[0]):
+            self._emails.pop(0)
+        if self._emails:
+            self._next_email = monotonic() + EMAIL_RETRY
+
+    def _stop_stations(self):
+        """Stop all stations while any alert rule with action stop is fired (runs are blocked until it clears)."""
+        if not any(rule.fired and 'stop' in rule.actions for rule in self.alerts.rules):
+            return
+        if active_stations.any_on():
+            log.finish_run(None)  # save log
+            stations.clear()      # set all station to off
+            active_stations.invalidate()
+            log.info(NAME, 'All stations were stopped.')
+
+    def _sample(self):
+        """Read all channels by one block read, add raw values to aggregates and check alert rules."""
+        now = monotonic()
+        for i, val in enumerate(sampler.read_channels(self.adc)):
+            self.aggregates[i].add(val)
+            self.status['ad%d_raw' % i] = val
+            self.alerts.add(i, _tables[i][val], now)
+
+    def _report(self):
+        """Log aggregates of finished interval and start new one."""
+        log.clear(NAME)
+        log.info(NAME, datetime_string())
+        self.status['samples'] = self.aggregates[0].count
+        for i, aggregate in enumerate(self.aggregates):
+            values = get_values(i, aggregate.minimum, aggregate.maximum, aggregate.mean, aggregate.stddev())
+            for key, value in zip(('ad%d_min', 'ad%d_max', 'ad%d', 'ad%d_stddev'), values):
+                self.status[key % i] = value
+            log.info(NAME, pcf_options['ad%d_label' % i] + ': ' + format(self.status['ad%d' % i], get_unit(i)) +
+                     ' (min %.1f, max %.1f, stddev %.2f)' % (self.status['ad%d_min' % i], self.status['ad%d_max' % i],
+                                                             self.status['ad%d_stddev' % i]))
+        log.info(NAME, 'Samples: %d' % self.status['samples'])
+
+        if pcf_options['enable_log']:
+            update_log(self.aggregates)
+        for aggregate in self.aggregates:
+            aggregate.clear()
 
-            self.adc = smbus.SMBus(1 if get_rpi_revision() >= 2 else 0)
+    def run(self):
+        try:
+            self.adc = i2c_bus.get_bus(1 if get_rpi_revision() >= 2 else 0)  # for PCF 8591
         except ImportError:
             log.warning(NAME, 'Could not import smbus.')
 
+        next_log = 0
         while not self._stop_event.is_set():
-            log.clear(NAME)
             try:
+                log_seconds = max(60, pcf_options['log_interval'] * 60)
+                if self._restart:  # settings were changed, start new interval
+                    self._restart = False
+                    for aggregate in self.aggregates:
+                        aggregate.clear()
+                    update_calibration()
+                    self._update_alerts()
+                    next_log = monotonic() + log_seconds
+                    self._write_da()
+
                 if self.adc is not None and pcf_options['enabled']:  # if pcf plugin is enabled
-                    for i in range(4):
-                        val = read_AD(self.adc, i + 1)
-                        self.status['ad%d_raw' % i] = val
-                        self.status['ad%d' % i] = get_temp(val) if pcf_options['ad%d_temp' % i] else get_volt(val)
+                    self._sample()
+                    self._stop_stations()
+                self._send_emails()
+
+                now = monotonic()
+                if now >= next_log:
+                    if self.aggregates[0].count:
+                        self._report()
+                    next_log += log_seconds
+                    if next_log <= now:  # do not catch up missed intervals
+                        next_log = now + log_seconds
+                    self._write_da()
+
+                if self.adc is not None and pcf_options['enabled']:
+                    rate = pcf_options['sample_rate']
+                    self._sleep(max(MIN_SAMPLE_PERIOD, 1.0 / rate if rate > 0 else 0))  # other threads can use the bus
+                else:
+                    self._sleep(1)
 
-                    log.info(NAME, datetime_string())
-                    for i in range(4):
-                        log.info(NAME, pcf_options['ad%d_label' % i] + ': ' + format(self.status['ad%d' % i],
-                                                                                     pcf_options['ad%d_temp' % i]))
+            except Exception:
+                log.error(NAME, 'Voltage and Temperature Monitor plug-in:\n' + traceback.format_exc())
+                self._sleep(60)  # bus is kept, sampling is tried again
 
-                    if pcf_options['enable_log']:
-                        update_log(self.status)
 
-                try:
-                    write_DA(self.adc, pcf_options['da_value'])
-                except Exception:
-                    self.adc = None
-                    
-                self._sleep(max(60, pcf_options['log_interval'] * 60))
+ERROR_BACKOFF_MIN = 1   # seconds of pause of control loop after first error
+ERROR_BACKOFF_MAX = 60  # pause is doubled after every next error up to this time
 
-            except Exception:
-                self.adc = None
-                log.error(NAME, 'Voltage and Temperature Monitor plug-in:\n' + traceback.format_exc())
-                self._sleep(60)
+
+class ControlSender(Thread):
+    """Fast control loop of D/A output, separate from sampling and logging."""
+
+    def __init__(self):
+        Thread.__init__(self)
+        self.daemon = True
+        self._stop_event = Event()
+
+        self.adc = None
+        self.controller = None
+        self.stats = None
+        self.status = {'mode': 'off', 'value': 0, 'output': 0, 'fault': None, 'faults': 0}
+        self._restart = True
+        self.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def update(self):
+        self._restart = True
+
+    def _sleep(self, secs):
+        self._stop_event.wait(secs)
+
+    def _setup(self):
+        """Build controller from settings and reset statistics."""
+        self._restart = False
+        low, high = pcf_options['control_min'], pcf_options['control_max']
+        reverse = pcf_options['control_reverse']
+        if pcf_options['control_mode'] == 'pid':
+            self.controller = control.PID(pcf_options['control_kp'], pcf_options['control_ki'],
+                                          pcf_options['control_kd'], low, high, reverse)
+        elif pcf_options['control_mode'] == 'bangbang':
+            self.controller = control.BangBang(pcf_options['control_hysteresis'], low, high, reverse)
+        else:
+            self.controller = None
+        self.stats = control.LoopStats(1.0 / max(0.1, pcf_options['control_rate']))
+        self.status['mode'] = pcf_options['control_mode'] if self.controller is not None else 'off'
+
+    def _control(self, dt):
+        """Read input, compute output and write it to D/A converter."""
+        channel = pcf_options['control_input']
+        value = _tables[channel][sampler.read_channels(self.adc)[channel]]
+        override = pcf_sender.da_override() if pcf_sender is not None else None
+        if override is not None:  # alert has set D/A output
+            self.controller.reset()
+            output = override
+        else:
+            output = self.controller.update(pcf_options['control_setpoint'], value, dt)
+        write_DA(self.adc, int(round(output)))
+        self.status['value'] = value
+        self.status['output'] = int(round(output))
+
+    def _safe_output(self):
+        """Drive D/A output to low limit after error of control loop (the last output could be far from safe)."""
+        try:
+            write_DA(self.adc, pcf_options['control_min'])
+            self.status['output'] = pcf_options['control_min']
+        except Exception:
+            pass  # bus is not available, error is already reported
+
+    def run(self):
+        try:
+            self.adc = i2c_bus.get_bus(1 if get_rpi_revision() >= 2 else 0)  # for PCF 8591
+        except ImportError:
+            pass  # reported by PCFSender
+
+        next_time = last_wake = None
+        backoff = ERROR_BACKOFF_MIN
+        while not self._stop_event.is_set():
+            try:
+                if self._restart:
+                    self._setup()
+                    next_time = last_wake = None
+                if self.controller is None or self.adc is None or not pcf_options['enabled']:
+                    self._sleep(1)
+                    continue
+
+                now = monotonic()
+                if next_time is None:
+                    next_time = now
+                elif next_time > now:
+                    self._sleep(next_time - now)
+                woke = monotonic()
+                self._control(woke - last_wake if last_wake is not None else self.stats.period)
+                last_wake = woke
+                done = monotonic()
+                self.stats.add(next_time, woke, done)
+                next_time += self.stats.period
+                if next_time < done:  # overrun, do not try to catch up missed iterations
+                    next_time = done
+                self.status['fault'] = None
+                backoff = ERROR_BACKOFF_MIN
+
+            except Exception as err:
+                self.status['fault'] = str(err) or err.__class__.__name__
+                self.status['faults'] += 1
+                log.error(NAME, 'Voltage and Temperature Monitor plug-in (control loop):\n' + traceback.format_exc())
+                self._safe_output()
+                if self.controller is not None:
+                    self.controller.reset()
+                next_time = last_wake = None
+                self._sleep(backoff)  # bus handle is kept, the loop continues after transient error
+                backoff = min(ERROR_BACKOFF_MAX, backoff * 2)
 
 
 pcf_sender = None
+control_sender = None
 
 ################################################################################
 # Helper functions:                                                            #
 ################################################################################
 def start():
-    global pcf_sender
+    global pcf_sender, control_sender
     if pcf_sender is None:
+        for i in range(4):
+            if not pcf_options['ad%d_profile' % i]:  # settings of older version
+                pcf_options['ad%d_profile' % i] = 'lm35' if pcf_options['ad%d_temp' % i] else 'voltage'
         pcf_sender = PCFSender()
+    if control_sender is None:
+        control_sender = ControlSender()
+    shutdown_hooks.register(NAME, flush_log, priority=50, timeout=5)  # called by UPS plug-in before shutdown
        
 
 def stop():
-    global pcf_sender
+    global pcf_sender, control_sender
+    if control_sender is not None:
+        control_sender.stop()
+        control_sender.join()
+        control_sender = None
     if pcf_sender is not None:
         pcf_sender.stop()
         pcf_sender.join()
         pcf_sender = None
+    if _log_store is not None:
+        _log_store.close()
+    shutdown_hooks.unregister(NAME)
 
 
-def get_volt(data):
-    """Return voltage 0-XX V from number"""
-    volt = data / 255.0 * pcf_options['voltage']
-    volt = round(volt, 1)
-    return volt
+def flush_log():
+    """Shutdown hook of UPS plug-in: write log to file."""
+    if _log_store is not None:
+        _log_store.flush()
 
 
-def get_temp(data):
-    """Return temperature 0-100C from data"""
-    """ 255 is 2^8, value where the analog value can be represented by PCD A/D converter. The actual voltage obtained by VOLTAGE_ON_AD_INPUT/ 255."""
-    """ 1000 is used to change the unit from V to mV. """
-    """ 10 is constant. Each 10 mV is directly proportional to 1 Celcius. """
-    """ math: (supply voltage * 1000 / 255) / 10 """
-    temp = data * (((pcf_options['voltage'])*1000.0/255.0) / 10.0) + 10
-    temp = round(temp, 1)
-    return temp
+_tables = [calibration.compile_table('voltage', [], 5.0)] * 4  # lookup tables of inputs
 
 
-def format(ad_value, is_temp):
-    if is_temp:
-        return '%.1f \u2103' % ad_value
-    else:
-        return '%.1f V' % ad_value
+def compile_input(channel):
+    """Return lookup table of input from its calibration settings, tables of this plug-in are not changed
+    (used also by other plug-ins). Raises ValueError if calibration is wrong."""
+    profile = pcf_options['ad%d_profile' % channel] or ('lm35' if pcf_options['ad%d_temp' % channel] else 'voltage')
+    params = calibration.parse_params(pcf_options['ad%d_params' % channel])
+    return calibration.compile_table(profile, params, pcf_options['voltage'])
 
 
-def read_AD(adc, pin):
-    """Return number 0-255 from A/D PCF8591 to webpage."""
-    result = 0
-    if adc is not None:
-        adc.write_byte_data(0x48, (0x40 + pin), pin)
-        result = adc.read_byte(0x48)
-    return result
+def update_calibration():
+    """Compile lookup tables of inputs from calibration settings."""
+    for i in range(4):
+        try:
+            _tables[i] = compile_input(i)
+        except ValueError as error:
+            log.error(NAME, '%s: %s Voltage is used.' % (pcf_options['ad%d_label' % i], error))
+            _tables[i] = calibration.compile_table('voltage', [], pcf_options['voltage'])
+
+
+def send_email(msg):
+    """Send email, returns True if it was sent."""
+    message = datetime_string() + ': ' + NAME + ' - ' + str(msg)
+    try:
+        from plugins.email_notifications import email
+        email(message)
+        log.info(NAME, 'Email was sent: ' + message)
+        return True
+    except Exception as err:
+        log.error(NAME, 'Email was not sent! ' + str(err))
+        return False
+
+
+def get_values(channel, minimum, maximum, mean, stddev):
+    """Return (min, max, mean, stddev) of input from raw aggregate values."""
+    table = _tables[channel]
+    low, high = table[minimum], table[maximum]  # table can be decreasing (thermistor)
+    return (round(min(low, high), 1), round(max(low, high), 1), round(calibration.interpolate(table, mean), 1),
+            round(stddev * calibration.slope(table, mean), 2))
 
 
-def write_DA(adc, value):  # PCF8591 D/A converter Y=(0-255) for future use
+def get_unit(channel):
+    """Return unit of input"""
+    return calibration.unit(pcf_options['ad%d_profile' % channel]) or pcf_options['ad%d_unit' % channel]
+
+
+def format(ad_value, unit):
+    return '%.1f %s' % (ad_value, unit)
+
+
+def write_DA(adc, value):  # PCF8591 D/A converter Y=(0-255), set by settings, control loop and alerts
     """Write analog voltage to output"""
     if adc is not None:
         adc.write_byte_data(0x48, 0x40, value)
 
 
-def read_log():
-    """Read pcf log from json file."""
-    try:
-        with open(os.path.join(plugin_data_dir(), 'log.json')) as logf:
-            return json.load(logf)
-    except IOError:
-        return []
+# Log record: timestamp, number of samples and raw (0-255) aggregates of 4 inputs: min, max, mean * 256, stddev * 256.
+# Values are converted by calibration when they are read, so changed calibration applies to the whole history.
+LOG_RECORD = struct.Struct('<IH' + 'BBHH' * 4)
+FIXED_POINT = 256.0
+
+_log_store = None
+_log_store_lock = Lock()
 
 
-def write_log(json_data):
-    """Write json to log file."""
-    with open(os.path.join(plugin_data_dir(), 'log.json'), 'w') as outfile:
-        json.dump(json_data, outfile)
+def get_log_store():
+    """Return append only log (opened on first use)."""
+    global _log_store
+    with _log_store_lock:
+        if _log_store is None:
+            _log_store = open_log_store()
+    _log_store.max_records = pcf_options['log_records']
+    return _log_store
 
 
-def update_log(status):
-    log_data = read_log()
-    data = {'datetime': datetime_string()}
+def open_log_store():
+    """Open append only log, records of older versions (log.json and JSON segments) are moved to it."""
+    path = os.path.join(plugin_data_dir(), 'log')
+    store = log_store.LogStore(path, LOG_RECORD, pcf_options['log_records'])
+    old_files = [os.path.join(plugin_data_dir(), 'log.json')]
+    old_files += sorted(os.path.join(path, file_name) for file_name in os.listdir(path) if file_name.endswith('.log'))
+    old_files = [file_name for file_name in old_files if os.path.exists(file_name)]
+    if old_files:
+        update_calibration()
+        for file_name in old_files:
+            try:
+                with open(file_name) as logf:
+                    if file_name.endswith('.json'):
+                        records = list(reversed(json.load(logf)))  # old log is newest first
+                    else:
+                        records = [json.loads(line) for line in logf if line.strip()]
+                records = [raw_record(record) for record in records]  # whole file is read before anything is appended
+            except (IOError, OSError, ValueError, KeyError, IndexError, AttributeError):
+                log.error(NAME, 'Could not read old log %s, it is kept as %s.bad:\n' % (file_name, file_name) +
+                          traceback.format_exc())
+                try:
+                    os.rename(file_name, file_name + '.bad')  # not read again on next start
+                except OSError:
+                    pass
+                continue
+            for record in records:
+                store.append(record)
+            store.flush()
+            os.remove(file_name)  # removed only after its records are written to the store
+    return store
+
+
+def raw_record(record):
+    """Return log record from record of older version with formatted values ('23.4 V')."""
+    if 'timestamp' in record:
+        timestamp = record['timestamp']
+    else:
+        timestamp = int(time.mktime(time.strptime(record['datetime'], '%Y-%m-%d %H:%M:%S')))
+    values = [timestamp, min(65535, record.get('samples', 1))]
+    for i in range(4):
+        raw = calibration.inverse(_tables[i], float(record['ad%d' % i].split()[0]))
+        values += [raw, raw, int(raw * FIXED_POINT), 0]
+    return values
+
+
+def format_record(record):
+    """Return dictionary of formatted values from log record."""
+    result = {'timestamp': record[0],
+              'datetime': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record[0])),
+              'samples': record[1]}
     for i in range(4):
-        data['ad%d' % i] = format(status['ad%d' % i], pcf_options['ad%d_temp' % i])
-    log_data.insert(0, data)
-    if pcf_options['log_records'] > 0:
-        log_data = log_data[:pcf_options['log_records']]
-    write_log(log_data)
+        minimum, maximum, mean, stddev = record[2 + i * 4:6 + i * 4]
+        values = get_values(i, minimum, maximum, mean / FIXED_POINT, stddev / FIXED_POINT)
+        for key, value in zip(('ad%d_min', 'ad%d_max', 'ad%d_mean', 'ad%d_stddev'), values):
+            result[key % i] = value
+        result['ad%d' % i] = format(values[2], get_unit(i))
+    return result
+
+
+def iter_log(start=None, end=None, limit=0):
+    """Yield formatted log records newest first with timestamp from start to end (at most limit records)."""
+    for record in get_log_store().records(limit if start is None and end is None else 0):
+        if start is not None and record[0] < start:
+            return  # records are newest first
+        if end is not None and record[0] > end:
+            continue
+        yield format_record(record)
+        limit -= 1
+        if limit == 0:
+            return
+
+
+def query_int(qdict, key):
+    """Return non negative integer parameter of web query or None, raises ValueError if it is not a number."""
+    value = qdict.get(key)
+    if not value:
+        return None
+    try:
+        return max(0, int(value))
+    except ValueError:
+        raise ValueError('Parameter %s must be an integer.' % key)
+
+
+def web_log_records():
+    """Return log records iterator for web query ?from=timestamp&to=timestamp&limit=number,
+    raises ValueError if the query is wrong."""
+    qdict = web.input()
+    start = query_int(qdict, 'from')
+    end = query_int(qdict, 'to')
+    if start is not None and end is not None and start > end:
+        raise ValueError('Parameter from must not be after to.')
+    return iter_log(start, end, query_int(qdict, 'limit') or 0)
+
+
+_last_log_time = None  # timestamp of newest record, records are kept in time order for iter_log
+
+
+def update_log(aggregates):
+    global _last_log_time
+    if _last_log_time is None:
+        newest = next(iter(get_log_store().records(1)), None)
+        _last_log_time = newest[0] if newest is not None else 0
+    _last_log_time = max(int(time.time()), _last_log_time)  # after clock step back the time of newest record
+    values = [_last_log_time, min(65535, aggregates[0].count)]
+    for aggregate in aggregates:
+        values += [aggregate.minimum, aggregate.maximum, int(round(aggregate.mean * FIXED_POINT)),
+                   int(round(aggregate.stddev() * FIXED_POINT))]
+    get_log_store().append(values)
 
 
 ################################################################################
@@ -205,13 +604,15 @@ class settings_page(ProtectedPage):
     """Load an html page for entering pcf adjustments."""
 
     def GET(self):
-        return self.plugin_render.volt_temp_da(pcf_options, pcf_sender.status, log.events(NAME))
+        return self.plugin_render.volt_temp_da(pcf_options, pcf_sender.status, log.events(NAME), calibration.PROFILES)
 
     def POST(self):
         pcf_options.web_update(web.input())
 
         if pcf_sender is not None:
             pcf_sender.update()                
+        if control_sender is not None:
+            control_sender.update()
         raise web.seeother(plugin_url(settings_page), True)
 
 
@@ -224,40 +625,85 @@ class settings_json(ProtectedPage):
         return json.dumps(pcf_options)
 
 
-class log_json(ProtectedPage):
-    """Returns plugin settings in JSON format."""
+class control_json(ProtectedPage):
+    """Returns state and timing statistics of D/A control loop in JSON format."""
 
     def GET(self):
         web.header('Access-Control-Allow-Origin', '*')
         web.header('Content-Type', 'application/json')
-        return json.dumps(read_log())
+        result = {'mode': 'off'}
+        if control_sender is not None:
+            result = dict(control_sender.status)
+            if control_sender.stats is not None:
+                result['timing'] = control_sender.stats.as_dict()
+        return json.dumps(result)
 
 
-class log_csv(ProtectedPage):  # save log file from web as csv file type
-    """Simple PCF Log API"""
+class alerts_json(ProtectedPage):
+    """Returns alert rules with their state in JSON format."""
 
     def GET(self):
-        log_records = read_log()
-        data = "Date/Time"
-        for i in range(4):
-            data += ";\t" + pcf_options['ad%d_label' % i]
-        data += '\n'
+        web.header('Access-Control-Allow-Origin', '*')
+        web.header('Content-Type', 'application/json')
+        return json.dumps(pcf_sender.alerts.status() if pcf_sender is not None else [])
 
-        for record in log_records:
-            data += record['datetime']
-            for i in range(4):
-                data += ",\t" + record['ad%d' % i]
-            data += '\n'
 
+class log_json(ProtectedPage):
+    """Returns log records in JSON format (streamed): ?from=timestamp&to=timestamp&limit=number"""
+
+    def GET(self):
+        web.header('Access-Control-Allow-Origin', '*')
+        web.header('Content-Type', 'application/json')
+        try:
+            records = web_log_records()
+        except ValueError as error:
+            web.ctx.status = '400 Bad Request'
+            yield json.dumps({'error': str(error)})
+            return
+        chunk = ['[']
+        separator = ''
+        for record in records:
+            chunk.append(separator + json.dumps(record))
+            separator = ','
+            if len(chunk) >= 100:
+                yield ''.join(chunk)
+                chunk = []
+        chunk.append(']')
+        yield ''.join(chunk)
+
+
+class log_csv(ProtectedPage):  # save log file from web as csv file type
+    """Simple PCF Log API (streamed): ?from=timestamp&to=timestamp&limit=number"""
+
+    def GET(self):
+        try:
+            records = web_log_records()
+        except ValueError as error:
+            web.ctx.status = '400 Bad Request'
+            web.header('Content-Type', 'text/plain')
+            yield str(error)
+            return
         web.header('Content-Type', 'text/csv')
-        return data
+        columns = [('ad%d' % i, pcf_options['ad%d_label' % i]) for i in range(4)]
+        columns += [('ad%d_%s' % (i, key), pcf_options['ad%d_label' % i] + ' ' + key)
+                    for i in range(4) for key in ('min', 'max', 'stddev')]
+        chunk = ['Date/Time' + ''.join(';\t' + label for key, label in columns) + ';\tSamples\n']
+        for record in records:
+            chunk.append(record['datetime'] + ''.join(',\t%s' % record[key] for key, label in columns) +
+                         ',\t%s\n' % record['samples'])
+            if len(chunk) >= 100:
+                yield ''.join(chunk)
+                chunk = []
+        yield ''.join(chunk)
 
 
 class delete_log_page(ProtectedPage):  # delete log file from web
     """Delete all pcflog log_records"""
 
     def GET(self):
-        write_log([])
+        global _last_log_time
+        get_log_store().clear()
+        _last_log_time = None
         log.info(NAME, 'Deleted log file')
         raise web.seeother(plugin_url(settings_page), True)
 
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# Alert rules of inputs evaluated on every sample. Edges (thresholds with hysteresis) of all rules of one signal
+# are sorted, a sample which stays between the same two edges as the previous one is done by two comparisons,
+# only rules with an edge between previous and new value are evaluated. Cost per sample does not depend on number of rules.
+#
+# Rule (one per line): <input 0-3> <above|below|rise|fall> <threshold> [hysteresis=<value>] [for=<seconds>] <actions>
+# rise and fall thresholds are change per minute, actions: stop (all stations), da=<0-255>, notify.
+# Example: 0 above 30 hysteresis=2 for=60 stop notify
+
+import heapq
+from bisect import bisect_right
+from collections import deque
+
+CONDITIONS = ('above', 'below', 'rise', 'fall')
+RATE_SAMPLES = 60  # rate of change is computed from values of last minute (one per second)
+
+
+class Rule(object):
+    """Condition with hysteresis: active from value >= on edge (above) until value < off edge."""
+
+    def __init__(self, channel, condition, threshold, hysteresis=0.0, seconds=0.0, actions=('notify',), text=''):
+        if condition not in CONDITIONS:
+            raise ValueError('Unknown condition: %s' % condition)
+        self.channel = channel
+        self.condition = condition
+        self.threshold = threshold
+        self.hysteresis = abs(hysteresis)
+        self.seconds = seconds
+        self.actions = tuple(actions)
+        self.text = text
+        self.rising = condition in ('above', 'rise')
+        self.rate = condition in ('rise', 'fall')
+        on = -threshold if condition == 'fall' else threshold
+        self.on_edge = on
+        self.off_edge = on - self.hysteresis if self.rising else on + self.hysteresis
+        self.active = False     # condition is true
+        self.fired = False      # actions were done
+        self.deadline = None    # actions are done at this time if condition is still true
+
+    def update(self, value):
+        """Update state from value, returns True if state was changed."""
+        if self.rising:
+            active = value >= self.on_edge if not self.active else value >= self.off_edge
+        else:
+            active = value < self.on_edge if not self.active else value < self.off_edge
+        changed = active != self.active
+        self.active = active
+        return changed
+
+    def da_value(self):
+        """Return D/A value of action da=<value> or None."""
+        for action in self.actions:
+            if action.startswith('da='):
+                return int(action[3:])
+        return None
+
+    def as_dict(self):
+        return {'rule': self.text, 'active': self.active, 'fired': self.fired}
+
+
+def parse_rule(text):
+    tokens = text.split()
+    if len(tokens) < 3:
+        raise ValueError('Rule needs input, condition and threshold: %s' % text)
+    channel = int(tokens[0])
+    if not 0 <= channel <= 3:
+        raise ValueError('Input must be 0-3: %s' % text)
+    options = {'hysteresis': 0.0, 'for': 0.0}
+    actions = []
+    for token in tokens[3:]:
+        key, _, value = token.partition('=')
+        if key in options:
+            options[key] = float(value)
+        elif key == 'da' and 0 <= int(value) <= 255:
+            actions.append(token)
+        elif token in ('stop', 'notify'):
+            actions.append(token)
+        else:
+            raise ValueError('Unknown action: %s' % token)
+    return Rule(channel, tokens[1], float(tokens[2]), options['hysteresis'], options['for'], actions or ['notify'], text)
+
+
+def parse_rules(text):
+    """Return list of rules from text with one rule per line (empty lines and lines starting by # are skipped)."""
+    rules = []
+    for number, line in enumerate(text.splitlines()):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            try:
+                rules.append(parse_rule(line))
+            except ValueError as error:
+                raise ValueError('Rule on line %d: %s' % (number + 1, error))
+    return rules
+
+
+class EdgeSet(object):
+    """Sorted edges of rules of one signal and interval of the last value."""
+
+    def __init__(self, rules):
+        edges = sorted([(rule.on_edge, index, rule) for index, rule in enumerate(rules)] +
+                       [(rule.off_edge, index, rule) for index, rule in enumerate(rules)], key=lambda edge: edge[:2])
+        self.values = [edge[0] for edge in edges]
+        self.rules = [edge[2] for edge in edges]
+        self.all_rules = list(rules)
+        self.position = None
+        self.low = self.high = None
+
+    def crossed(self, value):
+        """Return rules with an edge between previous and this value (all rules for the first value)."""
+        if self.position is not None and self.low <= value < self.high:
+            return ()
+        position = bisect_right(self.values, value)
+        if self.position is None:
+            result = self.all_rules
+        else:
+            result = []
+            for rule in self.rules[min(position, self.position):max(position, self.position)]:
+                if rule not in result:
+                    result.append(rule)
+        self.position = position
+        self.low = self.values[position - 1] if position > 0 else float('-inf')
+        self.high = self.values[position] if position < len(self.values) else float('inf')
+        return result
+
+
+class AlertEngine(object):
+    """Evaluates rules of 4 inputs, action(rule, active) is called when rule fires (after for=seconds) and clears."""
+
+    def __init__(self, rules, action):
+        self.rules = list(rules)
+        self.action = action
+        self._values = [EdgeSet([rule for rule in rules if rule.channel == i and not rule.rate]) for i in range(4)]
+        self._rates = [EdgeSet([rule for rule in rules if rule.channel == i and rule.rate]) for i in range(4)]
+        self._history = [deque(maxlen=RATE_SAMPLES) if self._rates[i].values else None for i in range(4)]
+        self._deadlines = []  # heap of (time, sequence number, rule)
+        self._sequence = 0
+        self.rates = [None] * 4
+
+    def add(self, channel, value, now):
+        """Evaluate rules of input with new value at monotonic time now."""
+        for rule in self._values[channel].crossed(value):
+            self._update(rule, value, now)
+        history = self._history[channel]
+        if history is not None and (not history or now - history[-1][0] >= 1.0):
+            if len(history) == history.maxlen:
+                then, old_value = history[0]
+                self.rates[channel] = (value - old_value) * 60.0 / (now - then)
+                for rule in self._rates[channel].crossed(self.rates[channel]):
+                    self._update(rule, self.rates[channel], now)
+            history.append((now, value))
+        self.check(now)
+
+    def _update(self, rule, value, now):
+        if not rule.update(value):
+            return
+        if rule.active:
+            rule.deadline = now + rule.seconds
+            self._sequence += 1
+            heapq.heappush(self._deadlines, (rule.deadline, self._sequence, rule))
+        else:
+            rule.deadline = None
+            if rule.fired:
+                rule.fired = False
+                self.action(rule, False)
+
+    def check(self, now):
+        """Fire rules which are active for the required time."""
+        while self._deadlines and self._deadlines[0][0] <= now:
+            deadline, _, rule = heapq.heappop(self._deadlines)
+            if rule.active and rule.deadline == deadline and not rule.fired:
+                rule.fired = True
+                self.action(rule, True)
+
+    def status(self):
+        return [rule.as_dict() for rule in self.rules]
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# Calibration profiles of A/D inputs. A profile with its parameters is compiled to a lookup table of 256 values
+# when settings are changed, conversion of raw 8 bit sample is then only one index to the table.
+
+import math
+
+PROFILES = (
+    # (name, description, unit, parameters)
+    ('voltage', 'Voltage', 'V', ''),
+    ('lm35', 'Temperature LM35', u'\u2103', ''),
+    ('linear', 'Linear', None, 'gain, offset'),
+    ('polynomial', 'Polynomial', None, 'c0, c1, c2, ...'),
+    ('beta', 'Thermistor Beta', u'\u2103', 'R25, beta, series resistor'),
+    ('steinhart', 'Thermistor Steinhart-Hart', u'\u2103', 'A, B, C, series resistor'),
+)
+PROFILE_NAMES = [profile[0] for profile in PROFILES]
+KELVIN = 273.15
+
+
+def parse_params(text):
+    """Return list of numbers from comma separated text."""
+    return [float(value) for value in text.replace(';', ',').split(',') if value.strip()]
+
+
+def _thermistor_resistance(volt, supply, series):
+    """Thermistor to ground, series resistor to supply."""
+    return series * volt / (supply - volt)
+
+
+def _converter(profile, params, supply):
+    """Return function converting voltage on input to value."""
+    if profile == 'voltage':
+        return lambda volt: volt
+    if profile == 'lm35':
+        return lambda volt: volt * 100.0 + 10  # 10 mV per degree
+    if profile == 'linear':
+        gain, offset = params
+        return lambda volt: gain * volt + offset
+    if profile == 'polynomial':
+        if not params:
+            raise ValueError('Polynomial needs at least one coefficient.')
+        return lambda volt: sum(coefficient * volt ** power for power, coefficient in enumerate(params))
+    if profile == 'beta':
+        r25, beta, series = params
+
+        def beta_temp(volt):
+            resistance = _thermistor_resistance(volt, supply, series)
+            return 1.0 / (1.0 / (25 + KELVIN) + math.log(resistance / r25) / beta) - KELVIN
+        return beta_temp
+    if profile == 'steinhart':
+        a, b, c, series = params
+
+        def steinhart_temp(volt):
+            log_r = math.log(_thermistor_resistance(volt, supply, series))
+            return 1.0 / (a + b * log_r + c * log_r ** 3) - KELVIN
+        return steinhart_temp
+    raise ValueError('Unknown calibration profile: %s' % profile)
+
+
+def compile_table(profile, params, supply):
+    """Return list of 256 values for raw samples 0-255. Raises ValueError for wrong parameters."""
+    convert = _converter(profile, params, float(supply))
+    table = []
+    try:
+        for raw in range(256):
+            if profile in ('beta', 'steinhart'):
+                raw = min(254, max(1, raw))  # resistance of thermistor is 0 or infinite at the ends of range
+            table.append(float(convert(raw / 255.0 * supply)))
+    except ArithmeticError as error:
+        raise ValueError('Calibration can not be computed: %s' % error)
+    return table
+
+
+def unit(profile):
+    """Return unit of profile (None for profiles with unit given by user)."""
+    return dict((name, profile_unit) for name, _, profile_unit, _ in PROFILES).get(profile)
+
+
+def interpolate(table, raw):
+    """Return value of fractional raw sample (mean) by linear interpolation of table."""
+    index = min(254, max(0, int(raw)))
+    return table[index] + (table[index + 1] - table[index]) * (raw - index)
+
+
+def slope(table, raw):
+    """Return change of value per one raw step at raw sample (for standard deviation)."""
+    index = min(254, max(0, int(raw)))
+    return abs(table[index + 1] - table[index])
+
+
+def inverse(table, value):
+    """Return raw sample 0-255 with value nearest to value."""
+    return min(range(256), key=lambda raw: abs(table[raw] - value))
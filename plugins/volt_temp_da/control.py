@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# Closed loop control of D/A output from one A/D input: PID or bang-bang controller
+# and timing statistics of the control loop (period, jitter of wake up and execution time).
+
+from .sampler import Aggregate
+
+MODES = ('off', 'pid', 'bangbang')
+
+
+class PID(object):
+    """PID controller with output limits, integral is stopped at limits (anti-windup).
+    Reverse controller (cooling) raises output when value is over setpoint, direction applies to all terms."""
+
+    def __init__(self, kp, ki, kd, output_min=0.0, output_max=255.0, reverse=False):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.output_min = output_min
+        self.output_max = output_max
+        self.direction = -1.0 if reverse else 1.0
+        self.reset()
+
+    def reset(self):
+        self._integral = 0.0
+        self._last_value = None
+
+    def update(self, setpoint, value, dt):
+        """Return output from setpoint, measured value and time dt from last update in seconds."""
+        error = self.direction * (setpoint - value)
+        derivative = 0.0
+        if self._last_value is not None and dt > 0:
+            # derivative of measurement (no kick on setpoint change) in the same direction as error
+            derivative = -self.direction * (value - self._last_value) / dt
+        self._last_value = value
+        integral = self._integral + error * dt
+        output = self.kp * error + self.ki * integral + self.kd * derivative
+        if self.output_min < output < self.output_max or (output >= self.output_max and error < 0) or \
+                (output <= self.output_min and error > 0):
+            self._integral = integral
+        return min(self.output_max, max(self.output_min, output))
+
+
+class BangBang(object):
+    """On/off controller: maximum output when error > hysteresis, minimum output when error < -hysteresis.
+    Error is setpoint - value, or value - setpoint for reverse controller."""
+
+    def __init__(self, hysteresis, output_min=0.0, output_max=255.0, reverse=False):
+        self.hysteresis = abs(hysteresis)
+        self.output_min = output_min
+        self.output_max = output_max
+        self.direction = -1.0 if reverse else 1.0
+        self.reset()
+
+    def reset(self):
+        self._on = False
+
+    def update(self, setpoint, value, dt):
+        error = self.direction * (setpoint - value)
+        if error > self.hysteresis:
+            self._on = True
+        elif error < -self.hysteresis:
+            self._on = False
+        return self.output_max if self._on else self.output_min
+
+
+class LoopStats(object):
+    """Timing of control loop iterations (in seconds)."""
+
+    def __init__(self, period):
+        self.period = period
+        self.intervals = Aggregate()   # time between two wake ups
+        self.jitter = Aggregate()      # wake up later than scheduled
+        self.execution = Aggregate()   # read input, compute and write output
+        self.overruns = 0              # iterations which did not finish before next scheduled time
+        self._last_wake = None
+
+    def add(self, scheduled, woke, done):
+        if self._last_wake is not None:
+            self.intervals.add(woke - self._last_wake)
+        self._last_wake = woke
+        self.jitter.add(max(0.0, woke - scheduled))
+        self.execution.add(done - woke)
+        if done > scheduled + self.period:
+            self.overruns += 1
+
+    def as_dict(self):
+        """Return statistics in milliseconds."""
+        def milliseconds(aggregate):
+            if not aggregate.count:
+                return {}
+            return {'mean': round(aggregate.mean * 1000, 3), 'stddev': round(aggregate.stddev() * 1000, 3),
+                    'min': round(aggregate.minimum * 1000, 3), 'max': round(aggregate.maximum * 1000, 3)}
+
+        mean_interval = self.intervals.mean if self.intervals.count else 0.0
+        return {'target_rate': round(1.0 / self.period, 2),
+                'rate': round(1.0 / mean_interval, 2) if mean_interval > 0 else 0.0,
+                'iterations': self.execution.count,
+                'overruns': self.overruns,
+                'interval_ms': milliseconds(self.intervals),
+                'jitter_ms': milliseconds(self.jitter),
+                'execution_ms': milliseconds(self.execution)}
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# Append only log of fixed size binary records split to segment files of SEGMENT_RECORDS records.
+# Appending never rewrites history, retention deletes whole oldest segments when there are more than max_records.
+
+import os
+import threading
+
+SEGMENT_RECORDS = 1000
+EXTENSION = '.dat'
+
+
+class LogStore(object):
+    """Records (tuples packed by struct record) in files <path>/<segment number>.dat, the newest segment is open for appending."""
+
+    def __init__(self, path, record, max_records=0, fsync_records=1):
+        self.path = path
+        self.record = record                # struct.Struct of one record
+        self.max_records = max_records      # 0 = unlimited
+        self.fsync_records = fsync_records  # fsync after this number of records
+        self._lock = threading.Lock()
+        self._file = None
+        self._unsynced = 0
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._segments = self._find_segments()
+        self._last_count = self._count_records(self._segments[-1]) if self._segments else 0
+
+    def _find_segments(self):
+        result = []
+        for file_name in os.listdir(self.path):
+            if file_name.endswith(EXTENSION):
+                try:
+                    result.append(int(file_name[:-len(EXTENSION)]))
+                except ValueError:
+                    pass
+        return sorted(result)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, '%08d%s' % (segment, EXTENSION))
+
+    def _count_records(self, segment):
+        """Return number of records in segment, incomplete last record (after power loss) is removed."""
+        segment_path = self._segment_path(segment)
+        count, rest = divmod(os.path.getsize(segment_path), self.record.size)
+        if rest:
+            with open(segment_path, 'r+b') as segment_file:
+                segment_file.truncate(count * self.record.size)
+        return count
+
+    def __len__(self):
+        if not self._segments:
+            return 0
+        return (len(self._segments) - 1) * SEGMENT_RECORDS + self._last_count
+
+    def append(self, values):
+        """Append record (tuple of values) in O(1)."""
+        data = self.record.pack(*values)
+        with self._lock:
+            if not self._segments or self._last_count >= SEGMENT_RECORDS:
+                self._close()
+                self._segments.append(self._segments[-1] + 1 if self._segments else 0)
+                self._last_count = 0
+                self._apply_retention()
+            if self._file is None:
+                self._file = open(self._segment_path(self._segments[-1]), 'ab')
+            self._file.write(data)
+            self._file.flush()
+            self._last_count += 1
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_records:
+                self._sync()
+
+    def _sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def _close(self):
+        if self._file is not None:
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def _apply_retention(self):
+        """Delete oldest segments which are not needed for last max_records records."""
+        if self.max_records > 0:
+            while len(self._segments) > 1 and len(self) - SEGMENT_RECORDS >= self.max_records:
+                os.remove(self._segment_path(self._segments.pop(0)))
+
+    def flush(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def clear(self):
+        """Delete all records."""
+        with self._lock:
+            self._close()
+            for segment in self._segments:
+                os.remove(self._segment_path(segment))
+            self._segments = []
+            self._last_count = 0
+
+    def records(self, limit=0):
+        """Yield records (tuples) newest first, at most limit (or max_records) records. Only one segment is in memory."""
+        if limit <= 0 or 0 < self.max_records < limit:
+            limit = self.max_records
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            segments = list(self._segments)
+        size = self.record.size
+        count = 0
+        for segment in reversed(segments):
+            try:
+                with open(self._segment_path(segment), 'rb') as segment_file:
+                    data = segment_file.read()
+            except IOError:
+                continue  # deleted by retention meanwhile
+            for offset in range(len(data) - len(data) % size - size, -1, -size):
+                if limit > 0 and count >= limit:
+                    return
+                count += 1
+                yield self.record.unpack_from(data, offset)
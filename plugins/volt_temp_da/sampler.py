@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# High rate sampling of PCF8591: all four A/D channels are read by one auto-increment block read
+# and aggregated over the log interval to min/max/mean/standard deviation in constant memory.
+
+import math
+
+ADDRESS = 0x48
+CONTROL = 0x44  # analog output enabled, auto-increment, channel 0
+CHANNELS = 4
+
+
+def read_channels(bus, address=ADDRESS):
+    """Return list of 4 numbers 0-255 (channel 0-3) read by one block read."""
+    # PCF8591 sends the result of previous conversion first, this byte is dropped
+    return bus.read_i2c_block_data(address, CONTROL, CHANNELS + 1)[1:]
+
+
+class Aggregate(object):
+    """Minimum, maximum, mean and standard deviation of samples (Welford's online algorithm)."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.count = 0
+        self.minimum = None
+        self.maximum = None
+        self.mean = 0.0
+        self._m2 = 0.0  # sum of squared differences from mean
+
+    def add(self, value):
+        self.count += 1
+        if self.count == 1:
+            self.minimum = self.maximum = value
+        elif value < self.minimum:
+            self.minimum = value
+        elif value > self.maximum:
+            self.maximum = value
+        delta = value - self.mean
+        self.mean += delta / float(self.count)
+        self._m2 += delta * (value - self.mean)
+
+    def stddev(self):
+        """Return population standard deviation."""
+        return math.sqrt(self._m2 / self.count) if self.count else 0.0
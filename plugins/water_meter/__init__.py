@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # This plugin read data from I2C counter PCF8583 on I2C address 0x50. Max count PCF8583 is 1 milion pulses per seconds
+# The counter is never reset while running, every tick only reads the actual count and computes difference (see pcf8583.py).
 
 import json
+import os
 import time
 import traceback
 
@@ -10,20 +12,38 @@ from threading import Thread, Event
 import web
 
 from ospy.log import log
-from plugins import PluginOptions, plugin_url
+from ospy.stations import stations
+from plugins import PluginOptions, plugin_url, plugin_data_dir
 from ospy.webpages import ProtectedPage
 from ospy.helpers import get_rpi_revision
+from ospy.helpers import datetime_string
+from plugins.shared import i2c_bus  # shared I2C bus manager
+from plugins.shared import pcf8583  # PCF8583 event counter driver
+from . import series   # time series store with minute/hour/day rollups
+from . import totalizer  # crash safe journal of water summary
+from . import analytics  # leak and continuous flow detection
+from . import attribution  # consumption per station and program
+from plugins.shared.station_state import active_stations  # shared index of active stations
+from plugins.shared import shutdown_hooks  # flush before shutdown by UPS plug-in
 
 
 NAME = 'Water Meter'
 LINK = 'settings_page'
+STORAGE_ERROR_INTERVAL = 3600  # seconds, repeated storage error is logged once per hour
 
 options = PluginOptions(
     NAME,
     {'enabled': False,
      'pulses': 10.0,
      'address': False, # True = 0x51, False = 0x50 for PCF8583
-     'sum': 0
+     'sum': 0,
+     'retention': 30,  # days of raw (per second) samples in history
+     'flush_interval': 300,  # save water summary to journal at least every 5 minutes (less writes to SD card)
+     'flush_volume': 100.0,  # or after 100 liters
+     'leak_flow': 0.0,      # l/s minimal night flow for leak event, 0 = not used
+     'night_start': 2,      # night for minimal night flow from 2:00
+     'night_end': 4,        # to 4:00
+     'sendeml': False       # send email with flow events
     }
 )
 
@@ -42,6 +62,13 @@ class WaterSender(Thread):
         self.pcf = None
         self.status = {}
         self.status['meter'] = 0.0
+        self.status['events'] = []
+        self.series = None
+        self.totalizer = None
+        self.attribution = None
+        self._reset_sum = False
+        self._sum_water = None      # actual water summary for flush without journal
+        self._storage_error_time = None  # time of last logged storage error
 
         self._sleep_time = 0
         self.start()
@@ -51,6 +78,26 @@ class WaterSender(Thread):
 
     def update(self):
         self._sleep_time = 0
+        if self.totalizer is not None:
+            self.totalizer.flush_interval = options['flush_interval']
+            self.totalizer.flush_volume = options['flush_volume']
+
+    def reset_sum(self):
+        if self.totalizer is not None:
+            self.totalizer.set(0)
+        self._reset_sum = True
+
+    def flush(self):
+        """Write summary, history and consumption to files (shutdown hook of UPS plug-in)."""
+        if self.series is not None:
+            self.series.flush()
+        if self.attribution is not None:
+            self.attribution.save()
+        if self.totalizer is not None:
+            self.totalizer.flush()
+            options.__setitem__('sum', self.totalizer.total)
+        elif self._sum_water is not None:
+            options.__setitem__('sum', self._sum_water)
 
     def _sleep(self, secs):
         self._sleep_time = secs
@@ -58,36 +105,84 @@ class WaterSender(Thread):
             time.sleep(1)
             self._sleep_time -= 1
 
-    def run(self):
+    def _store(self, function, *args):
+        """Call storage function, error of disk (full SD card, permissions) is logged and counting continues.
+        The same error is logged at most once per STORAGE_ERROR_INTERVAL. Returns result or None on error."""
         try:
-            import smbus  # for PCF 8583
+            return function(*args)
+        except Exception:
+            now = time.time()
+            if self._storage_error_time is None or abs(now - self._storage_error_time) >= STORAGE_ERROR_INTERVAL:
+                self._storage_error_time = now
+                log.error(NAME, 'Water Meter plug-in: storage error:\n' + traceback.format_exc())
+            return None
+
+    def check_events(self):
+        """Analyze last day of history and report new leak/continuous flow events."""
+        if not analytics.available():
+            return
+        end = int(time.time())
+        result = analytics.analyze(self.series, end - 86400, end, night_start=options['night_start'],
+                                   night_end=options['night_end'])
+        events = analytics.events(result, options['leak_flow'])
+        active = set(event for event, message in self.status['events'])
+        for event, message in events.items():
+            if event not in active:                     # report only crossing of threshold
+                log.warning(NAME, message)
+                if options['sendeml']:
+                    send_email(message)
+        self.status['events'] = sorted(events.items())
 
-            self.bus = smbus.SMBus(1 if get_rpi_revision() >= 2 else 0)
+    def run(self):
+        try:
+            self.bus = i2c_bus.get_bus(1 if get_rpi_revision() >= 2 else 0)  # for PCF 8583
         except ImportError:
             log.warning(NAME, 'Could not import smbus.')
 
         if self.bus is not None:
             self.pcf = set_counter(self.bus)     # set pcf8583 as counter
 
+        try:
+            self.series = series.TimeSeries(os.path.join(plugin_data_dir(), 'series'), options['retention'])
+        except Exception:
+            log.error(NAME, 'Water Meter plug-in:\n' + 'Could not open history - ' + traceback.format_exc())
+
+        try:
+            self.totalizer = totalizer.Totalizer(os.path.join(plugin_data_dir(), 'summary.bin'), options['sum'],
+                                                 flush_interval=options['flush_interval'],
+                                                 flush_volume=options['flush_volume'])
+        except Exception:
+            log.error(NAME, 'Water Meter plug-in:\n' + 'Could not open summary journal - ' + traceback.format_exc())
+
+        try:
+            self.attribution = attribution.Attribution(os.path.join(plugin_data_dir(), 'consumption.json'))
+        except Exception:
+            log.error(NAME, 'Water Meter plug-in:\n' + 'Could not open consumption - ' + traceback.format_exc())
+
         log.clear(NAME)
         once_text = True  # text enabled plugin
         two_text = True   # text disabled plugin
 
         val = 0                     # actual water per second
         sum_water = options['sum']  # saved value of summary water 
+        if self.totalizer is not None:
+            sum_water = self.totalizer.total  # last value from journal is newer than options
         minute_water = 0            # actual water per minutes
         hour_water = 0              # actual water per hours
 
         last_minute_time = int(time.time())
         last_hour_time = int(time.time())
+        last_save_time = int(time.time())
+        last_attribution_time = int(time.time())
         actual_time = int(time.time())
 
         while not self._stop_event.is_set():
             try:
-                if self.bus is not None and options['enabled']:  # if water meter plugin is enabled
-                    val = counter(self.bus) / options['pulses']
-                    self.status['meter'] = val
+                if self._reset_sum:
+                    self._reset_sum = False
+                    sum_water = 0
 
+                if self.bus is not None and options['enabled']:  # if water meter plugin is enabled
                     if once_text:
                         log.clear(NAME)
                         log.info(NAME, 'Water Meter plug-in is enabled.')
@@ -100,11 +195,33 @@ class WaterSender(Thread):
                             log.info(NAME, '________________________________')
                             log.info(NAME, 'Water in liters')
                             log.info(NAME, 'Saved water summary: ' + str(sum_water))
+                            self.pcf.restart()                     # pulses counted while disabled are ignored
+
+                    if self.pcf is not None and self.pcf.address != pcf_address():  # address changed in settings
+                        self.pcf = set_counter(self.bus)
 
                     if self.pcf is not None:
-                        sum_water = sum_water + val
-                        minute_water = minute_water + val
-                        hour_water = hour_water + val
+                        pulses, elapsed = counter(self.pcf)
+                        liters = pulses / float(options['pulses'])
+                        if elapsed > 0:
+                            val = liters / elapsed
+                            self.status['meter'] = val
+
+                        # storage errors must not stop counting (bus is kept), they are logged by _store
+                        if self.series is not None:
+                            self._store(self.series.add, time.time(), liters)
+                        if self.attribution is not None and liters > 0:
+                            running_stations, running_programs = get_running()
+                            self._store(self.attribution.add, time.time(), liters, running_stations, running_programs)
+
+                        if self.totalizer is not None:
+                            self._store(self.totalizer.add, liters)  # journal is written by flush interval/volume
+                            sum_water = self.totalizer.total        # total is added also if journal is not written
+                        else:
+                            sum_water = sum_water + liters
+                        self._sum_water = sum_water
+                        minute_water = minute_water + liters
+                        hour_water = hour_water + liters
 
                         actual_time = int(time.time())
                         if actual_time - last_minute_time >= 60:          # minute counter
@@ -116,12 +233,26 @@ class WaterSender(Thread):
                             log.info(NAME, 'Water summary:     ' + str(sum_water))
                             minute_water = 0
 
+                        if self.attribution is not None and actual_time - last_attribution_time >= 600:
+                            last_attribution_time = actual_time
+                            self._store(self.attribution.save)        # save consumption per station every 10 minutes
+
+                        save_interval = 60 if self.totalizer is None else 86400
+                        if actual_time - last_save_time >= save_interval:
+                            last_save_time = actual_time
                             options.__setitem__('sum',
-                                                sum_water)          # save summary water to options only 1 minutes
+                                                sum_water)          # save summary water to options only 1 day (1 minute without journal)
 
                         if actual_time - last_hour_time >= 3600:          # hour counter
                             last_hour_time = actual_time
                             hour_water = 0
+                            if self.series is not None:
+                                self.series.retention_days = options['retention']
+                                self._store(self.series.prune)            # delete old raw samples
+                                try:
+                                    self.check_events()
+                                except Exception:
+                                    log.error(NAME, 'Water Meter plug-in:\n' + traceback.format_exc())
 
                 else:
                     if two_text:
@@ -138,6 +269,14 @@ class WaterSender(Thread):
                 log.error(NAME, 'Water Meter plug-in:\n' + traceback.format_exc())
                 self._sleep(60)
 
+        if self.series is not None:
+            self.series.flush()
+        if self.attribution is not None:
+            self.attribution.save()
+        if self.totalizer is not None:
+            self.totalizer.close()
+            options.__setitem__('sum', self.totalizer.total)
+
 
 water_sender = None
            
@@ -149,6 +288,7 @@ def start():
     global water_sender
     if water_sender is None:
         water_sender = WaterSender()
+    shutdown_hooks.register(NAME, flush_data, priority=50, timeout=5)  # called by UPS plug-in before shutdown
 
 
 def stop():
@@ -157,46 +297,76 @@ def stop():
         water_sender.stop()
         water_sender.join()
         water_sender = None
+    shutdown_hooks.unregister(NAME)
+
+
+def flush_data():
+    """Shutdown hook of UPS plug-in: write water summary and history to files."""
+    if water_sender is not None:
+        water_sender.flush()
+
+
+def reset_journal():
+    """Write zero water summary to journal if the sender is not running."""
+    try:
+        journal = totalizer.Totalizer(os.path.join(plugin_data_dir(), 'summary.bin'))
+        journal.set(0)
+        journal.close()
+    except Exception:
+        log.error(NAME, 'Water Meter plug-in:\n' + 'Could not reset summary journal - ' + traceback.format_exc())
+
+
+def send_email(msg):
+    """Send email"""
+    message = datetime_string() + ': ' + NAME + ' - ' + str(msg)
+    try:
+        from plugins.email_notifications import email
+        email(message)
+        log.info(NAME, 'Email was sent: ' + message)
+    except Exception as err:
+        log.error(NAME, 'Email was not sent! ' + str(err))
+
+
+def get_runs():
+    """Return [(station name, start timestamp, end timestamp)] of finished runs."""
+    result = []
+    for run in log.finished_runs():
+        if not run['blocked']:
+            result.append((stations.get(run['station']).name,
+                           time.mktime(run['start'].timetuple()),
+                           time.mktime(run['end'].timetuple())))
+    return result
+
+
+def get_running():
+    """Return (station names, program names) running now."""
+    running_stations = list(active_stations.names())
+    running_programs = sorted(set(run['program_name'] for run in log.active_runs()))
+    return running_stations, running_programs
+
+
+def pcf_address():
+    if options['address']:
+        return 0x51
+    else:
+        return 0x50
 
 def set_counter(i2cbus):
     try:
-        if options['address']:
-            pcf_addr = 0x51
-        else:
-            pcf_addr = 0x50 
-        i2cbus.write_byte_data(pcf_addr, 0x00, 0x20) # status registr setup to "EVENT COUNTER"
-        i2cbus.write_byte_data(pcf_addr, 0x01, 0x00) # reset LSB
-        i2cbus.write_byte_data(pcf_addr, 0x02, 0x00) # reset midle Byte
-        i2cbus.write_byte_data(pcf_addr, 0x03, 0x00) # reset MSB
+        pcf = pcf8583.PCF8583(i2cbus, pcf_address())
+        pcf.setup()                              # status registr setup to "EVENT COUNTER" and reset counter
         log.info(NAME, 'Setup PCF8583 as event counter is OK')
-        return 1  
+        return pcf
     except:
         log.error(NAME, 'Water Meter plug-in:\n' + 'Setup PCF8583 as event counter - FAULT')
         return None
 
-def counter(i2cbus): # reset PCF8583, measure pulses and return number pulses per second
+def counter(pcf): # return (pulses, seconds) from last reading of free running PCF8583
     try:
-        if options['address']:
-            pcf_addr = 0x51
-        else:
-            pcf_addr = 0x50 
-        # reset PCF8583
-        i2cbus.write_byte_data(pcf_addr, 0x01, 0x00) # reset LSB
-        i2cbus.write_byte_data(pcf_addr, 0x02, 0x00) # reset midle Byte
-        i2cbus.write_byte_data(pcf_addr, 0x03, 0x00) # reset MSB
-        time.sleep(1)
-        # read number (pulses in counter) and translate to DEC
-        counter = i2cbus.read_i2c_block_data(pcf_addr, 0x00)
-        num1 = (counter[1] & 0x0F)             # units
-        num10 = (counter[1] & 0xF0) >> 4       # dozens
-        num100 = (counter[2] & 0x0F)           # hundred
-        num1000 = (counter[2] & 0xF0) >> 4     # thousand
-        num10000 = (counter[3] & 0x0F)         # tens of thousands
-        num100000 = (counter[3] & 0xF0) >> 4   # hundreds of thousands
-        pulses = (num100000 * 100000) + (num10000 * 10000) + (num1000 * 1000) + (num100 * 100) + (num10 * 10) + num1
-        return pulses
+        return pcf.sample()
     except:
-        return 0
+        pcf.restart()
+        return 0, 0.0
 
 ################################################################################
 # Web pages:                                                                   #
@@ -222,6 +392,10 @@ class reset_page(ProtectedPage):
 
     def POST(self):
         options.__setitem__('sum', 0)
+        if water_sender is not None:
+            water_sender.reset_sum()
+        else:
+            reset_journal()  # journal is newer than options on next start
         log.clear(NAME)
         log.info(NAME, 'Water summary was reseting...')
         log.info(NAME, 'Water in liters')
@@ -240,3 +414,96 @@ class settings_json(ProtectedPage):
         web.header('Access-Control-Allow-Origin', '*')
         web.header('Content-Type', 'application/json')
         return json.dumps(options)
+
+
+def query_int(qdict, key, default, minimum=0, maximum=2 ** 32 - 1):
+    """Return integer parameter of web query limited to minimum..maximum, raises ValueError if it is not a number."""
+    value = qdict.get(key)
+    if not value:
+        return int(default)
+    try:
+        return min(maximum, max(minimum, int(value)))
+    except ValueError:
+        raise ValueError('Parameter %s must be an integer.' % key)
+
+
+def query_range(qdict, seconds):
+    """Return (start, end) timestamps of web query ?from=timestamp&to=timestamp, default are last seconds."""
+    end = query_int(qdict, 'to', time.time())
+    start = query_int(qdict, 'from', max(0, end - seconds))
+    if start > end:
+        raise ValueError('Parameter from must not be after to.')
+    return start, end
+
+
+def bad_request(message):
+    """Return JSON error of wrong web query."""
+    web.ctx.status = '400 Bad Request'
+    return json.dumps({'error': message})
+
+
+class series_json(ProtectedPage):
+    """Returns water history in JSON format: ?level=raw|minute|hour|day&from=timestamp&to=timestamp"""
+
+    def GET(self):
+        qdict = web.input()
+        web.header('Access-Control-Allow-Origin', '*')
+        web.header('Content-Type', 'application/json')
+        try:
+            start, end = query_range(qdict, 7 * 86400)
+            level = qdict.get('level') or 'hour'
+            if level not in ('raw', 'minute', 'hour', 'day'):
+                raise ValueError('Unknown level: ' + level)
+        except ValueError as error:
+            yield bad_request(str(error))
+            return
+        records = water_sender.series.query(level, start, end) if water_sender is not None and \
+            water_sender.series is not None else []
+        yield '['                                                  # streamed in chunks, raw range can be long
+        separator = ''
+        lines = []
+        for record in records:
+            lines.append(separator + json.dumps(record))
+            separator = ','
+            if len(lines) >= 1000:
+                yield ''.join(lines)
+                lines = []
+        yield ''.join(lines) + ']'
+
+
+class analytics_json(ProtectedPage):
+    """Returns flow statistics in JSON format: ?from=timestamp&to=timestamp&window=seconds"""
+
+    def GET(self):
+        qdict = web.input()
+        web.header('Access-Control-Allow-Origin', '*')
+        web.header('Content-Type', 'application/json')
+        try:
+            start, end = query_range(qdict, 86400)
+            window = query_int(qdict, 'window', 300, minimum=1, maximum=86400)
+        except ValueError as error:
+            return bad_request(str(error))
+        if not analytics.available():
+            return json.dumps({'error': 'Could not import numpy.'})
+        if water_sender is None or water_sender.series is None:
+            return json.dumps({'error': 'History is not available.'})
+        result = analytics.analyze(water_sender.series, start, end, window,
+                                   options['night_start'], options['night_end'], get_runs())
+        result['events'] = analytics.events(result, options['leak_flow'])
+        return json.dumps(result)
+
+
+class consumption_json(ProtectedPage):
+    """Returns water consumption per station and program in JSON format: ?from=timestamp&to=timestamp (whole days)"""
+
+    def GET(self):
+        qdict = web.input()
+        web.header('Access-Control-Allow-Origin', '*')
+        web.header('Content-Type', 'application/json')
+        try:
+            start, end = query_range(qdict, 6 * 86400)
+        except ValueError as error:
+            return bad_request(str(error))
+        if water_sender is None or water_sender.attribution is None:
+            return json.dumps({'stations': {}, 'programs': {}})
+        return json.dumps(water_sender.attribution.query(start, end))
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# Flow analytics over per second water history (series.py) computed with NumPy array operations:
+# rolling mean/variance, minimal night flow (leak detection), continuous flow and flow per station run.
+
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+RAW_DTYPE = [('timestamp', '<u4'), ('liters', '<f4')]  # same layout as series.RECORD
+RAW_RANGE = 2 * 86400  # longer ranges are computed from minute sums (1/60 of data, a year is about 525000 records)
+
+
+def available():
+    return numpy is not None
+
+
+def load(level, start, end):
+    """Return (timestamps, liters) arrays of level records from start to end."""
+    arrays = [numpy.fromfile(file_name, dtype=RAW_DTYPE) for file_name in level.segment_files(start, end)]
+    if not arrays:
+        return numpy.zeros(0, numpy.uint32), numpy.zeros(0, numpy.float32)
+    data = numpy.concatenate(arrays) if len(arrays) > 1 else arrays[0]
+    timestamps = data['timestamp']
+    first = numpy.searchsorted(timestamps, start, 'left')
+    last = numpy.searchsorted(timestamps, end, 'right')
+    return timestamps[first:last], data['liters'][first:last]
+
+
+def flow_rates(timestamps, liters, resolution=1):
+    """Return liters per second of every sample (liters divided by seconds from previous sample)."""
+    seconds = numpy.empty(len(timestamps), numpy.float32)
+    seconds[:1] = resolution
+    if len(timestamps) > 1:
+        seconds[1:] = numpy.maximum(numpy.diff(timestamps), resolution)
+    return liters / seconds
+
+
+def rolling(values, window):
+    """Return (mean, variance) arrays of every window of samples (len(values) - window + 1 items)."""
+    window = max(1, min(int(window), len(values)))
+    sums = numpy.zeros(len(values) + 1)
+    squares = numpy.zeros(len(values) + 1)
+    numpy.cumsum(values, dtype=numpy.float64, out=sums[1:])
+    numpy.cumsum(numpy.square(values, dtype=numpy.float64), out=squares[1:])
+    mean = (sums[window:] - sums[:-window]) / window
+    variance = numpy.maximum((squares[window:] - squares[:-window]) / window - mean * mean, 0.0)
+    return mean, variance
+
+
+def night_minimum(timestamps, values, night_start, night_end, offsets):
+    """Return [(night start timestamp, minimal value between night_start and night_end hour)] of every night.
+    Offsets are local time offsets of timestamps (see utc_offsets)."""
+    if not len(timestamps):
+        return []
+    local = timestamps.astype(numpy.int64) + offsets
+    hours = (local % 86400) // 3600
+    if night_start <= night_end:
+        mask = (hours >= night_start) & (hours < night_end)
+    else:  # for example 22-4
+        mask = (hours >= night_start) | (hours < night_end)
+    if not mask.any():
+        return []
+    days = (local[mask] - night_start * 3600) // 86400  # night over midnight belongs to day of its start
+    days, index = numpy.unique(days, return_index=True)
+    minimums = numpy.minimum.reduceat(values[mask], index)
+    night_offsets = offsets[mask][index]
+    return [(int(day * 86400 + night_start * 3600 - offset), float(minimum))
+            for day, minimum, offset in zip(days, minimums, night_offsets)]
+
+
+def station_flow(timestamps, liters, runs):
+    """Return {station name: {'liters', 'seconds', 'flow'}} from runs [(name, start timestamp, end timestamp)]."""
+    sums = numpy.zeros(len(liters) + 1)
+    numpy.cumsum(liters, dtype=numpy.float64, out=sums[1:])
+    result = {}
+    if not len(timestamps) or not runs:
+        return result
+    names = [run[0] for run in runs]
+    starts = numpy.searchsorted(timestamps, numpy.array([run[1] for run in runs]), 'left')
+    ends = numpy.searchsorted(timestamps, numpy.array([run[2] for run in runs]), 'right')
+    volumes = sums[ends] - sums[starts]
+    for name, run, volume in zip(names, runs, volumes):
+        item = result.setdefault(name, {'liters': 0.0, 'seconds': 0.0, 'flow': 0.0})
+        item['liters'] += float(volume)
+        item['seconds'] += max(0.0, run[2] - run[1])
+    for item in result.values():
+        item['flow'] = item['liters'] / item['seconds'] if item['seconds'] > 0 else 0.0
+    return result
+
+
+def decimate(timestamps, values, points):
+    """Return at most points [(timestamp, value)] for charts."""
+    step = max(1, len(values) // max(1, points))
+    return [(int(timestamp), float(value)) for timestamp, value in zip(timestamps[::step], values[::step])]
+
+
+def utc_offset(timestamp=None):
+    """Return offset of local time in seconds."""
+    tm = time.localtime(timestamp)
+    return -(time.altzone if tm.tm_isdst > 0 else time.timezone)
+
+
+def utc_offsets(timestamps):
+    """Return array of local time offsets of sorted timestamps. Offset is read once per day, a change
+    (daylight saving time) is found by bisection, so a year needs about 400 localtime calls."""
+    offsets = numpy.empty(len(timestamps), numpy.int64)
+    if not len(timestamps):
+        return offsets
+    previous = int(timestamps[0])
+    offset = utc_offset(previous)
+    offsets[:] = offset
+    last = int(timestamps[-1])
+    while previous < last:
+        edge = min(previous + 86400, last)
+        new = utc_offset(edge)
+        if new != offset:
+            low, high = previous, edge  # offset changes after low, at latest in high
+            while high - low > 1:
+                middle = (low + high) // 2
+                if utc_offset(middle) == offset:
+                    low = middle
+                else:
+                    high = middle
+            offsets[numpy.searchsorted(timestamps, high, 'left'):] = new
+            offset = new
+        previous = edge
+    return offsets
+
+
+def analyze(series, start, end, window=300, night_start=2, night_end=4, runs=None, points=500):
+    """Return dictionary with flow statistics (in l/s) of water history from start to end."""
+    if end - start <= RAW_RANGE:
+        level, resolution = series.raw, 1
+    else:
+        level, resolution = series.level('minute'), 60
+    series.flush()
+    timestamps, liters = load(level, start, end)
+    result = {
+        'from': int(start),
+        'to': int(end),
+        'level': level.name,
+        'samples': int(len(timestamps)),
+        'liters': float(liters.sum(dtype=numpy.float64)) if len(liters) else 0.0,
+        'window': int(window),
+        'mean': 0.0,
+        'variance': 0.0,
+        'max_mean': 0.0,
+        'min_mean': 0.0,
+        'rolling_mean': [],
+        'night_minimum': [],
+        'stations': {},
+    }
+    if not len(timestamps):
+        return result
+
+    flow = flow_rates(timestamps, liters, resolution)
+    mean, variance = rolling(flow, max(1, window // resolution))
+    mean_timestamps = timestamps[len(timestamps) - len(mean):]
+    result.update({
+        'mean': float(mean[-1]),
+        'variance': float(variance[-1]),
+        'max_mean': float(mean.max()),
+        'min_mean': float(mean.min()),
+        'rolling_mean': decimate(mean_timestamps, mean, points),
+        'night_minimum': night_minimum(mean_timestamps, mean, night_start, night_end,
+                                       utc_offsets(mean_timestamps)),
+        'stations': station_flow(timestamps, liters, runs or []),
+    })
+    return result
+
+
+def events(result, leak_flow):
+    """Return {event key: message} for thresholds crossed in analyze() result."""
+    messages = {}
+    if leak_flow > 0 and result['night_minimum']:
+        day, minimum = result['night_minimum'][-1]
+        if minimum >= leak_flow:
+            messages['leak'] = 'Possible leak: minimal night flow %.3f l/s is over %.3f l/s.' % (minimum, leak_flow)
+    if result['samples'] and result['min_mean'] > 1e-6:  # rounding of rolling sums
+        messages['continuous'] = 'Water is flowing continuously: flow never dropped to zero (minimum %.3f l/s).' % \
+                                 result['min_mean']
+    return messages
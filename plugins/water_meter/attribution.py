@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# Water consumption per station and per program. Every sample is added to the stations and programs running at that time.
+# Totals are kept as cumulative sums per day, so consumption in any range of days is one subtraction per station.
+
+import datetime
+import json
+import os
+import threading
+
+NO_STATION = 'No station'
+NO_PROGRAM = 'No program'
+
+
+def day_number(timestamp):
+    """Return local day number of timestamp."""
+    return datetime.date.fromtimestamp(timestamp).toordinal()
+
+
+class Attribution(object):
+    """Cumulative daily totals {name: [liters up to first day, up to second day, ...]}."""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._lock = threading.Lock()
+        self.first_day = None
+        self.days = 0
+        self.stations = {}
+        self.programs = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.file_name) as data_file:
+                data = json.load(data_file)
+            self.first_day = data['first_day']
+            self.days = data['days']
+            self.stations = data['stations']
+            self.programs = data['programs']
+        except (IOError, ValueError, KeyError):
+            pass
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({'first_day': self.first_day, 'days': self.days,
+                               'stations': self.stations, 'programs': self.programs})
+        temp_name = self.file_name + '.tmp'
+        with open(temp_name, 'w') as data_file:
+            data_file.write(data)
+            data_file.flush()
+            os.fsync(data_file.fileno())
+        os.rename(temp_name, self.file_name)  # old file is replaced only by complete new file
+
+    def _extend(self, day):
+        """Add days (with cumulative values of last day) up to day."""
+        if self.first_day is None:
+            self.first_day = day
+        index = day - self.first_day
+        if index >= self.days:
+            for totals in (self.stations, self.programs):
+                for values in totals.values():
+                    last = values[-1] if values else 0.0
+                    values.extend([last] * (index + 1 - len(values)))
+            self.days = index + 1
+        return index
+
+    @staticmethod
+    def _add(totals, names, liters, index, days):
+        share = liters / len(names)
+        for name in names:
+            values = totals.get(name)
+            if values is None:
+                values = totals[name] = [0.0] * days
+            values[index] += share  # samples are added in time order, only last day changes
+
+    def add(self, timestamp, liters, stations, programs):
+        """Add liters measured at timestamp, divided equally to running stations and programs."""
+        if liters <= 0:
+            return
+        with self._lock:
+            index = max(self._extend(day_number(timestamp)), self.days - 1)  # after clock step back to last day
+            self._add(self.stations, stations or [NO_STATION], liters, index, self.days)
+            self._add(self.programs, programs or [NO_PROGRAM], liters, index, self.days)
+
+    def _total(self, values, index):
+        if index < 0 or not values:
+            return 0.0
+        return values[min(index, len(values) - 1)]
+
+    def query(self, start, end):
+        """Return {'stations': {name: liters}, 'programs': {name: liters}} of days from start to end timestamp."""
+        result = {'stations': {}, 'programs': {}}
+        with self._lock:
+            if self.first_day is None:
+                return result
+            first = day_number(start) - self.first_day
+            last = day_number(end) - self.first_day
+            for key, totals in (('stations', self.stations), ('programs', self.programs)):
+                for name, values in totals.items():
+                    liters = self._total(values, last) - self._total(values, first - 1)
+                    if liters > 0:
+                        result[key][name] = liters
+        return result
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# Append only time series store for water meter samples with minute, hour and day rollups.
+# Every level is kept in fixed size binary records (uint32 timestamp, float32 liters) split to segment files,
+# so range queries only need one binary search in the first segment and old raw segments are deleted as whole files.
+
+import os
+import struct
+import threading
+import time
+
+RECORD = struct.Struct('<If')
+READ_CHUNK = 512  # records per read
+
+
+def minute_start(timestamp):
+    return timestamp - timestamp % 60
+
+
+def hour_start(timestamp):
+    return timestamp - timestamp % 3600
+
+
+def day_start(timestamp):
+    """Return timestamp of local midnight."""
+    tm = time.localtime(timestamp)
+    return int(time.mktime((tm.tm_year, tm.tm_mon, tm.tm_mday, 0, 0, 0, 0, 0, -1)))
+
+
+class Level(object):
+    """One resolution of the series stored in segment files <path>/<name>/<segment>.bin."""
+
+    def __init__(self, path, name, bucket, segment_seconds):
+        self.name = name
+        self.bucket = bucket                    # function timestamp -> bucket start, None for raw samples
+        self.segment_seconds = segment_seconds  # None = only one segment
+        self.path = os.path.join(path, name)
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self._repair()
+
+    def _repair(self):
+        """Remove incomplete last record of segments (after power loss), records after it would be misaligned."""
+        for segment in self.segments():
+            segment_path = self._segment_path(segment)
+            size = os.path.getsize(segment_path)
+            if size % RECORD.size:
+                with open(segment_path, 'r+b') as segment_file:
+                    segment_file.truncate(size - size % RECORD.size)
+
+    def _segment(self, timestamp):
+        return timestamp // self.segment_seconds if self.segment_seconds else 0
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, '%d.bin' % segment)
+
+    def segments(self):
+        """Return sorted list of existing segment numbers."""
+        result = []
+        for file_name in os.listdir(self.path):
+            if file_name.endswith('.bin'):
+                try:
+                    result.append(int(file_name[:-4]))
+                except ValueError:
+                    pass
+        return sorted(result)
+
+    def append(self, records):
+        """Append list of (timestamp, value) sorted by time."""
+        segment = None
+        data = []
+        for timestamp, value in records:
+            record_segment = self._segment(timestamp)
+            if record_segment != segment and data:
+                self._write(segment, data)
+                data = []
+            segment = record_segment
+            data.append(RECORD.pack(int(timestamp), value))
+        if data:
+            self._write(segment, data)
+
+    def _write(self, segment, data):
+        with open(self._segment_path(segment), 'ab') as segment_file:
+            segment_file.write(b''.join(data))
+
+    def _segments_in(self, start, end):
+        if self.segment_seconds:
+            first = self._segment(start)
+            last = self._segment(end)
+            return [segment for segment in self.segments() if first <= segment <= last]
+        return [0]
+
+    def segment_files(self, start, end):
+        """Return list of existing segment files which can contain records from start to end."""
+        return [self._segment_path(segment) for segment in self._segments_in(max(0, int(start)), int(end))
+                if os.path.exists(self._segment_path(segment))]
+
+    def query(self, start, end):
+        """Yield (timestamp, value) with start <= timestamp <= end."""
+        start = max(0, int(start))
+        end = int(end)
+        for segment in self._segments_in(start, end):
+            for record in self._query_segment(segment, start, end):
+                yield record
+
+    def _query_segment(self, segment, start, end):
+        try:
+            segment_file = open(self._segment_path(segment), 'rb')
+        except IOError:
+            return
+        with segment_file:
+            segment_file.seek(0, os.SEEK_END)
+            count = segment_file.tell() // RECORD.size
+
+            low, high = 0, count  # binary search of first record >= start
+            while low < high:
+                middle = (low + high) // 2
+                segment_file.seek(middle * RECORD.size)
+                if RECORD.unpack(segment_file.read(RECORD.size))[0] < start:
+                    low = middle + 1
+                else:
+                    high = middle
+
+            segment_file.seek(low * RECORD.size)
+            while low < count:
+                chunk = segment_file.read(min(READ_CHUNK, count - low) * RECORD.size)
+                if not chunk:
+                    break
+                for offset in range(0, len(chunk) - RECORD.size + 1, RECORD.size):
+                    timestamp, value = RECORD.unpack_from(chunk, offset)
+                    if timestamp > end:
+                        return
+                    yield timestamp, value
+                low += len(chunk) // RECORD.size
+
+    def last(self):
+        """Return last (timestamp, value) or None."""
+        segments = self.segments()
+        for segment in reversed(segments):
+            with open(self._segment_path(segment), 'rb') as segment_file:
+                segment_file.seek(0, os.SEEK_END)
+                size = segment_file.tell() - segment_file.tell() % RECORD.size
+                if size:
+                    segment_file.seek(size - RECORD.size)
+                    return RECORD.unpack(segment_file.read(RECORD.size))
+        return None
+
+    def prune(self, before):
+        """Delete segments which contain only records older than before."""
+        if not self.segment_seconds:
+            return
+        for segment in self.segments():
+            if (segment + 1) * self.segment_seconds <= before:
+                os.remove(self._segment_path(segment))
+
+
+class TimeSeries(object):
+    """Raw samples with automatic rollup to minute, hour and day sums."""
+
+    def __init__(self, path, retention_days=30):
+        self.retention_days = retention_days
+        self.raw = Level(path, 'raw', None, 86400)
+        self.levels = [
+            Level(path, 'minute', minute_start, 86400 * 30),
+            Level(path, 'hour', hour_start, 86400 * 365),
+            Level(path, 'day', day_start, None),
+        ]
+        self._lock = threading.Lock()
+        self._pending = {}   # level name -> list of records not written yet
+        self._buckets = {}   # level name -> [bucket start, sum] of open bucket
+        self._recover()
+        self.prune()
+
+    def _recover(self):
+        """Rebuild open buckets from raw samples which are not rolled up yet."""
+        self._pending[self.raw.name] = []
+        lasts = [level.last() for level in [self.raw] + self.levels]
+        self._last_time = max([last[0] for last in lasts if last is not None] or [0])  # samples are kept in time order
+        for level in self.levels:
+            self._pending[level.name] = []
+            self._buckets[level.name] = None
+            last = level.last()
+            start = last[0] + 1 if last is not None else 0
+            for timestamp, value in self.raw.query(start, 2 ** 32 - 1):
+                if last is None or level.bucket(timestamp) != last[0]:
+                    self._roll(level, timestamp, value)
+
+    def _roll(self, level, timestamp, value):
+        bucket = level.bucket(timestamp)
+        current = self._buckets[level.name]
+        if current is not None and current[0] != bucket:
+            self._pending[level.name].append((current[0], current[1]))
+            current = None
+        if current is None:
+            current = self._buckets[level.name] = [bucket, 0.0]
+        current[1] += value
+
+    def add(self, timestamp, value):
+        """Add raw sample. Samples are written when minute is closed (at most once per minute).
+        After the clock is set back samples get time of the last sample (liters are kept, records stay ordered)."""
+        with self._lock:
+            timestamp = self._last_time = max(int(timestamp), self._last_time)
+            self._pending[self.raw.name].append((timestamp, value))
+            for level in self.levels:
+                self._roll(level, timestamp, value)
+            if self._pending[self.levels[0].name]:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        for level in [self.raw] + self.levels:
+            records = self._pending[level.name]
+            if records:
+                level.append(records)
+                self._pending[level.name] = []
+
+    def prune(self):
+        """Delete raw samples older than retention."""
+        if self.retention_days > 0:
+            with self._lock:
+                self.raw.prune(time.time() - self.retention_days * 86400)
+
+    def level(self, name):
+        for level in [self.raw] + self.levels:
+            if level.name == name:
+                return level
+        raise ValueError('Unknown level: ' + str(name))
+
+    def query(self, name, start, end):
+        """Yield (timestamp, value) of level name in range including not written records.
+        Files are read without lock (adding of samples is not blocked), only the open bucket is copied under it."""
+        level = self.level(name)
+        with self._lock:
+            self._flush()
+            current = self._buckets.get(name)
+            current = tuple(current) if current is not None else None
+        for record in level.query(start, end):
+            if current is not None and record[0] >= current[0]:
+                break  # bucket closed meanwhile, it is yielded from the copy
+            yield record
+        if current is not None and start <= current[0] <= end:
+            yield current  # open bucket
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# Crash safe journal of water summary. Small fixed size records with checksum are written round robin into
+# preallocated ring file, so every flush changes only one record and the last valid record survives power loss.
+
+import os
+import struct
+import threading
+import time
+import zlib
+
+try:
+    from time import monotonic
+except ImportError:  # Python 2
+    from time import time as monotonic
+
+RECORD = struct.Struct('<IId')  # sequence, timestamp, total liters
+CHECKSUM = struct.Struct('<I')
+RECORD_SIZE = RECORD.size + CHECKSUM.size
+
+
+def _checksum(data):
+    return zlib.crc32(data) & 0xFFFFFFFF
+
+
+class Totalizer(object):
+    """Running total with journal in ring file."""
+
+    def __init__(self, file_name, initial=0.0, slots=4096, flush_interval=300, flush_volume=100.0):
+        self.file_name = file_name
+        self.slots = slots
+        self.flush_interval = flush_interval  # seconds, 0 = flush on volume only
+        self.flush_volume = flush_volume      # liters, 0 = flush on time only
+        self._lock = threading.Lock()
+
+        self._file = self._open()
+        self.sequence, self.total = self._recover()
+        self.recovered = self.sequence > 0
+        if not self.recovered:
+            self.total = float(initial)
+        self._saved_total = self.total
+        self._saved_time = monotonic()
+
+    def _open(self):
+        if not os.path.exists(self.file_name):
+            with open(self.file_name, 'wb') as journal:
+                journal.write(b'\x00' * RECORD_SIZE * self.slots)
+                journal.flush()
+                os.fsync(journal.fileno())
+        return open(self.file_name, 'r+b')
+
+    def _recover(self):
+        """Return (sequence, total) of newest valid record or (0, 0.0)."""
+        self._file.seek(0)
+        data = self._file.read()
+        best = (0, 0.0)
+        for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+            record = data[offset:offset + RECORD.size]
+            if CHECKSUM.unpack_from(data, offset + RECORD.size)[0] != _checksum(record):
+                continue
+            sequence, timestamp, total = RECORD.unpack(record)
+            if sequence > best[0]:
+                best = (sequence, total)
+        return best
+
+    def _write(self):
+        self.sequence += 1
+        record = RECORD.pack(self.sequence, int(time.time()), self.total)
+        self._file.seek(((self.sequence - 1) % self.slots) * RECORD_SIZE)
+        self._file.write(record + CHECKSUM.pack(_checksum(record)))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._saved_total = self.total
+        self._saved_time = monotonic()
+
+    def add(self, liters):
+        """Add liters and write record if flush interval or volume is reached. Returns new total."""
+        with self._lock:
+            self.total += liters
+            if self.total != self._saved_total:
+                if (self.flush_volume > 0 and abs(self.total - self._saved_total) >= self.flush_volume) or \
+                        (self.flush_interval > 0 and monotonic() - self._saved_time >= self.flush_interval):
+                    self._write()
+            return self.total
+
+    def set(self, total):
+        """Set total (for example reset to 0) and write it immediately."""
+        with self._lock:
+            self.total = float(total)
+            self._write()
+
+    def flush(self):
+        with self._lock:
+            if self.total != self._saved_total:
+                self._write()
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._file.close()
@@ -1,9 +1,11 @@
 #!/usr/bin/env python
 # This plugins check wind speed in meter per second. 
 # This plugin read data from I2C counter PCF8583 on I2C address 0x50. Max count PCF8583 is 1 milion pulses per seconds
+# Counter driver is shared with water_meter plug-in (plugins/shared/pcf8583.py).
 
 
 import json
+import os
 import time
 import sys
 import traceback
@@ -14,10 +16,16 @@ import web
 from ospy.stations import stations
 from ospy.options import options
 from ospy.log import log
-from plugins import PluginOptions, plugin_url
+from plugins import PluginOptions, plugin_url, plugin_data_dir
 from ospy.webpages import ProtectedPage
 from ospy.helpers import get_rpi_revision
 from ospy.helpers import datetime_string
+from plugins.shared import i2c_bus  # shared I2C bus manager
+from plugins.shared import pcf8583  # PCF8583 event counter driver shared with water meter
+from plugins.shared.station_state import active_stations  # shared index of active stations
+from plugins.shared import shutdown_hooks  # flush before shutdown by UPS plug-in
+from . import wind_engine  # gust and sustained wind speed
+from . import wind_log     # wind history
 
 NAME = 'Wind Speed Monitor'
 LINK = 'settings_page'
@@ -30,7 +38,10 @@ wind_options = PluginOptions(
         "sendeml": True,             # True = send email with error
         "pulses": 2,                 # 2 pulses per rotation
         "metperrot": 1.492,          # 1.492 meter per hour per rotation
-        "maxspeed": 20               # 20 max speed to deactivate stations  
+        "maxspeed": 20,              # 20 max speed (3 second gust) to deactivate stations  
+        "resumespeed": 15,           # 15 stations can run again when 2 minutes average speed is lower
+        "enable_log": False,         # save wind history
+        "log_records": 604800        # max records in history (1 record per second = 7 days)
     }
 )
 
@@ -48,6 +59,10 @@ class WindSender(Thread):
         self.pcf = None
         self.status = {}
         self.status['meter'] = 0.0
+        self.engine = wind_engine.WindEngine()
+        self.status.update(self.engine.status())
+        self.wind_log = None
+        self._reconfigure = False   # settings were changed, history size is checked by this thread
 
         self._sleep_time = 0
         self.start()
@@ -56,8 +71,18 @@ class WindSender(Thread):
         self._stop_event.set()
 
     def update(self):
+        self._reconfigure = True
         self._sleep_time = 0
 
+    def _resize_log(self):
+        """Open history again if number of records was changed in settings."""
+        self._reconfigure = False
+        if self.wind_log is not None and self.wind_log.capacity != max(1, int(wind_options['log_records'])):
+            file_name = self.wind_log.file_name
+            self.wind_log.close()
+            self.wind_log = None
+            self.wind_log = wind_log.WindLog(file_name, wind_options['log_records'])
+
     def _sleep(self, secs):
         self._sleep_time = secs
         while self._sleep_time > 0 and not self._stop_event.is_set():
@@ -66,15 +91,20 @@ class WindSender(Thread):
 
     def run(self):
         try:
-            import smbus  # for PCF 8583
-
-            self.bus = smbus.SMBus(1 if get_rpi_revision() >= 2 else 0)
+            self.bus = i2c_bus.get_bus(1 if get_rpi_revision() >= 2 else 0)  # for PCF 8583
         except ImportError:
             log.warning(NAME, 'Could not import smbus.')
 
         if self.bus is not None:
             self.pcf = set_counter(self.bus)     # set pcf8583 as counter
 
+        try:
+            self.wind_log = wind_log.WindLog(os.path.join(plugin_data_dir(), 'wind.bin'), wind_options['log_records'])
+        except Exception:
+            log.error(NAME, 'Wind Speed monitor plug-in:\n' + 'Could not open history - ' + traceback.format_exc())
+
+        last_flush_time = int(time.time())
+
         log.clear(NAME)
         send = False      # send email
         once_text = True  # text enabled plugin
@@ -82,26 +112,52 @@ class WindSender(Thread):
 
         while not self._stop_event.is_set():
             try:
+                if self._reconfigure:
+                    self._resize_log()
+
                 if self.bus is not None and wind_options['use_wind_monitor']:  # if wind plugin is enabled
-                    val = (counter(self.bus)/wind_options['pulses'])*wind_options['metperrot'] 
-                    self.status['meter'] = val
-                    
                     if once_text:
                         log.clear(NAME)
                         log.info(NAME, 'Wind Speed Monitor plug-in is enabled.')
                         once_text = False
                         two_text = True
-                   
-                    if get_station_is_on():                               # if station is on
-                       if val >= wind_options['maxspeed']:                # if wind speed is > options max speed
-                          log.clear(NAME)
-                          log.finish_run(None)                            # save log
-                          stations.clear()                                # set all station to off
-                          log.clear(NAME)
-                          log.info(NAME,'Stops all stations and sends email if enabled sends email.')
-                          if wind_options['sendeml']:                     # if enabled send email
-                             send = True
-                                      
+                        if self.pcf is not None:
+                            self.pcf.restart()                            # pulses counted while disabled are ignored
+                        self.engine = wind_engine.WindEngine()
+
+                    if self.pcf is not None and self.pcf.address != pcf_address():  # address changed in settings
+                        self.pcf = set_counter(self.bus)
+
+                    change = None
+                    if self.pcf is not None:
+                        pulses, elapsed = counter(self.pcf)
+                        if elapsed > 0:
+                            val = (pulses / elapsed / float(wind_options['pulses'])) * wind_options['metperrot']
+                            change = self.engine.add(val, wind_options['maxspeed'], wind_options['resumespeed'])
+                            self.status.update(self.engine.status())
+                            if self.wind_log is not None and wind_options['enable_log']:
+                                self.wind_log.add(time.time(), val, self.status['gust'], self.status['avg2'],
+                                                  self.status['avg10'])
+
+                    if self.wind_log is not None and int(time.time()) - last_flush_time >= 60:
+                        last_flush_time = int(time.time())
+                        self.wind_log.flush()                             # write history to file once per minute
+
+                    if change == 'trip':                                  # if 3 second gust is >= options max speed
+                        log.clear(NAME)
+                        log.info(NAME, 'Wind gust %.1f m/s -> stations are stopped until 2 minutes average speed is below %.1f m/s.' % (
+                            self.status['gust'], wind_options['resumespeed']))
+                        if get_station_is_on() and wind_options['sendeml']:  # email only once per gust event
+                            send = True
+                    elif change == 'resume':
+                        log.info(NAME, 'Wind 2 minutes average %.1f m/s -> stations can run again.' % self.status['avg2'])
+
+                    if self.engine.tripped and get_station_is_on():       # if station is on while wind is too strong
+                        log.finish_run(None)                              # save log
+                        stations.clear()                                  # set all station to off
+                        active_stations.invalidate()
+                        log.info(NAME, 'Stops all stations.')
+
                 else:
                     if two_text:                                          # text on the web if plugin is disabled
                         log.clear(NAME)
@@ -115,10 +171,9 @@ class WindSender(Thread):
                         from plugins.email_notifications import email 
                         email(TEXT)                             # send email without attachments
                         log.info(NAME, 'Email was sent: ' + TEXT)
-                        send = False
                     except Exception as err:
-                        log.clear(NAME)
                         log.error(NAME, 'Email was not sent! ' + str(err))
+                    send = False                                # do not repeat email every second
 
                 self._sleep(1)
 
@@ -127,6 +182,9 @@ class WindSender(Thread):
                 log.error(NAME, 'Wind Speed monitor plug-in:\n' + traceback.format_exc())
                 self._sleep(60)
 
+        if self.wind_log is not None:
+            self.wind_log.close()
+
 
 wind_sender = None
 
@@ -137,6 +195,7 @@ def start():
     global wind_sender
     if wind_sender is None:
         wind_sender = WindSender()
+    shutdown_hooks.register(NAME, flush_data, priority=50, timeout=5)  # called by UPS plug-in before shutdown
 
 
 def stop():
@@ -145,57 +204,45 @@ def stop():
         wind_sender.stop()
         wind_sender.join()
         wind_sender = None
+    shutdown_hooks.unregister(NAME)
+
+
+def flush_data():
+    """Shutdown hook of UPS plug-in: write wind history to file."""
+    if wind_sender is not None and wind_sender.wind_log is not None:
+        wind_sender.wind_log.flush()
+
+
+def pcf_address():
+    if wind_options['address']:
+        return 0x51
+    else:
+        return 0x50
 
 
 def set_counter(i2cbus):
     try:
-        if wind_options['address']:
-            pcf_addr = 0x51
-        else:
-            pcf_addr = 0x50 
-        i2cbus.write_byte_data(pcf_addr, 0x00, 0x20) # status registr setup to "EVENT COUNTER"
-        i2cbus.write_byte_data(pcf_addr, 0x01, 0x00) # reset LSB
-        i2cbus.write_byte_data(pcf_addr, 0x02, 0x00) # reset midle Byte
-        i2cbus.write_byte_data(pcf_addr, 0x03, 0x00) # reset MSB
+        pcf = pcf8583.PCF8583(i2cbus, pcf_address())
+        pcf.setup()                              # status registr setup to "EVENT COUNTER" and reset counter
         log.info(NAME, 'Wind speed monitor plug-in: Setup PCF8583 as event counter - OK')
-        return 1  
+        return pcf
     except:
         log.error(NAME, 'Wind speed monitor plug-in:\n' + 'Setup PCF8583 as event counter - FAULT')
         return None
 
 
-def counter(i2cbus): # reset PCF8583, measure pulses and return number pulses per second
+def counter(pcf): # return (pulses, seconds) from last reading of free running PCF8583
     try:
-        if wind_options['address']:
-            pcf_addr = 0x51
-        else:
-            pcf_addr = 0x50 
-        # reset PCF8583
-        i2cbus.write_byte_data(pcf_addr, 0x01, 0x00) # reset LSB
-        i2cbus.write_byte_data(pcf_addr, 0x02, 0x00) # reset midle Byte
-        i2cbus.write_byte_data(pcf_addr, 0x03, 0x00) # reset MSB
-        time.sleep(1)
-        # read number (pulses in counter) and translate to DEC
-        counter = i2cbus.read_i2c_block_data(pcf_addr, 0x00)
-        num1 = (counter[1] & 0x0F)             # units
-        num10 = (counter[1] & 0xF0) >> 4       # dozens
-        num100 = (counter[2] & 0x0F)           # hundred
-        num1000 = (counter[2] & 0xF0) >> 4     # thousand
-        num10000 = (counter[3] & 0x0F)         # tens of thousands
-        num100000 = (counter[3] & 0xF0) >> 4   # hundreds of thousands
-        pulses = (num100000 * 100000) + (num10000 * 10000) + (num1000 * 1000) + (num100 * 100) + (num10 * 10) + num1
-        return pulses
+        return pcf.sample()
     except:
-        return 0
+        pcf.restart()
+        return 0, 0.0
 
 
-def get_station_is_on(): # return true if stations is ON
+def get_station_is_on(): # return true if any station is ON
     if not options.manual_mode:                   # if not manual control
-        for station in stations.get():
-                if station.active:                # if station is active
-                    return True
-                else:
-                    return False
+        return active_stations.any_on()
+    return False
 
 
 ################################################################################
@@ -213,7 +260,7 @@ class settings_page(ProtectedPage):
         wind_options.web_update(web.input())
 
         if wind_sender is not None:
-            wind_sender.update()
+            wind_sender.update()  # history is resized by the sender thread
         raise web.seeother(plugin_url(settings_page), True)
 
 
@@ -225,3 +272,81 @@ class settings_json(ProtectedPage):
         web.header('Content-Type', 'application/json')
         return json.dumps(wind_options)
 
+
+def query_time(qdict, key, default):
+    """Return timestamp from web query, raises ValueError if it is not a number."""
+    value = qdict.get(key)
+    if not value:
+        return default
+    try:
+        return min(2 ** 32 - 1, max(0, int(value)))
+    except ValueError:
+        raise ValueError('Parameter %s must be an integer.' % key)
+
+
+def get_records():
+    """Return iterator over history from web query ?from=timestamp&to=timestamp (newest first),
+    raises ValueError if the query is wrong."""
+    qdict = web.input()
+    start = query_time(qdict, 'from', 0)
+    end = query_time(qdict, 'to', 2 ** 32 - 1)
+    if start > end:
+        raise ValueError('Parameter from must not be after to.')
+    if wind_sender is None or wind_sender.wind_log is None:
+        return iter([])
+    return wind_sender.wind_log.records(start, end)
+
+
+class log_json(ProtectedPage):
+    """Returns wind history in JSON format, streamed in chunks."""
+
+    def GET(self):
+        web.header('Access-Control-Allow-Origin', '*')
+        web.header('Content-Type', 'application/json')
+        try:
+            records = get_records()
+        except ValueError as error:
+            web.ctx.status = '400 Bad Request'
+            yield json.dumps({'error': str(error)})
+            return
+        yield '['
+        separator = ''
+        for record in records:
+            record['datetime'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['timestamp']))
+            yield separator + json.dumps(record)
+            separator = ','
+        yield ']'
+
+
+class log_csv(ProtectedPage):
+    """Returns wind history as csv file, streamed in chunks."""
+
+    def GET(self):
+        try:
+            records = get_records()
+        except ValueError as error:
+            web.ctx.status = '400 Bad Request'
+            web.header('Content-Type', 'text/plain')
+            yield str(error)
+            return
+        web.header('Content-Type', 'text/csv')
+        yield 'Date/Time;\tSpeed;\tGust;\tAverage 2 min;\tAverage 10 min\n'
+        lines = []
+        for record in records:
+            lines.append('%s,\t%.2f,\t%.2f,\t%.2f,\t%.2f\n' % (
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['timestamp'])),
+                record['speed'], record['gust'], record['avg2'], record['avg10']))
+            if len(lines) >= 1000:
+                yield ''.join(lines)
+                lines = []
+        yield ''.join(lines)
+
+
+class delete_log_page(ProtectedPage):
+    """Delete wind history"""
+
+    def GET(self):
+        if wind_sender is not None and wind_sender.wind_log is not None:
+            wind_sender.wind_log.clear()
+        log.info(NAME, 'Deleted wind history')
+        raise web.seeother(plugin_url(settings_page), True)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# Wind speed statistics over ring buffers updated in O(1) per sample (samples are taken once per second):
+# 3 second gust, 2 and 10 minute sustained average and peak gust over 10 minutes.
+# Shutdown is driven by trip (gust) and resume (sustained speed) thresholds with hysteresis.
+# Gust is reported only from full window (3 samples), so the first sample after start can not trip alone.
+
+from collections import deque
+
+GUST_SAMPLES = 3
+SUSTAINED_SAMPLES = 120
+LONG_SAMPLES = 600
+
+
+class RingAverage(object):
+    """Average of last size samples with running sum."""
+
+    def __init__(self, size):
+        self.size = size
+        self._values = [0.0] * size
+        self._index = 0
+        self._count = 0
+        self._sum = 0.0
+
+    def add(self, value):
+        self._sum += value - self._values[self._index]
+        self._values[self._index] = value
+        self._index = (self._index + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+        if self._index == 0:
+            self._sum = float(sum(self._values))  # remove accumulated rounding errors once per round
+        return self.value()
+
+    def value(self):
+        return self._sum / self._count if self._count else 0.0
+
+    def full(self):
+        return self._count == self.size
+
+
+class RingPeak(object):
+    """Maximum of last size samples with monotonic queue (amortized O(1))."""
+
+    def __init__(self, size):
+        self.size = size
+        self._queue = deque()  # (sample number, value) with decreasing values
+        self._number = 0
+
+    def add(self, value):
+        self._number += 1
+        while self._queue and self._queue[-1][1] <= value:
+            self._queue.pop()
+        self._queue.append((self._number, value))
+        if self._queue[0][0] <= self._number - self.size:
+            self._queue.popleft()
+        return self.value()
+
+    def value(self):
+        return self._queue[0][1] if self._queue else 0.0
+
+
+class WindEngine(object):
+    """Wind statistics and trip state."""
+
+    def __init__(self):
+        self.gust_average = RingAverage(GUST_SAMPLES)
+        self.sustained_average = RingAverage(SUSTAINED_SAMPLES)
+        self.long_average = RingAverage(LONG_SAMPLES)
+        self.gust_peak = RingPeak(LONG_SAMPLES)
+        self.speed = 0.0
+        self.tripped = False
+        self._calm_samples = 0  # samples from last gust over trip speed
+
+    def add(self, speed, trip_speed, resume_speed):
+        """Add one sample. Returns 'trip' or 'resume' if state was changed, otherwise None."""
+        self.speed = speed
+        self.gust_average.add(speed)
+        sustained = self.sustained_average.add(speed)
+        self.long_average.add(speed)
+        if not self.gust_average.full():
+            return None  # no gust before GUST_SAMPLES samples
+        gust = self.gust()
+        self.gust_peak.add(gust)
+
+        if gust >= trip_speed:
+            self._calm_samples = 0
+            if not self.tripped:
+                self.tripped = True
+                return 'trip'
+        else:
+            self._calm_samples += 1
+            # resume when 2 minutes average (without any gust over trip speed) falls under resume speed
+            if self.tripped and self._calm_samples >= SUSTAINED_SAMPLES and sustained < min(resume_speed, trip_speed):
+                self.tripped = False
+                return 'resume'
+        return None
+
+    def gust(self):
+        """Return 3 second gust, 0 before the window is full."""
+        return self.gust_average.value() if self.gust_average.full() else 0.0
+
+    def status(self):
+        return {
+            'meter': round(self.speed, 2),
+            'gust': round(self.gust(), 2),
+            'avg2': round(self.sustained_average.value(), 2),
+            'avg10': round(self.long_average.value(), 2),
+            'peak': round(self.gust_peak.value(), 2),
+            'tripped': self.tripped,
+        }
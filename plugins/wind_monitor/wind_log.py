@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# Bounded wind history: fixed width records (timestamp, speed, gust, 2 and 10 minute average in cm/s)
+# in one preallocated ring file. New records overwrite the oldest ones, the file never grows over capacity.
+
+import os
+import struct
+import threading
+
+HEADER = struct.Struct('<4sIII')  # magic, capacity, next write index, number of records
+MAGIC = b'WND1'
+RECORD = struct.Struct('<IHHHH')
+FIELDS = ('speed', 'gust', 'avg2', 'avg10')
+CHUNK = 1024  # records per read
+
+
+def _speed(value):
+    return min(65535, max(0, int(round(value * 100))))
+
+
+class WindLog(object):
+    """Ring file of wind records."""
+
+    def __init__(self, file_name, capacity):
+        self.file_name = file_name
+        self._lock = threading.Lock()
+        self._pending = []
+        self.capacity = max(1, int(capacity))
+        self.head = 0
+        self.count = 0
+        self._file = self._open()
+        self._last_time = self._newest_time()  # records are kept in time order
+
+    def _open(self):
+        old = None  # (file, capacity, head, count) of log with other capacity
+        if os.path.exists(self.file_name):
+            log_file = open(self.file_name, 'r+b')
+            try:
+                magic, capacity, head, count = HEADER.unpack(log_file.read(HEADER.size))
+            except struct.error:
+                magic = None
+            if magic == MAGIC and capacity == self.capacity:
+                self.head, self.count = head % capacity, min(count, capacity)
+                return log_file
+            if magic == MAGIC and capacity > 0:
+                old = (log_file, capacity, head, count)
+            else:
+                log_file.close()
+        temp_name = self.file_name + '.tmp'  # new file or changed capacity, old log is kept until it is copied
+        with open(temp_name, 'wb') as log_file:
+            log_file.write(HEADER.pack(MAGIC, self.capacity, 0, 0))
+            log_file.truncate(HEADER.size + RECORD.size * self.capacity)
+        self.head, self.count = 0, 0
+        with open(temp_name, 'r+b') as log_file:
+            if old is not None:
+                with old[0]:
+                    for chunk in self._copy_chunks(*old):
+                        self._write(log_file, chunk)
+            os.fsync(log_file.fileno())
+        os.rename(temp_name, self.file_name)
+        return open(self.file_name, 'r+b')
+
+    def _newest_time(self):
+        if not self.count:
+            return 0
+        return self._read(self._file, (self.head - self.count) % self.capacity, self.count - 1, 1)[0][0]
+
+    def _copy_chunks(self, log_file, capacity, head, count):
+        """Yield lists of packed newest records of ring with other capacity, one read per chunk of CHUNK records."""
+        count = min(count, capacity, self.capacity)
+        physical = (head - count) % capacity
+        while count > 0:
+            part = min(count, CHUNK, capacity - physical)
+            log_file.seek(HEADER.size + physical * RECORD.size)
+            data = log_file.read(part * RECORD.size)
+            yield [data[offset:offset + RECORD.size] for offset in range(0, len(data), RECORD.size)]
+            count -= part
+            physical = (physical + part) % capacity
+
+    def _write(self, log_file, data):
+        """Write packed records at head and update header."""
+        while data:
+            part = data[:self.capacity - self.head]
+            data = data[len(part):]
+            log_file.seek(HEADER.size + self.head * RECORD.size)
+            log_file.write(b''.join(part))
+            self.head = (self.head + len(part)) % self.capacity
+            self.count = min(self.capacity, self.count + len(part))
+        log_file.seek(0)
+        log_file.write(HEADER.pack(MAGIC, self.capacity, self.head, self.count))
+        log_file.flush()
+
+    def add(self, timestamp, speed, gust, avg2, avg10):
+        """Add record, records are written to file by flush(). After the clock is set back records get time
+        of the newest record (records must be in time order for reading)."""
+        with self._lock:
+            timestamp = self._last_time = max(int(timestamp), self._last_time)
+            self._pending.append(RECORD.pack(timestamp, _speed(speed), _speed(gust), _speed(avg2), _speed(avg10)))
+
+    def flush(self):
+        with self._lock:
+            if self._pending:
+                self._write(self._file, self._pending)
+                self._pending = []
+
+    def clear(self):
+        with self._lock:
+            self._pending = []
+            self.head, self.count = 0, 0
+            self._last_time = 0
+            self._write(self._file, [])
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._file.close()
+
+    def _read(self, log_file, first, index, count):
+        """Return count records from logical index (0 = oldest), at most two reads because of ring wrap."""
+        result = []
+        physical = (first + index) % self.capacity
+        while count > 0:
+            part = min(count, self.capacity - physical)
+            log_file.seek(HEADER.size + physical * RECORD.size)
+            data = log_file.read(part * RECORD.size)
+            result.extend(RECORD.unpack_from(data, offset) for offset in range(0, len(data), RECORD.size))
+            count -= part
+            physical = 0
+        return result
+
+    def records(self, start=0, end=2 ** 32 - 1, newest_first=True):
+        """Yield dictionaries of records from start to end timestamp, read from file in chunks."""
+        self.flush()
+        with self._lock:
+            head, count = self.head, self.count
+        with open(self.file_name, 'rb') as log_file:
+            first = (head - count) % self.capacity
+            if newest_first:
+                chunks = [(max(0, stop - CHUNK), stop - max(0, stop - CHUNK)) for stop in range(count, 0, -CHUNK)]
+            else:
+                chunks = [(index, min(CHUNK, count - index)) for index in range(0, count, CHUNK)]
+            for index, chunk_count in chunks:
+                records = self._read(log_file, first, index, chunk_count)
+                if newest_first:
+                    records.reverse()
+                for record in records:
+                    if newest_first and record[0] < start or not newest_first and record[0] > end:
+                        return  # records are in time order
+                    if start <= record[0] <= end:
+                        result = {'timestamp': record[0]}
+                        for name, value in zip(FIELDS, record[1:]):
+                            result[name] = value / 100.0
+                        yield result
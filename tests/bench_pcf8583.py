@@ -0,0 +1,25 @@
+# Benchmark of PCF8583 driver over fake chip: python tests/bench_pcf8583.py
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plugins.shared import pcf8583
+from fakes import FakePCF8583, FakeSMBus
+
+
+def benchmark(samples=100000):
+    """Return number of samples per second over fake chip."""
+    chip = FakePCF8583()
+    pcf = pcf8583.PCF8583(FakeSMBus({0x50: chip}))
+    pcf.setup()
+    start = time.time()
+    for i in range(samples):
+        chip.add_pulses(7)
+        pcf.sample()
+    return samples / (time.time() - start)
+
+
+if __name__ == '__main__':
+    print('%d samples per second' % benchmark())
@@ -0,0 +1,5 @@
+# Tests of library modules in plugins/shared and of plug-ins, they run without OSPy and without hardware.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,126 @@
+# Fake hardware for tests: I2C bus (smbus interface) with in memory chips and GPIO (RPi.GPIO interface).
+
+import threading
+
+from plugins.shared import pcf8583
+
+
+class FakePCF8583(object):
+    """In memory PCF8583 chip, pulses are added by add_pulses()."""
+
+    def __init__(self):
+        self.registers = [0] * 16
+
+    def add_pulses(self, pulses):
+        count = pcf8583.bcd_decode(*self.registers[pcf8583.REG_COUNT:pcf8583.REG_COUNT + 3])
+        self.registers[pcf8583.REG_COUNT:pcf8583.REG_COUNT + 3] = \
+            pcf8583.bcd_encode((count + pulses) % pcf8583.COUNTER_MODULO)
+
+    def write(self, register, data):
+        for i, value in enumerate(data):
+            self.registers[(register + i) % len(self.registers)] = value & 0xFF
+
+    def read(self, register, length):
+        return [self.registers[(register + i) % len(self.registers)] for i in range(length)]
+
+
+class FakePCF8591(object):
+    """In memory PCF8591 A/D converter, auto-increment read returns the previous conversion first."""
+
+    def __init__(self, inputs=(0, 0, 0, 0)):
+        self.inputs = list(inputs)
+        self.output = 0
+        self.previous = 0x80
+
+    def write(self, register, data):
+        self.output = data[-1]
+
+    def read(self, register, length):
+        result = [self.previous] + [self.inputs[i % 4] for i in range(length - 1)]
+        self.previous = result[-1]
+        return result
+
+
+class FakeSMBus(object):
+    """Subset of smbus.SMBus interface over fake chips {address: chip}."""
+
+    def __init__(self, chips=None):
+        self.chips = chips if chips is not None else {}
+        self.calls = 0
+
+    def _chip(self, addr):
+        self.calls += 1
+        try:
+            return self.chips[addr]
+        except KeyError:
+            raise IOError(121, 'Remote I/O error')
+
+    def write_byte_data(self, addr, register, value):
+        self._chip(addr).write(register, [value])
+
+    def write_i2c_block_data(self, addr, register, data):
+        self._chip(addr).write(register, data)
+
+    def read_byte_data(self, addr, register):
+        return self._chip(addr).read(register, 1)[0]
+
+    def read_i2c_block_data(self, addr, register, length=32):
+        return self._chip(addr).read(register, length)
+
+
+class FakeGPIO(object):
+    """GPIO backend without hardware (constants have RPi.GPIO values)."""
+
+    BOARD, BCM = 10, 11
+    OUT, IN = 0, 1
+    LOW, HIGH = 0, 1
+    PUD_DOWN, PUD_UP = 21, 22
+    RISING, FALLING, BOTH = 31, 32, 33
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._levels = {}
+        self._callbacks = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, mode, pull_up_down=None, initial=None):
+        with self._lock:
+            if mode == self.OUT:
+                self._levels[pin] = initial or self.LOW
+            else:
+                self._levels.setdefault(pin, self.HIGH if pull_up_down == self.PUD_UP else self.LOW)
+
+    def input(self, pin):
+        return self._levels.get(pin, self.LOW)
+
+    def output(self, pin, value):
+        self._levels[pin] = int(bool(value))
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        with self._lock:
+            if pin in self._callbacks:
+                raise RuntimeError('Conflicting edge detection already enabled for this GPIO channel')
+            self._callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        with self._lock:
+            self._callbacks.pop(pin, None)
+
+    def cleanup(self, pin=None):
+        pass
+
+    def set_input(self, pin, level):
+        """Set level of input pin (as by hardware), callback of edge detection is called."""
+        level = int(bool(level))
+        with self._lock:
+            old = self._levels.get(pin, self.LOW)
+            self._levels[pin] = level
+            edge, callback = self._callbacks.get(pin, (None, None))
+        if callback is not None and level != old and \
+                (edge == self.BOTH or edge == (self.RISING if level else self.FALLING)):
+            callback(pin)
@@ -0,0 +1,18 @@
+# Library modules of plug-ins (series, wind_log, ...) are imported without __init__.py of the plug-in,
+# which needs OSPy and web.py. The package is created empty, its modules are imported from its directory.
+import importlib
+import os
+import sys
+import types
+
+PLUGINS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'plugins')
+
+
+def load(plugin, name):
+    """Return module plugins.<plugin>.<name>."""
+    package = 'plugins.' + plugin
+    if package not in sys.modules:
+        module = types.ModuleType(package)
+        module.__path__ = [os.path.join(PLUGINS, plugin)]
+        sys.modules[package] = module
+    return importlib.import_module(package + '.' + name)
@@ -0,0 +1,65 @@
+import pytest
+
+from plugin_modules import load
+
+alerts = load('volt_temp_da', 'alerts')
+
+
+def engine(text):
+    actions = []
+    return alerts.AlertEngine(alerts.parse_rules(text), lambda rule, active: actions.append((rule.text, active))), \
+        actions
+
+
+def test_parse_rules_reports_line_of_error():
+    rules = alerts.parse_rules('# comment\n\n0 above 30 hysteresis=2 for=60 stop da=100\n1 fall 5')
+    assert [(rule.channel, rule.condition, rule.seconds, rule.actions) for rule in rules] == \
+        [(0, 'above', 60.0, ('stop', 'da=100')), (1, 'fall', 0.0, ('notify',))]
+    assert rules[0].da_value() == 100
+    with pytest.raises(ValueError, match='line 2'):
+        alerts.parse_rules('0 above 30\n4 above 30')
+    with pytest.raises(ValueError):
+        alerts.parse_rule('0 above 30 da=300')
+    with pytest.raises(ValueError):
+        alerts.parse_rule('0 between 30')
+
+
+def test_hysteresis_and_for_seconds():
+    alert_engine, actions = engine('0 above 30 hysteresis=2 for=10')
+    alert_engine.add(0, 31.0, 0.0)
+    alert_engine.add(0, 29.0, 5.0)       # still active, under threshold but over hysteresis
+    assert actions == []
+    alert_engine.add(0, 29.5, 10.0)
+    assert actions == [('0 above 30 hysteresis=2 for=10', True)]
+    alert_engine.add(0, 27.0, 11.0)
+    assert actions[-1] == ('0 above 30 hysteresis=2 for=10', False)
+
+
+def test_short_condition_does_not_fire():
+    alert_engine, actions = engine('0 below 10 for=5')
+    alert_engine.add(0, 20.0, 0.0)
+    alert_engine.add(0, 5.0, 1.0)
+    alert_engine.add(0, 15.0, 4.0)
+    alert_engine.add(0, 5.0, 5.0)        # new deadline at 10
+    alert_engine.check(9.0)
+    assert actions == []
+    alert_engine.check(10.0)
+    assert actions == [('0 below 10 for=5', True)]
+
+
+def test_rules_of_other_inputs_and_edges_are_independent():
+    alert_engine, actions = engine('0 above 10\n0 above 20\n1 above 10')
+    alert_engine.add(0, 15.0, 0.0)
+    assert actions == [('0 above 10', True)]
+    alert_engine.add(0, 25.0, 1.0)
+    alert_engine.add(1, 5.0, 1.0)
+    assert actions == [('0 above 10', True), ('0 above 20', True)]
+    assert [rule['active'] for rule in alert_engine.status()] == [True, True, False]
+
+
+def test_rate_of_change_per_minute():
+    alert_engine, actions = engine('2 rise 6')
+    for second in range(alerts.RATE_SAMPLES + 1):
+        alert_engine.add(2, second * 0.2, float(second))  # 12 per minute
+    assert alert_engine.rates[2] == pytest.approx(12.0)
+    assert actions == [('2 rise 6', True)]
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+from plugin_modules import load
+
+numpy = pytest.importorskip('numpy')
+analytics = load('water_meter', 'analytics')
+
+START = 1729893600  # 2024-10-26 00:00 CEST, daylight saving time ends 2024-10-27 03:00 CEST
+
+
+@pytest.fixture
+def prague(monkeypatch):
+    monkeypatch.setenv('TZ', 'Europe/Prague')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def minutes(days):
+    return numpy.arange(START, START + days * 86400, 60, dtype=numpy.uint32)
+
+
+def test_offsets_follow_daylight_saving_time(prague):
+    timestamps = numpy.arange(START, START + 3 * 86400, 37, dtype=numpy.uint32)
+    expected = [analytics.utc_offset(int(timestamp)) for timestamp in timestamps]
+    assert analytics.utc_offsets(timestamps).tolist() == expected
+    assert expected[0] == 7200 and expected[-1] == 3600
+
+
+def test_night_minimum_uses_offset_of_every_night(prague):
+    timestamps = minutes(3)
+    values = numpy.ones(len(timestamps))
+    values[4 * 60 + 30] = 0.0  # 04:30 CEST is after the night, with offset of CET it would be 03:30
+    nights = analytics.night_minimum(timestamps, values, 2, 4, analytics.utc_offsets(timestamps))
+
+    starts = {}  # day -> first 02:00 (twice on 27th)
+    for timestamp in timestamps:
+        tm = time.localtime(int(timestamp))
+        if tm.tm_hour == 2 and tm.tm_min == 0:
+            starts.setdefault(tm.tm_mday, int(timestamp))
+    assert [night[0] for night in nights] == sorted(starts.values())
+    assert [night[1] for night in nights] == [1.0, 1.0, 1.0]
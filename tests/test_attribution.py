@@ -0,0 +1,47 @@
+import time
+
+from plugin_modules import load
+
+attribution = load('water_meter', 'attribution')
+
+DAY1 = time.mktime((2024, 5, 10, 12, 0, 0, 0, 0, -1))
+DAY2 = time.mktime((2024, 5, 11, 12, 0, 0, 0, 0, -1))
+DAY3 = time.mktime((2024, 5, 12, 12, 0, 0, 0, 0, -1))
+
+
+def filled(file_name):
+    consumption = attribution.Attribution(file_name)
+    consumption.add(DAY1, 10.0, ['Lawn', 'Garden'], ['Morning'])
+    consumption.add(DAY1, 4.0, [], [])
+    consumption.add(DAY3, 6.0, ['Lawn'], ['Evening'])
+    return consumption
+
+
+def test_liters_are_divided_between_running_stations(tmp_path):
+    consumption = filled(str(tmp_path / 'consumption.json'))
+    assert consumption.query(DAY1, DAY1) == {
+        'stations': {'Lawn': 5.0, 'Garden': 5.0, attribution.NO_STATION: 4.0},
+        'programs': {'Morning': 10.0, attribution.NO_PROGRAM: 4.0}}
+    assert consumption.query(DAY2, DAY3) == {'stations': {'Lawn': 6.0}, 'programs': {'Evening': 6.0}}
+    assert consumption.query(DAY1, DAY3)['stations']['Lawn'] == 11.0
+
+
+def test_clock_set_back_adds_to_last_day(tmp_path):
+    consumption = filled(str(tmp_path / 'consumption.json'))
+    consumption.add(DAY1 - 86400 * 10, 1.0, ['Lawn'], [])
+    assert consumption.query(DAY3, DAY3)['stations']['Lawn'] == 7.0
+
+
+def test_totals_are_saved_and_loaded(tmp_path):
+    file_name = str(tmp_path / 'consumption.json')
+    consumption = filled(file_name)
+    consumption.save()
+    assert attribution.Attribution(file_name).query(DAY1, DAY3) == consumption.query(DAY1, DAY3)
+    assert [path.name for path in tmp_path.iterdir()] == ['consumption.json']
+
+
+def test_damaged_file_starts_empty(tmp_path):
+    file_name = str(tmp_path / 'consumption.json')
+    with open(file_name, 'w') as data_file:
+        data_file.write('{"first_day": 7')
+    assert attribution.Attribution(file_name).query(DAY1, DAY3) == {'stations': {}, 'programs': {}}
@@ -0,0 +1,33 @@
+from plugin_modules import load
+
+battery = load('ups_adj', 'battery')
+
+EMPTY = 11.0
+
+
+def test_low_first_reading_does_not_predict_empty_battery():
+    discharge = battery.Discharge(60)
+    discharge.add(0, 10.5)  # sag when the load is switched to battery
+    assert discharge.time_to_empty(EMPTY) is None
+
+
+def test_runtime_is_predicted_after_minimum_samples():
+    discharge = battery.Discharge(60)
+    for index in range(battery.MIN_SAMPLES):
+        assert discharge.time_to_empty(EMPTY) is None
+        discharge.add(index * 5.0, 12.5 - index * 0.01)  # 0.002 V/s
+    assert abs(discharge.time_to_empty(EMPTY) - (12.45 - EMPTY) / 0.002) < 1.0
+
+
+def test_empty_battery_after_minimum_samples():
+    discharge = battery.Discharge(60)
+    for index in range(battery.MIN_SAMPLES):
+        discharge.add(index * 5.0, 10.8)
+    assert discharge.time_to_empty(EMPTY) == 0.0
+
+
+def test_charging_battery_has_no_prediction():
+    discharge = battery.Discharge(60)
+    for index in range(10):
+        discharge.add(index * 5.0, 12.0 + index * 0.01)
+    assert discharge.time_to_empty(EMPTY) is None
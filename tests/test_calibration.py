@@ -0,0 +1,42 @@
+import pytest
+
+from plugin_modules import load
+
+calibration = load('volt_temp_da', 'calibration')
+
+SUPPLY = 5.0
+
+
+def test_voltage_and_lm35_tables():
+    voltage = calibration.compile_table('voltage', [], SUPPLY)
+    assert len(voltage) == 256
+    assert (voltage[0], voltage[255]) == (0.0, SUPPLY)
+    lm35 = calibration.compile_table('lm35', [], SUPPLY)
+    assert lm35[51] == pytest.approx(51 * SUPPLY * 1000 / 255 / 10 + 10)  # same as get_temp before profiles
+
+
+def test_linear_and_polynomial_parameters():
+    linear = calibration.compile_table('linear', calibration.parse_params('2, -1'), SUPPLY)
+    assert linear[255] == pytest.approx(2 * SUPPLY - 1)
+    polynomial = calibration.compile_table('polynomial', calibration.parse_params('1; 0; 1'), SUPPLY)
+    assert polynomial[255] == pytest.approx(1 + SUPPLY ** 2)
+    assert calibration.interpolate(linear, 127.5) == pytest.approx(SUPPLY - 1)
+
+
+def test_wrong_parameters_raise_value_error():
+    with pytest.raises(ValueError):
+        calibration.compile_table('linear', [1.0], SUPPLY)
+    with pytest.raises(ValueError):
+        calibration.compile_table('polynomial', [], SUPPLY)
+    with pytest.raises(ValueError):
+        calibration.compile_table('unknown', [], SUPPLY)
+    with pytest.raises(ValueError):
+        calibration.parse_params('1, x')
+
+
+def test_beta_thermistor_is_25_degrees_at_r25():
+    table = calibration.compile_table('beta', [10000.0, 3950.0, 10000.0], SUPPLY)
+    assert calibration.interpolate(table, 127.5) == pytest.approx(25.0, abs=0.1)  # half of supply, R = R25
+    assert table[0] == table[1] and table[255] == table[254]  # ends of range are clamped
+    assert table[0] > table[255]  # temperature falls with resistance of NTC
+    assert calibration.inverse(table, 25.0) in (127, 128)
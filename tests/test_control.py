@@ -0,0 +1,42 @@
+import pytest
+
+from plugin_modules import load
+
+control = load('volt_temp_da', 'control')
+
+
+def test_pid_output_is_limited_and_integral_does_not_wind_up():
+    pid = control.PID(10.0, 1.0, 0.0, output_min=0.0, output_max=100.0)
+    for _ in range(100):
+        assert pid.update(50.0, 0.0, 1.0) == 100.0  # error 50, output is saturated
+    assert pid.update(50.0, 49.0, 1.0) < 100.0      # integral was stopped at the limit
+
+
+def test_reverse_pid_raises_output_over_setpoint():
+    pid = control.PID(2.0, 0.0, 0.0, reverse=True)
+    assert pid.update(20.0, 30.0, 1.0) == 20.0
+    assert pid.update(20.0, 10.0, 1.0) == 0.0
+
+
+def test_pid_derivative_acts_on_measurement():
+    pid = control.PID(0.0, 0.0, 10.0, output_min=-100.0, output_max=100.0)
+    pid.update(10.0, 5.0, 1.0)
+    assert pid.update(50.0, 5.0, 1.0) == 0.0   # setpoint change does not kick
+    assert pid.update(50.0, 7.0, 1.0) == -20.0
+
+
+def test_bang_bang_hysteresis():
+    controller = control.BangBang(2.0, output_min=10.0, output_max=200.0)
+    assert [controller.update(50.0, value, 1.0) for value in [47.0, 51.0, 52.5, 49.0, 47.5]] == \
+        [200.0, 200.0, 10.0, 10.0, 200.0]
+
+
+def test_loop_statistics():
+    stats = control.LoopStats(0.1)
+    for scheduled, woke, done in [(0.0, 0.001, 0.011), (0.1, 0.102, 0.112), (0.2, 0.2, 0.35)]:
+        stats.add(scheduled, woke, done)
+    result = stats.as_dict()
+    assert result['target_rate'] == 10.0
+    assert result['iterations'] == 3
+    assert result['overruns'] == 1
+    assert result['jitter_ms']['max'] == pytest.approx(2.0)
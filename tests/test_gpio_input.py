@@ -0,0 +1,57 @@
+from plugins.shared import gpio_input
+from plugins.shared.gpio_input import monotonic
+from fakes import FakeGPIO
+
+PIN = 12
+
+
+def make_input(debounce=0.05):
+    gpio = FakeGPIO()
+    gpio.setup(PIN, gpio.IN, pull_up_down=gpio.PUD_UP)
+    edges = []
+    return gpio, gpio_input.DebouncedInput(gpio, PIN, debounce, lambda: edges.append(1)), edges
+
+
+def test_level_is_confirmed_after_debounce_time():
+    gpio, pin, edges = make_input()
+    assert pin.level == 1 and pin.deadline() is None
+    gpio.set_input(PIN, 0)
+    assert edges == [1]
+    assert pin.deadline() is not None
+    assert not pin.update(monotonic())          # not stable yet
+    assert pin.level == 1
+    assert pin.update(monotonic() + 0.1)
+    assert pin.level == 0
+    assert pin.deadline() is None
+
+
+def test_glitch_is_ignored():
+    gpio, pin, edges = make_input()
+    gpio.set_input(PIN, 0)
+    gpio.set_input(PIN, 1)
+    assert len(edges) == 2 and pin.edges == 2
+    assert not pin.update(monotonic() + 0.1)
+    assert pin.level == 1
+
+
+def test_polling_without_edge_detection():
+    class PollingGPIO(FakeGPIO):
+        def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+            raise RuntimeError('Failed to add edge detection')
+
+    gpio = PollingGPIO()
+    gpio.setup(PIN, gpio.IN, pull_up_down=gpio.PUD_UP)
+    pin = gpio_input.DebouncedInput(gpio, PIN, 0.05)
+    assert pin.polling
+    assert pin.deadline() <= monotonic() + gpio_input.POLL_INTERVAL
+    gpio.set_input(PIN, 0)
+    assert pin.update()
+    assert pin.level == 0
+    pin.close()
+
+
+def test_close_removes_edge_detection():
+    gpio, pin, edges = make_input()
+    pin.close()
+    gpio.set_input(PIN, 0)
+    assert edges == []
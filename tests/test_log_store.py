@@ -0,0 +1,45 @@
+import os
+import struct
+
+from plugin_modules import load
+
+log_store = load('volt_temp_da', 'log_store')
+
+RECORD = struct.Struct('<IH')
+
+
+def fill(path, count, **kwargs):
+    store = log_store.LogStore(str(path), RECORD, **kwargs)
+    for index in range(count):
+        store.append((index, index % 100))
+    return store
+
+
+def test_torn_record_is_removed_on_open(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_store, 'SEGMENT_RECORDS', 10)
+    fill(tmp_path, 15).close()
+    segment = os.path.join(str(tmp_path), sorted(os.listdir(str(tmp_path)))[-1])
+    with open(segment, 'ab') as segment_file:
+        segment_file.write(b'\x01\x02\x03')  # incomplete record after power loss
+
+    store = log_store.LogStore(str(tmp_path), RECORD)
+    assert len(store) == 15
+    store.append((15, 15))
+    assert [record[0] for record in store.records(3)] == [15, 14, 13]
+    store.close()
+
+
+def test_retention_deletes_whole_oldest_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(log_store, 'SEGMENT_RECORDS', 10)
+    store = fill(tmp_path, 45, max_records=20)
+    assert len(os.listdir(str(tmp_path))) == 3  # 20 - 29, 30 - 39, 40 - 44
+    assert [record[0] for record in store.records()] == list(range(44, 24, -1))
+    store.close()
+
+
+def test_records_are_newest_first_with_limit(tmp_path):
+    store = fill(tmp_path, 5)
+    assert list(store.records(2)) == [(4, 4), (3, 3)]
+    store.clear()
+    assert list(store.records()) == []
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,54 @@
+import os
+
+from plugin_modules import load
+
+outage_journal = load('ups_adj', 'outage_journal')
+
+
+def test_outages_and_statistics_are_kept(tmp_path):
+    journal = outage_journal.OutageJournal(str(tmp_path), 0)
+    for start, end in [(1000, 1010), (2000, 2030), (4000, 4090)]:
+        journal.start(start, 100)
+        journal.end(end)
+
+    journal = outage_journal.OutageJournal(str(tmp_path), 5000)  # statistics are rebuilt from the file
+    summary = journal.summary()
+    assert summary['count'] == 3
+    assert summary['max_duration'] == 90
+    assert summary['mtbf'] == (990 + 1970) // 2
+    assert summary['closest_to_shutdown'] == 90.0
+    assert [outage['duration'] for outage in journal.recent(2)] == [90, 30]
+
+
+def test_outage_in_progress_is_closed_after_restart(tmp_path):
+    journal = outage_journal.OutageJournal(str(tmp_path), 0)
+    journal.start(1000, 60)
+    journal.shutdown()  # power off without end of outage
+
+    journal = outage_journal.OutageJournal(str(tmp_path), 1500)
+    assert journal.recent(5) == [{'start': 1000, 'end': 1500, 'duration': 500, 'limit': 60,
+                                  'shutdown': True, 'estimated': True}]
+    assert journal.summary()['shutdowns'] == 1
+    assert not os.path.exists(journal.current_name)
+
+
+def test_torn_record_is_removed_on_open(tmp_path):
+    journal = outage_journal.OutageJournal(str(tmp_path), 0)
+    journal.start(1000, 60)
+    journal.end(1010)
+    with open(journal.file_name, 'ab') as journal_file:
+        journal_file.write(b'\x01\x02\x03')  # incomplete record after power loss
+
+    journal = outage_journal.OutageJournal(str(tmp_path), 2000)
+    journal.start(3000, 60)
+    journal.end(3020)
+    assert [outage['start'] for outage in journal.recent(5)] == [3000, 1000]
+    assert os.path.getsize(journal.file_name) == 2 * outage_journal.RECORD.size
+
+
+def test_broken_outage_in_progress_is_ignored(tmp_path):
+    with open(os.path.join(str(tmp_path), 'outage.json'), 'w') as current_file:
+        current_file.write('{"start": 10')  # damaged file
+    journal = outage_journal.OutageJournal(str(tmp_path), 100)
+    assert journal.summary()['count'] == 0
+    assert not os.path.exists(journal.current_name)
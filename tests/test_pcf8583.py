@@ -0,0 +1,73 @@
+import pytest
+
+from plugins.shared import pcf8583
+from fakes import FakePCF8583, FakeSMBus
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_counter():
+    chip = FakePCF8583()
+    clock = Clock()
+    pcf = pcf8583.PCF8583(FakeSMBus({0x50: chip}), clock=clock)
+    pcf.setup()
+    return chip, clock, pcf
+
+
+def test_bcd_round_trip():
+    for value in (0, 7, 99, 100, 12345, 999999):
+        assert pcf8583.bcd_decode(*pcf8583.bcd_encode(value)) == value
+
+
+def test_first_sample_is_empty():
+    chip, clock, pcf = make_counter()
+    chip.add_pulses(10)
+    assert pcf.sample() == (0, 0.0)
+
+
+def test_sample_returns_pulses_and_elapsed_time():
+    chip, clock, pcf = make_counter()
+    pcf.sample()
+    chip.add_pulses(25)
+    clock.now += 2.5
+    assert pcf.sample() == (25, 2.5)
+    clock.now += 0.5
+    chip.add_pulses(5)
+    assert pcf.rate() == 10.0
+
+
+def test_counter_overflow():
+    chip, clock, pcf = make_counter()
+    chip.add_pulses(999990)
+    pcf.sample()
+    chip.add_pulses(20)  # counter goes over 999999 to 10
+    clock.now += 1.0
+    assert pcf.read() == 10
+    assert pcf.sample() == (20, 1.0)
+
+
+def test_restart_forgets_last_sample():
+    chip, clock, pcf = make_counter()
+    pcf.sample()
+    chip.add_pulses(50)
+    pcf.restart()
+    assert pcf.sample() == (0, 0.0)
+
+
+def test_setup_resets_counter():
+    chip, clock, pcf = make_counter()
+    chip.add_pulses(1234)
+    pcf.setup()
+    assert pcf.read() == 0
+
+
+def test_missing_chip_raises_io_error():
+    pcf = pcf8583.PCF8583(FakeSMBus(), address=0x51)
+    with pytest.raises(IOError):
+        pcf.read()
@@ -0,0 +1,72 @@
+from fakes import FakeGPIO
+from plugin_modules import load
+from plugins.shared import gpio_input
+from plugins.shared.gpio_input import monotonic
+
+pressure_state = load('pressure_monitor', 'pressure_state')
+
+PIN = 12
+LIMIT = 30  # seconds to pressurize after master is switched on
+
+
+class Monitor(object):
+    """Pressure switch on fake GPIO (closed to ground = pressure) and state machine ticked by the test."""
+
+    def __init__(self):
+        self.gpio = FakeGPIO()
+        self.gpio.setup(PIN, self.gpio.IN, pull_up_down=self.gpio.PUD_UP)
+        self.input = gpio_input.DebouncedInput(self.gpio, PIN, 0.0)
+        self.machine = pressure_state.PressureMachine()
+        self.start = monotonic()
+
+    def tick(self, seconds, master_on=True, enabled=True, burst=False):
+        now = self.start + seconds
+        self.input.update(now)
+        return self.machine.step(enabled, True, master_on, self.input.level == 0, now, 1000 + seconds, LIMIT, burst)
+
+
+def test_master_on_waits_for_pressure_until_deadline():
+    monitor = Monitor()
+    assert monitor.tick(0, master_on=False)['to'] == pressure_state.MASTER_OFF
+    assert monitor.tick(1)['to'] == pressure_state.WAITING
+    assert monitor.machine.timeout(monitor.start + 1) == LIMIT
+    assert monitor.tick(20) is None
+    assert monitor.machine.timeout(monitor.start + 20) == LIMIT - 19
+
+
+def test_pressure_in_time_is_pressurized():
+    monitor = Monitor()
+    monitor.tick(0)
+    monitor.gpio.set_input(PIN, 0)
+    transition = monitor.tick(5)
+    assert transition['from'] == pressure_state.WAITING and transition['to'] == pressure_state.PRESSURIZED
+    assert monitor.machine.deadline is None
+
+
+def test_no_pressure_trips_and_trips_again_while_master_is_on():
+    monitor = Monitor()
+    monitor.tick(0)
+    transition = monitor.tick(LIMIT)
+    assert transition['to'] == pressure_state.TRIPPED and transition['reason'] == 'timeout'
+    assert monitor.tick(LIMIT + 1) is None
+    assert monitor.tick(2 * LIMIT)['to'] == pressure_state.TRIPPED
+    assert monitor.machine.trips == 2
+    assert monitor.tick(2 * LIMIT + 1, master_on=False)['to'] == pressure_state.MASTER_OFF
+
+
+def test_burst_trips_without_delay():
+    monitor = Monitor()
+    monitor.gpio.set_input(PIN, 0)
+    monitor.tick(1)
+    assert monitor.machine.state == pressure_state.PRESSURIZED
+    transition = monitor.tick(2, burst=True)
+    assert transition['to'] == pressure_state.TRIPPED and transition['reason'] == 'burst'
+
+
+def test_disabled_and_history():
+    monitor = Monitor()
+    monitor.tick(0)
+    assert monitor.tick(1, enabled=False)['to'] == pressure_state.DISABLED
+    history = monitor.machine.as_dict(monitor.start + 1)['history']
+    assert [item['to'] for item in history] == [pressure_state.WAITING, pressure_state.DISABLED]
+    assert history[-1]['time'] == 1001
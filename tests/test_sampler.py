@@ -0,0 +1,30 @@
+import math
+
+import pytest
+
+from fakes import FakePCF8591, FakeSMBus
+from plugin_modules import load
+
+sampler = load('volt_temp_da', 'sampler')
+
+
+def test_block_read_drops_previous_conversion():
+    bus = FakeSMBus({sampler.ADDRESS: FakePCF8591((10, 20, 30, 40))})
+    assert sampler.read_channels(bus) == [10, 20, 30, 40]
+    assert bus.calls == 1  # all inputs in one transfer
+
+
+def test_missing_converter_raises_io_error():
+    with pytest.raises(IOError):
+        sampler.read_channels(FakeSMBus())
+
+
+def test_aggregate_of_samples():
+    aggregate = sampler.Aggregate()
+    assert aggregate.stddev() == 0.0
+    for value in [4, 2, 9, 5]:
+        aggregate.add(value)
+    assert (aggregate.count, aggregate.minimum, aggregate.maximum, aggregate.mean) == (4, 2, 9, 5.0)
+    assert aggregate.stddev() == pytest.approx(math.sqrt((1 + 9 + 16 + 0) / 4.0))
+    aggregate.clear()
+    assert (aggregate.count, aggregate.minimum) == (0, None)
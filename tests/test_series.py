@@ -0,0 +1,42 @@
+import os
+
+from plugin_modules import load
+
+series = load('water_meter', 'series')
+
+START = 1700000000  # whole day in UTC is one raw segment
+
+
+def fill(path, count=250):
+    store = series.TimeSeries(str(path), retention_days=0)
+    for index in range(count):
+        store.add(START + index, 1.0)
+    store.flush()
+    return store
+
+
+def test_torn_append_is_removed_on_open(tmp_path):
+    fill(tmp_path)
+    raw = tmp_path / 'raw'
+    segment = raw / os.listdir(str(raw))[0]
+    with open(str(segment), 'ab') as segment_file:
+        segment_file.write(b'\x01\x02\x03')  # incomplete record after power loss
+    store = series.TimeSeries(str(tmp_path), retention_days=0)
+    store.add(START + 250, 1.0)
+    assert os.path.getsize(str(segment)) % series.RECORD.size == 0
+    assert len(list(store.query('raw', START, START + 1000))) == 251
+
+
+def test_minutes_are_rolled_up(tmp_path):
+    store = fill(tmp_path, 180)
+    minutes = list(store.query('minute', 0, 2 ** 32 - 1))
+    assert sum(value for _, value in minutes) == 180
+    assert all(timestamp % 60 == 0 for timestamp, _ in minutes)
+
+
+def test_clock_step_back_keeps_order(tmp_path):
+    store = fill(tmp_path, 10)
+    store.add(START - 3600, 2.0)
+    store.flush()
+    timestamps = [timestamp for timestamp, _ in store.query('raw', 0, 2 ** 32 - 1)]
+    assert timestamps == sorted(timestamps) and len(timestamps) == 11
@@ -0,0 +1,63 @@
+import threading
+
+import pytest
+
+from plugins.shared import shutdown_hooks
+
+
+@pytest.fixture
+def hooks():
+    names = []
+
+    def register(name, callback, **kwargs):
+        names.append(name)
+        shutdown_hooks.register(name, callback, **kwargs)
+
+    yield register
+    for name in names:
+        shutdown_hooks.unregister(name)
+
+
+def results(report):
+    return dict((hook['name'], hook['result']) for hook in report)
+
+
+def test_hooks_run_by_priority(hooks):
+    calls = []
+    hooks('flush', lambda: calls.append('flush'), priority=50)
+    hooks('stations', lambda: calls.append('stations'), priority=10)
+    assert shutdown_hooks.names() == ['stations', 'flush']
+    report = shutdown_hooks.run(5)
+    assert calls == ['stations', 'flush']
+    assert results(report) == {'stations': 'ok', 'flush': 'ok'}
+    assert all(hook['seconds'] >= 0 for hook in report)
+
+
+def test_error_and_timeout_are_reported(hooks):
+    release = threading.Event()
+
+    def fail():
+        raise IOError('disk error')
+
+    hooks('fail', fail)
+    hooks('slow', release.wait, timeout=0.1)
+    report = shutdown_hooks.run(5)
+    release.set()
+    assert results(report) == {'fail': 'error', 'slow': 'timeout'}
+    assert 'disk error' in [hook for hook in report if hook['name'] == 'fail'][0]['error']
+
+
+def test_global_deadline_skips_later_groups(hooks):
+    release = threading.Event()
+    hooks('slow', release.wait, priority=10, timeout=5)
+    hooks('late', lambda: None, priority=20)
+    report = shutdown_hooks.run(0.1)
+    release.set()
+    assert results(report) == {'slow': 'timeout', 'late': 'skipped'}
+
+
+def test_unregister(hooks):
+    hooks('flush', lambda: None)
+    shutdown_hooks.unregister('flush')
+    assert 'flush' not in shutdown_hooks.names()
+    assert shutdown_hooks.run(1) == []
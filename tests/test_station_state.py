@@ -0,0 +1,55 @@
+import sys
+import types
+
+import pytest
+
+from plugins.shared import station_state
+
+
+class Station(object):
+    def __init__(self, index, name, active=False, is_master=False):
+        self.index = index
+        self.name = name
+        self.active = active
+        self.is_master = is_master
+
+
+class Stations(object):
+    """Station list of OSPy with number of scans."""
+
+    def __init__(self, stations):
+        self.stations = stations
+        self.scans = 0
+
+    def get(self):
+        self.scans += 1
+        return iter(self.stations)
+
+
+@pytest.fixture
+def stations(monkeypatch):
+    result = Stations([Station(0, 'Master', is_master=True), Station(1, 'Lawn'), Station(2, 'Garden')])
+    module = types.ModuleType('ospy.stations')
+    module.stations = result
+    monkeypatch.setitem(sys.modules, 'ospy', types.ModuleType('ospy'))
+    monkeypatch.setitem(sys.modules, 'ospy.stations', module)
+    return result
+
+
+def test_questions_are_answered_from_one_scan(stations):
+    stations.stations[0].active = stations.stations[2].active = True
+    active = station_state.ActiveStations(max_age=1000.0)
+    assert active.any_on() and active.master_on() and active.is_on(2) and not active.is_on(1)
+    assert active.names() == ('Garden',)
+    assert stations.scans == 1
+
+
+def test_invalidate_scans_again(stations):
+    active = station_state.ActiveStations(max_age=1000.0)
+    assert not active.any_on()
+    stations.stations[1].active = True
+    assert not active.any_on()  # cached
+    active.invalidate()
+    assert active.any_on() and not active.master_on()
+    assert active.names() == ('Lawn',)
+    assert stations.scans == 2
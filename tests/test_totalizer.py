@@ -0,0 +1,56 @@
+from plugin_modules import load
+
+totalizer = load('water_meter', 'totalizer')
+
+
+def saved_total(file_name):
+    journal = totalizer.Totalizer(file_name, slots=4)
+    journal.close()
+    return journal.total
+
+
+def test_new_journal_starts_from_initial_total(tmp_path):
+    journal = totalizer.Totalizer(str(tmp_path / 'summary.bin'), initial=12.5, slots=4)
+    assert not journal.recovered
+    assert journal.total == 12.5
+    journal.close()
+
+
+def test_total_is_recovered_after_ring_wraps(tmp_path):
+    file_name = str(tmp_path / 'summary.bin')
+    journal = totalizer.Totalizer(file_name, slots=4)
+    for total in range(1, 11):
+        journal.set(total)
+    journal.close()
+
+    journal = totalizer.Totalizer(file_name, initial=99.0, slots=4)
+    assert journal.recovered
+    assert (journal.sequence, journal.total) == (10, 10.0)
+    journal.set(11)  # next record overwrites the oldest slot
+    journal.close()
+    assert saved_total(file_name) == 11.0
+
+
+def test_record_with_wrong_checksum_falls_back_to_previous(tmp_path):
+    file_name = str(tmp_path / 'summary.bin')
+    journal = totalizer.Totalizer(file_name, slots=4)
+    journal.set(5)
+    journal.set(6)
+    journal.close()
+    with open(file_name, 'r+b') as journal_file:
+        journal_file.seek(totalizer.RECORD_SIZE + 10)  # second record is torn by power loss
+        journal_file.write(b'\xff\xff')
+
+    journal = totalizer.Totalizer(file_name, slots=4)
+    assert (journal.sequence, journal.total) == (1, 5.0)
+    journal.close()
+
+
+def test_add_writes_journal_by_volume(tmp_path):
+    file_name = str(tmp_path / 'summary.bin')
+    journal = totalizer.Totalizer(file_name, slots=4, flush_interval=0, flush_volume=10.0)
+    journal.add(4.0)
+    assert saved_total(file_name) == 0.0  # under flush volume, not written yet
+    journal.add(6.0)
+    assert saved_total(file_name) == 10.0
+    journal.close()
@@ -0,0 +1,38 @@
+from plugin_modules import load
+
+wind_engine = load('wind_monitor', 'wind_engine')
+
+TRIP = 10.0
+RESUME = 5.0
+
+
+def run(engine, speeds):
+    return [engine.add(speed, TRIP, RESUME) for speed in speeds]
+
+
+def test_single_sample_does_not_trip():
+    engine = wind_engine.WindEngine()
+    assert run(engine, [25.0, 0.0, 0.0]) == [None, None, None]  # gust of full window is 8.3
+    assert not engine.tripped
+
+
+def test_gust_trips_and_sustained_calm_resumes():
+    engine = wind_engine.WindEngine()
+    assert run(engine, [12.0] * 3)[-1] == 'trip'
+    transitions = run(engine, [2.0] * (wind_engine.SUSTAINED_SAMPLES + 10))
+    assert transitions.count('resume') == 1
+    assert not engine.tripped
+
+
+def test_gust_during_calm_delays_resume():
+    engine = wind_engine.WindEngine()
+    run(engine, [12.0] * 3)
+    run(engine, [2.0] * (wind_engine.SUSTAINED_SAMPLES - 10))
+    run(engine, [20.0] * 3)  # new gust restarts the calm period
+    assert 'resume' not in run(engine, [2.0] * (wind_engine.SUSTAINED_SAMPLES - 10))
+    assert engine.tripped
+
+
+def test_peak_is_maximum_gust_of_long_window():
+    peak = wind_engine.RingPeak(3)
+    assert [peak.add(value) for value in [1.0, 5.0, 2.0, 3.0, 1.0, 0.5]] == [1.0, 5.0, 5.0, 5.0, 3.0, 3.0]
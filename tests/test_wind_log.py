@@ -0,0 +1,50 @@
+from plugin_modules import load
+
+wind_log = load('wind_monitor', 'wind_log')
+
+START = 1700000000
+
+
+def fill(file_name, capacity, count, first=0):
+    log = wind_log.WindLog(file_name, capacity)
+    for index in range(first, first + count):
+        log.add(START + index, index / 100.0, 0, 0, 0)
+    log.flush()
+    return log
+
+
+def timestamps(log, **kwargs):
+    return [record['timestamp'] - START for record in log.records(**kwargs)]
+
+
+def test_ring_keeps_newest_records(tmp_path):
+    log = fill(str(tmp_path / 'wind.bin'), 10, 25)
+    assert timestamps(log) == list(range(24, 14, -1))
+    assert timestamps(log, start=START + 18, end=START + 20, newest_first=False) == [18, 19, 20]
+    log.close()
+
+
+def test_capacity_change_copies_newest_records(tmp_path, monkeypatch):
+    monkeypatch.setattr(wind_log, 'CHUNK', 4)
+    file_name = str(tmp_path / 'wind.bin')
+    fill(file_name, 10, 25).close()  # ring is wrapped
+
+    log = wind_log.WindLog(file_name, 7)
+    assert timestamps(log, newest_first=False) == list(range(18, 25))
+    log.close()
+
+    log = wind_log.WindLog(file_name, 20)
+    assert timestamps(log, newest_first=False) == list(range(18, 25))
+    log.add(START + 25, 0, 0, 0, 0)
+    assert timestamps(log)[:2] == [25, 24]
+    log.close()
+    assert [path.name for path in tmp_path.iterdir()] == ['wind.bin']
+
+
+def test_clock_set_back_keeps_time_order(tmp_path):
+    log = fill(str(tmp_path / 'wind.bin'), 10, 3)
+    log.add(START - 100, 1.0, 0, 0, 0)
+    log.close()
+    log = wind_log.WindLog(str(tmp_path / 'wind.bin'), 10)
+    assert timestamps(log) == [2, 2, 1, 0]
+    log.close()